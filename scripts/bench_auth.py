@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+bench_auth.py — login throughput and head-of-line blocking: inline bcrypt vs the bounded pool
+- Runs in-process, no Postgres: a "login" is one bcrypt verify, as in POST /auth/login
+- Requests go through a 40-thread pool, the size of Starlette's default threadpool for sync routes
+- inline: the old pwd_ctx.verify on the request thread
+- pool:   services/auth/app/security/passwords.py as shipped (PASSWORD_WORKERS processes,
+          PASSWORD_QUEUE_LIMIT admitted, the rest refused with PasswordPoolBusy -> 503)
+- While the burst runs, a health probe goes through the same threadpool every 50 ms; its wait is
+  what refresh and health checks see
+- Also prints verifies/sec on one core per BCRYPT_ROUNDS, to pick a cost
+"""
+
+import argparse, os, statistics, sys, threading, time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "services", "auth"))
+
+import bcrypt
+
+def per_core(rounds_list, seconds: float):
+    print("\n=== verifies/sec on one core by cost ===")
+    for rounds in rounds_list:
+        h = bcrypt.hashpw(b"P@ssw0rd!", bcrypt.gensalt(rounds))
+        n, t0 = 0, time.perf_counter()
+        while time.perf_counter() - t0 < seconds:
+            bcrypt.checkpw(b"P@ssw0rd!", h)
+            n += 1
+        rate = n / (time.perf_counter() - t0)
+        print(f"  rounds {rounds:2d}: {rate:7.1f}/s  ({1000 / rate:6.1f} ms per login)")
+
+def run(mode: str, logins: int, rounds: int, workers: int, limit: int):
+    from app.core.config import settings
+    from app.security import passwords
+    settings.BCRYPT_ROUNDS, settings.PASSWORD_WORKERS, settings.PASSWORD_QUEUE_LIMIT = rounds, workers, limit
+    stored = bcrypt.hashpw(b"P@ssw0rd!", bcrypt.gensalt(rounds)).decode()
+
+    if mode == "inline":
+        def login():
+            return bcrypt.checkpw(b"P@ssw0rd!", stored.encode())
+    else:
+        passwords.start()
+        def login():
+            try:
+                return passwords.verify_password("P@ssw0rd!", stored)
+            except passwords.PasswordPoolBusy:
+                return None
+
+    threadpool = ThreadPoolExecutor(max_workers=40)
+    probe_waits, done = [], threading.Event()
+
+    def probe():
+        while not done.is_set():
+            t0 = time.perf_counter()
+            threadpool.submit(lambda: None).result()
+            probe_waits.append(time.perf_counter() - t0)
+            time.sleep(0.05)
+
+    prober = threading.Thread(target=probe)
+    started = time.perf_counter()
+    prober.start()
+    results = [f.result() for f in [threadpool.submit(login) for _ in range(logins)]]
+    wall = time.perf_counter() - started
+    done.set()
+    prober.join()
+    threadpool.shutdown()
+    if mode == "pool":
+        passwords.close()
+
+    ok = sum(1 for r in results if r)
+    refused = sum(1 for r in results if r is None)
+    cores = workers if mode == "pool" else 1  # inline bcrypt releases the GIL, but shares the API's CPUs
+    print(f"\n=== {mode} (rounds {rounds}) ===")
+    print(f"  logins verified : {ok}/{logins} in {wall:.2f}s -> {ok / wall:,.1f}/s ({ok / wall / cores:,.1f}/s per core)")
+    print(f"  refused (503)   : {refused}")
+    print(f"  health probe    : p50 {statistics.median(probe_waits) * 1e3:.1f} ms  max {max(probe_waits) * 1e3:.1f} ms")
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--logins", type=int, default=400, help="Concurrent login attempts in the burst")
+    ap.add_argument("--rounds", type=int, default=12, help="bcrypt cost for the burst")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="PASSWORD_WORKERS")
+    ap.add_argument("--limit", type=int, default=min(32, 2 * (os.cpu_count() or 1)), help="PASSWORD_QUEUE_LIMIT")
+    ap.add_argument("--costs", type=int, nargs="*", default=[10, 11, 12, 13])
+    ap.add_argument("--modes", nargs="*", default=["inline", "pool"], choices=["inline", "pool"])
+    args = ap.parse_args()
+    per_core(args.costs, 1.0)
+    for mode in args.modes:
+        run(mode, args.logins, args.rounds, args.workers, args.limit)
+
+if __name__ == "__main__":
+    main()
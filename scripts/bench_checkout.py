@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+bench_checkout.py — compare synchronous and async ("accepted") checkout against a running stack
+- Seeds a benchmark product with plenty of stock
+- N customer threads repeatedly add to cart and check out
+- sync:  latency of POST /order/v1/orders/checkout (reserve + persist + ship + emit)
+- async: latency until 202 Accepted, then end-to-end latency until the order leaves PENDING
+Assumes `make up` and `make seed` have been run.
+"""
+
+import argparse, os, threading, time
+from typing import Dict, List
+import requests
+
+ADDRESS = {"address_line1": "1 Bench Street", "address_line2": "", "city": "Dublin", "country": "IE", "postcode": "D01XYZ"}
+
+def pct(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+def login(base: str, email: str, password: str, role: str = "customer") -> Dict[str, str]:
+    requests.post(f"{base}/auth/register", json={"email": email, "password": password, "role": role}, timeout=10)
+    r = requests.post(f"{base}/auth/login", json={"email": email, "password": password}, timeout=10)
+    r.raise_for_status()
+    return {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+def seed_product(base: str, stock: int) -> int:
+    admin = login(base, "bench-admin@example.com", "P@ssw0rd!", role="admin")
+    requests.post(f"{base}/catalog/v1/products/", headers=admin, timeout=10, json={
+        "title": "Bench Widget", "description": "", "price_cents": 999, "currency": "USD", "sku": "BENCH-001", "active": True,
+    })
+    found = requests.get(f"{base}/catalog/v1/products/", params={"q": "Bench Widget", "limit": 1}, timeout=10).json()
+    pid = found[0]["id"]
+    hdrs = dict(admin, **{"X-Internal-Key": os.getenv("SVC_INTERNAL_KEY", "devkey")})
+    requests.post(f"{base}/catalog/v1/inventory/restock", headers=hdrs, json={"items": [{"product_id": pid, "qty": stock}]}, timeout=10)
+    return pid
+
+def run_mode(base: str, mode: str, pid: int, users: int, per_user: int) -> Dict[str, List[float]]:
+    accept, complete, errors = [], [], []
+    lock = threading.Lock()
+
+    def worker(i: int):
+        hdrs = login(base, f"bench-{i}@example.com", "P@ssw0rd!")
+        for _ in range(per_user):
+            requests.post(f"{base}/cart/v1/cart/items", headers=hdrs, json={"product_id": pid, "qty": 1}, timeout=10)
+            t0 = time.perf_counter()
+            r = requests.post(f"{base}/order/v1/orders/checkout", params={"mode": mode}, headers=hdrs, json=ADDRESS, timeout=30)
+            t1 = time.perf_counter()
+            if r.status_code not in (200, 202):
+                with lock: errors.append(r.status_code)
+                continue
+            done = t1
+            if r.status_code == 202:
+                status_url = r.json()["status_url"]
+                while True:
+                    s = requests.get(f"{base}{status_url}", headers=hdrs, timeout=10).json()
+                    if s.get("status") != "PENDING":
+                        break
+                    time.sleep(0.02)
+                done = time.perf_counter()
+            with lock:
+                accept.append(t1 - t0)
+                complete.append(done - t0)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(users)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    wall = time.perf_counter() - started
+
+    print(f"\n=== {mode} ===")
+    print(f"  checkouts accepted : {len(accept)} in {wall:.2f}s -> {len(accept) / wall:.1f}/s (errors: {len(errors)})")
+    print(f"  accept latency     : p50 {pct(accept, 50) * 1000:.1f} ms  p95 {pct(accept, 95) * 1000:.1f} ms")
+    print(f"  completion latency : p50 {pct(complete, 50) * 1000:.1f} ms  p95 {pct(complete, 95) * 1000:.1f} ms")
+    return {"accept": accept, "complete": complete}
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--base-url", default="http://localhost")
+    ap.add_argument("--users", type=int, default=20, help="Concurrent customers")
+    ap.add_argument("--orders", type=int, default=10, help="Checkouts per customer")
+    ap.add_argument("--modes", nargs="*", default=["sync", "async"], choices=["sync", "async"])
+    args = ap.parse_args()
+
+    pid = seed_product(args.base_url, stock=args.users * args.orders * len(args.modes) * 2)
+    for mode in args.modes:
+        run_mode(args.base_url, mode, pid, args.users, args.orders)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+bench_email.py — notification email throughput: connection-per-email vs the pooled delivery engine
+- Runs against a local aiosmtpd stand-in (pip install aiosmtpd), no MailHog needed
+- The stand-in charges --setup-ms per new session (EHLO) and --data-ms per message
+- per-email: the old send_email(), one smtplib.SMTP connection per email on the consumer thread
+- pooled:    services/notifications/app/services/mailer.py as shipped (SMTP_WORKERS persistent connections)
+"""
+
+import argparse, asyncio, os, smtplib, socket, sys, time
+from email.mime.text import MIMEText
+from aiosmtpd.controller import Controller
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "services", "notifications"))
+
+class StandInHandler:
+    def __init__(self, setup_ms: float, data_ms: float):
+        self.setup, self.data = setup_ms / 1000, data_ms / 1000
+        self.messages = 0
+        self.sessions = 0
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        self.sessions += 1
+        await asyncio.sleep(self.setup)  # TCP + TLS + AUTH on a real provider
+        session.host_name = hostname
+        return responses
+
+    async def handle_DATA(self, server, session, envelope):
+        await asyncio.sleep(self.data)
+        self.messages += 1
+        return "250 Message accepted"
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def run(mode: str, emails: int, workers: int, handler: StandInHandler, port: int):
+    from app.core.config import settings
+    settings.SMTP_HOST, settings.SMTP_PORT = "127.0.0.1", port
+    settings.SMTP_WORKERS, settings.SMTP_PROVIDER_RATES = workers, "*=0"
+    handler.messages = handler.sessions = 0
+    started = time.perf_counter()
+    if mode == "per-email":
+        for i in range(emails):
+            msg = MIMEText(f"Payment for order {i} succeeded.")
+            msg["Subject"], msg["From"], msg["To"] = "Payment received", settings.FROM_EMAIL, f"user{i}@example.com"
+            with smtplib.SMTP(settings.SMTP_HOST, settings.SMTP_PORT) as s:
+                s.sendmail(settings.FROM_EMAIL, [msg["To"]], msg.as_string())
+    else:
+        from app.services import mailer
+        futures = [mailer.submit(f"user{i}@example.com", "Payment received", f"Payment for order {i} succeeded.")
+                   for i in range(emails)]
+        for f in futures:
+            f.result()
+        mailer.close()
+    wall = time.perf_counter() - started
+    print(f"\n=== {mode}{'' if mode == 'per-email' else f' ({workers} workers)'} ===")
+    print(f"  emails delivered : {handler.messages}/{emails} in {wall:.2f}s -> {handler.messages / wall:,.0f}/s")
+    print(f"  SMTP sessions    : {handler.sessions}")
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--emails", type=int, default=1000)
+    ap.add_argument("--workers", type=int, default=8, help="SMTP_WORKERS for the pooled engine")
+    ap.add_argument("--setup-ms", type=float, default=20.0, help="Simulated session setup per connection")
+    ap.add_argument("--data-ms", type=float, default=2.0, help="Simulated server time per message")
+    ap.add_argument("--modes", nargs="*", default=["per-email", "pooled"], choices=["per-email", "pooled"])
+    args = ap.parse_args()
+    handler = StandInHandler(args.setup_ms, args.data_ms)
+    port = free_port()
+    ctl = Controller(handler, hostname="127.0.0.1", port=port)
+    ctl.start()
+    try:
+        for mode in args.modes:
+            run(mode, args.emails, args.workers, handler, port)
+    finally:
+        ctl.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+bench_producer.py — event publish throughput: flush-per-event vs the batched async producer
+- Runs entirely in-process against an in-memory broker stand-in (no Kafka needed)
+- The stand-in batches like KafkaProducer (linger_ms / batch_size / compression) and charges
+  one simulated broker round trip (--rtt-ms) per produce request
+- flush: the old send() + flush(5) per event
+- async: services/payment/app/kafka/producer.py as shipped, flushed once at the end
+"""
+
+import argparse, gzip, os, statistics, sys, threading, time
+from typing import List
+from kafka.future import Future
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "services", "payment"))
+
+class StandInBroker:
+    def __init__(self, rtt_ms: float):
+        self.rtt = rtt_ms / 1000
+        self.requests = 0
+        self.records = 0
+        self.wire_bytes = 0
+
+class StandInProducer:
+    """Just enough of KafkaProducer: an accumulator drained by one sender thread."""
+
+    def __init__(self, broker: StandInBroker, linger_ms: int = 0, batch_size: int = 16384,
+                 compression_type: str | None = None, value_serializer=None, key_serializer=None, **_):
+        self.broker = broker
+        self.linger = linger_ms / 1000
+        self.batch_size = batch_size
+        self.compression = compression_type
+        self.value_serializer = value_serializer or (lambda v: v)
+        self.key_serializer = key_serializer or (lambda v: v)
+        self._cv = threading.Condition()
+        self._batch: list = []
+        self._bytes = 0
+        self._first = 0.0
+        self._in_flight = 0
+        self._flushing = 0
+        self._closed = False
+        threading.Thread(target=self._sender, daemon=True).start()
+
+    def send(self, topic, key=None, value=None):
+        k, v = self.key_serializer(key), self.value_serializer(value)
+        fut = Future()
+        with self._cv:
+            if not self._batch:
+                self._first = time.perf_counter()
+            self._batch.append((fut, (k or b"") + v))
+            self._bytes += len(v)
+            self._cv.notify_all()
+        return fut
+
+    def _ready(self) -> bool:
+        if not self._batch:
+            return False
+        return self._flushing or self._closed or self._bytes >= self.batch_size or \
+            time.perf_counter() - self._first >= self.linger
+
+    def _sender(self):
+        while True:
+            with self._cv:
+                while not self._ready():
+                    if self._closed and not self._batch:
+                        return
+                    wait = self.linger - (time.perf_counter() - self._first) if self._batch else None
+                    self._cv.wait(wait)
+                batch, self._batch, self._bytes = self._batch, [], 0
+                self._in_flight = len(batch)
+            payload = b"".join(rec for _, rec in batch)
+            if self.compression == "gzip":
+                payload = gzip.compress(payload, compresslevel=1)
+            time.sleep(self.broker.rtt)  # one produce request round trip
+            self.broker.requests += 1
+            self.broker.records += len(batch)
+            self.broker.wire_bytes += len(payload)
+            for fut, _ in batch:
+                fut.success(None)
+            with self._cv:
+                self._in_flight = 0
+                self._cv.notify_all()
+
+    def flush(self, timeout=None):
+        with self._cv:
+            self._flushing += 1
+            self._cv.notify_all()
+            self._cv.wait_for(lambda: not self._batch and not self._in_flight, timeout)
+            self._flushing -= 1
+
+    def close(self, timeout=None):
+        self.flush(timeout)
+        with self._cv:
+            self._closed = True
+            self._cv.notify_all()
+
+def event(i: int) -> dict:
+    return {"type": "payment.succeeded", "order_id": i, "user_email": f"user{i % 500}@example.com",
+            "amount_cents": 2599, "currency": "USD"}
+
+def run(mode: str, threads: int, per_thread: int, rtt_ms: float):
+    import json
+    broker = StandInBroker(rtt_ms)
+    latencies: List[float] = []
+    lock = threading.Lock()
+
+    if mode == "flush":
+        prod = StandInProducer(broker, linger_ms=5, value_serializer=lambda v: json.dumps(v).encode("utf-8"),
+                               key_serializer=lambda v: v.encode("utf-8"))
+        def publish(i: int):
+            prod.send("payment.events", key=str(i), value=event(i))
+            prod.flush(5)
+        def finish():
+            prod.close()
+    else:
+        from app.kafka import producer
+        producer.KafkaProducer = lambda **cfg: StandInProducer(broker, **cfg)
+        def publish(i: int):
+            producer.send("payment.events", key=str(i), value=event(i))
+        def finish():
+            producer.close()
+
+    def worker(t: int):
+        mine = []
+        for n in range(per_thread):
+            t0 = time.perf_counter()
+            publish(t * per_thread + n)
+            mine.append(time.perf_counter() - t0)
+        with lock:
+            latencies.extend(mine)
+
+    started = time.perf_counter()
+    workers = [threading.Thread(target=worker, args=(t,)) for t in range(threads)]
+    for w in workers: w.start()
+    for w in workers: w.join()
+    finish()
+    wall = time.perf_counter() - started
+
+    total = threads * per_thread
+    print(f"\n=== {mode} ===")
+    print(f"  events delivered : {broker.records}/{total} in {wall:.2f}s -> {broker.records / wall:,.0f}/s")
+    print(f"  produce requests : {broker.requests} ({broker.records / max(1, broker.requests):.1f} events/request)")
+    print(f"  bytes on the wire: {broker.wire_bytes:,}")
+    print(f"  caller latency   : p50 {statistics.median(latencies) * 1e6:.0f} us  max {max(latencies) * 1e3:.1f} ms")
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--threads", type=int, default=8, help="Concurrent request threads publishing")
+    ap.add_argument("--events", type=int, default=500, help="Events per thread")
+    ap.add_argument("--rtt-ms", type=float, default=2.0, help="Simulated broker round trip per produce request")
+    ap.add_argument("--modes", nargs="*", default=["flush", "async"], choices=["flush", "async"])
+    args = ap.parse_args()
+    for mode in args.modes:
+        run(mode, args.threads, args.events, args.rtt_ms)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+bench_rates.py — shipping rate-quote throughput, in-process (no stack needed)
+- engine: RateTable.quote() on random destinations and weights from the shipped table
+- http:   POST /shipping/v1/rates/quote through FastAPI's TestClient, --batch baskets per request
+Tables come from services/shipping/app/data/rates.json unless RATE_TABLES_PATH is set.
+"""
+
+import argparse, os, random, statistics, sys, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "services", "shipping"))
+
+DESTS = [("US", "10001"), ("US", "94105"), ("US", "99501"), ("US", "96813"), ("CA", "M5V 2T6"),
+         ("GB", "SW1A 1AA"), ("GB", "BT1 1AA"), ("IE", "D01 F5P2"), ("DE", "10115"), ("AU", "2000"), ("BR", "01000")]
+
+def destinations(n: int, seed: int = 7):
+    rnd = random.Random(seed)
+    return [(*rnd.choice(DESTS), rnd.choice((120, 480, 900, 1800, 4200, 9000, 26000, 48000))) for _ in range(n)]
+
+def bench_engine(n: int, rounds: int):
+    from app.services import rates
+    table = rates.current()
+    work = destinations(n)
+    rates_per_round = []
+    for _ in range(rounds):
+        t0 = time.perf_counter()
+        for country, postcode, weight in work:
+            table.quote(country, postcode, weight)
+        rates_per_round.append(n / (time.perf_counter() - t0))
+    best = max(rates_per_round)
+    print("\n=== engine ===")
+    print(f"  table version : {table.version} ({len(table.carriers)} carriers, {len(table.zones)} zones, {len(table.bands)} bands)")
+    print(f"  quotes/sec    : median {statistics.median(rates_per_round):,.0f}  best {best:,.0f}")
+    print(f"  per quote     : {1e6 / best:.2f} us")
+
+def bench_http(n: int, batch: int):
+    from fastapi.testclient import TestClient
+    from app.main import app
+    client = TestClient(app)
+    work = destinations(n)
+    latencies = []
+    t0 = time.perf_counter()
+    for i in range(0, n, batch):
+        body = {"quotes": [{"country": c, "postcode": p, "items": [{"weight_g": w}]} for c, p, w in work[i:i + batch]]}
+        s = time.perf_counter()
+        r = client.post("/shipping/v1/rates/quote", json=body)
+        r.raise_for_status()
+        latencies.append(time.perf_counter() - s)
+    wall = time.perf_counter() - t0
+    print(f"\n=== http (batch={batch}) ===")
+    print(f"  quotes/sec    : {n / wall:,.0f} ({len(latencies)} requests)")
+    print(f"  request p50   : {statistics.median(latencies) * 1e3:.2f} ms  max {max(latencies) * 1e3:.2f} ms")
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--quotes", type=int, default=200_000, help="Quotes per engine round")
+    ap.add_argument("--rounds", type=int, default=5)
+    ap.add_argument("--http-quotes", type=int, default=20_000, help="Quotes sent through the HTTP endpoint")
+    ap.add_argument("--batch", type=int, default=500, help="Baskets per HTTP request")
+    ap.add_argument("--modes", nargs="*", default=["engine", "http"], choices=["engine", "http"])
+    args = ap.parse_args()
+    if "engine" in args.modes:
+        bench_engine(args.quotes, args.rounds)
+    if "http" in args.modes:
+        bench_http(args.http_quotes, args.batch)
+
+if __name__ == "__main__":
+    main()
@@ -303,7 +303,7 @@ $status      = $null
 for ($i=0; $i -lt 20; $i++) {
   Start-Sleep -Milliseconds 500
   $q = Invoke-Api -Method GET -Url "$ShippingUrl/v1/shipments?order_id=$order_id" -ExpectedStatus @(200) -Quiet
-  $rows = $q.data
+  $rows = $q.data.items
   if ($null -eq $rows) { continue }
   if ($rows -isnot [System.Collections.IEnumerable] -or $rows -is [string]) { $rows = @($rows) }
   if ($rows.Count -gt 0) {
@@ -329,7 +329,7 @@ if ($shipment_id -and $status -eq "READY_TO_SHIP") {
 Start-Sleep -Seconds 1
 Show-Step "Order: check status"
 if ($order_id) {
-  Invoke-Api -Method GET -Url "$OrderUrl/v1/orders/$order_id" -ExpectedStatus @(200,404) | Out-Null
+  Invoke-Api -Method GET -Url "$OrderUrl/v1/orders/$order_id" -Headers $cust_hdrs -ExpectedStatus @(200,404) | Out-Null
 } else {
   Write-Host "Skipping order status check - no order ID"
 }
@@ -274,7 +274,7 @@ class DemoRunner:
                 expected_status=[200],
                 quiet=True,
             )
-            rows = q.get("data") or []
+            rows = (q.get("data") or {}).get("items") or []
             if rows:
                 shipment_id = rows[0]["id"]
                 status = rows[0]["status"]
@@ -299,7 +299,7 @@ class DemoRunner:
         time.sleep(1)
         self.show_step("Order: check status")
         if order_id:
-            self.call_api("GET", f"{self.order_url}/v1/orders/{order_id}", expected_status=[200, 404])
+            self.call_api("GET", f"{self.order_url}/v1/orders/{order_id}", headers=cust_hdrs, expected_status=[200, 404])
         else:
             print("Skipping order status check - no order ID")
 
@@ -34,6 +34,7 @@ Write-Host ">>> Running Alembic migrations"
 Set-Location "services/auth"        ; alembic upgrade head ; Set-Location $Root
 Set-Location "services/catalog"     ; alembic upgrade head ; Set-Location $Root
 Set-Location "services/order"       ; alembic upgrade head ; Set-Location $Root
+Set-Location "services/payment"     ; alembic upgrade head ; Set-Location $Root
 # NEW: Shipping migrations
 Set-Location "services/shipping"    ; alembic upgrade head ; Set-Location $Root
 
@@ -5,7 +5,7 @@ seed.py — run Alembic migrations for local dev
 import argparse, os, re, subprocess, sys
 from pathlib import Path
 
-SERVICES = ["auth", "catalog", "order", "shipping"]  # extend here if needed
+SERVICES = ["auth", "catalog", "order", "payment", "shipping"]  # extend here if needed
 
 def read_env_value(dotenv: Path, key: str) -> str | None:
     if not dotenv.exists():
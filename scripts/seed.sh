@@ -3,7 +3,7 @@
 
 set -e
 
-SERVICES=("auth" "catalog" "order" "shipping")
+SERVICES=("auth" "catalog" "order" "payment" "shipping")
 
 read_env_value() {
     local dotenv="$1"
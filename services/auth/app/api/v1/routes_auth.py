@@ -1,3 +1,4 @@
+import logging
 from typing import Any
 
 from fastapi import APIRouter, Depends, HTTPException, status
@@ -11,9 +12,12 @@ from app.api.v1.schemas import (
     RefreshRequest,
 )
 from app.db.models import User, RefreshToken
+from app.security.passwords import REHASHED
 from app.security.utils import (
     hash_password,
     verify_password,
+    needs_rehash,
+    PasswordPoolBusy,
     create_access_token,
     create_refresh_token,
     token_sha256,
@@ -21,18 +25,30 @@ from app.security.utils import (
     decode_token,
 )
 
+log = logging.getLogger(__name__)
+
 router = APIRouter()  # main.py mounts at /auth
 
 
+def _busy() -> HTTPException:
+    # The password pool is full: refuse now rather than queue behind the burst
+    return HTTPException(status_code=503, detail="Too many sign-ins, retry shortly", headers={"Retry-After": "1"})
+
+
 @router.post("/register", status_code=status.HTTP_201_CREATED)
 def register(payload: RegisterPayload, db: Session = Depends(get_db)) -> Any:
     # Prevent duplicate email
     if db.query(User).filter(User.email == str(payload.email)).first():
         raise HTTPException(status_code=409, detail="Email already registered")
 
+    try:
+        password_hash = hash_password(payload.password)
+    except PasswordPoolBusy:
+        raise _busy()
+
     user = User(
         email=str(payload.email),
-        password_hash=hash_password(payload.password),
+        password_hash=password_hash,
         role=payload.role or "customer",
         created_at=now_utc(),
         updated_at=now_utc(),
@@ -46,8 +62,20 @@ def register(payload: RegisterPayload, db: Session = Depends(get_db)) -> Any:
 @router.post("/login", response_model=TokenPair)
 def login(payload: LoginPayload, db: Session = Depends(get_db)) -> TokenPair:
     user = db.query(User).filter(User.email == str(payload.email)).first()
-    if not user or not verify_password(payload.password, user.password_hash):
-        raise HTTPException(status_code=401, detail="Invalid credentials")
+    try:
+        if not user or not verify_password(payload.password, user.password_hash):
+            raise HTTPException(status_code=401, detail="Invalid credentials")
+    except PasswordPoolBusy:
+        raise _busy()
+
+    if needs_rehash(user.password_hash):
+        # BCRYPT_ROUNDS changed since this hash was made: upgrade it while we have the password
+        try:
+            user.password_hash = hash_password(payload.password)
+            user.updated_at = now_utc()
+            REHASHED.inc()
+        except PasswordPoolBusy:
+            log.info("rehash of user %s deferred; password pool busy", user.id)
 
     access, _ = create_access_token(user.email, user.role)
     refresh, jti, exp = create_refresh_token(user.email)
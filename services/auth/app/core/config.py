@@ -6,4 +6,10 @@ class Settings(BaseModel):
     JWT_ALGORITHM: str = os.getenv('JWT_ALGORITHM','HS256')
     ACCESS_TOKEN_EXPIRES_SECONDS: int = int(os.getenv('ACCESS_TOKEN_EXPIRES_SECONDS','900'))
     REFRESH_TOKEN_EXPIRES_DAYS: int = int(os.getenv('REFRESH_TOKEN_EXPIRES_DAYS','30'))
+    # Password hashing (app/security/passwords.py). Keep PASSWORD_QUEUE_LIMIT well below the
+    # request threadpool (40) so a login burst can't take every thread; the default caps at 32.
+    BCRYPT_ROUNDS: int = int(os.getenv('BCRYPT_ROUNDS','12'))
+    PASSWORD_WORKERS: int = int(os.getenv('PASSWORD_WORKERS', str(os.cpu_count() or 1)))
+    PASSWORD_QUEUE_LIMIT: int = int(os.getenv('PASSWORD_QUEUE_LIMIT', str(min(32, 2 * (os.cpu_count() or 1)))))
+    PASSWORD_TIMEOUT_SECONDS: float = float(os.getenv('PASSWORD_TIMEOUT_SECONDS','5'))
 settings = Settings()
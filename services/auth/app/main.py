@@ -2,6 +2,7 @@
 from fastapi import FastAPI
 from app.version import VERSION
 from app.api.v1 import routes_auth, routes_users
+from app.security import passwords
 from prometheus_fastapi_instrumentator import Instrumentator
 
 # Create instrumentator first
@@ -27,6 +28,15 @@ def auth_health(): return {'status':'ok'}
 @app.get('/v1/_info')
 def info(): return {'service':'auth','version':VERSION}
 
+@app.on_event("startup")
+def start_password_pool():
+    # Spawn the bcrypt workers now, not on the first login
+    passwords.start()
+
+@app.on_event("shutdown")
+def stop_password_pool():
+    passwords.close()
+
 # Debug: Print all routes on startup
 @app.on_event("startup")
 async def startup_event():
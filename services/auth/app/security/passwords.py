@@ -0,0 +1,107 @@
+import multiprocessing, re, threading, time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from typing import Optional
+import bcrypt
+from prometheus_client import Counter, Gauge, Histogram
+from app.core.config import settings
+
+# bcrypt runs in a process pool of PASSWORD_WORKERS, off the request threadpool and the GIL.
+# At most PASSWORD_QUEUE_LIMIT hashes may be running or waiting; one more is refused at once with
+# PasswordPoolBusy (503) instead of queueing behind a login burst, so the threads left over keep
+# serving refresh, health checks and everything else. Hashes use BCRYPT_ROUNDS; a stored hash with
+# another cost still verifies and is rehashed on the user's next successful login.
+
+HASH_SECONDS = Histogram("auth_password_hash_seconds", "bcrypt time including pool wait", ["op"],
+                         buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5))
+REJECTED = Counter("auth_password_rejected_total", "Password operations refused because the pool was full", ["op"])
+REHASHED = Counter("auth_password_rehashed_total", "Stored hashes upgraded to BCRYPT_ROUNDS on login")
+IN_FLIGHT = Gauge("auth_password_in_flight", "Password operations running or queued in the pool")
+
+_COST = re.compile(r"^\$2[abxy]?\$(\d{2})\$")
+
+class PasswordPoolBusy(Exception):
+    """The hashing pool is at PASSWORD_QUEUE_LIMIT; the caller should retry later."""
+
+def _secret(password: str) -> bytes:
+    # bcrypt only reads 72 bytes; older hashes were made from the truncated secret too
+    return password.encode("utf-8")[:72]
+
+def _hash(password: str, rounds: int) -> str:
+    return bcrypt.hashpw(_secret(password), bcrypt.gensalt(rounds)).decode("ascii")
+
+def _verify(password: str, hashed: str) -> bool:
+    try:
+        return bcrypt.checkpw(_secret(password), hashed.encode("ascii"))
+    except ValueError:  # not a bcrypt hash
+        return False
+
+def cost(hashed: str) -> Optional[int]:
+    m = _COST.match(hashed or "")
+    return int(m.group(1)) if m else None
+
+def needs_rehash(hashed: str) -> bool:
+    return cost(hashed) != settings.BCRYPT_ROUNDS
+
+_pool: Optional[ProcessPoolExecutor] = None
+_lock = threading.Lock()
+_in_flight = 0
+
+def _executor() -> ProcessPoolExecutor:
+    global _pool
+    with _lock:
+        if _pool is None:
+            # spawn: forking a process that already runs threads can copy held locks
+            _pool = ProcessPoolExecutor(max_workers=settings.PASSWORD_WORKERS,
+                                        mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+def _release(_fut=None):
+    global _in_flight
+    with _lock:
+        _in_flight -= 1
+        IN_FLIGHT.set(_in_flight)
+
+def _run(op: str, fn, *args):
+    global _in_flight
+    pool = _executor()
+    with _lock:
+        if _in_flight >= settings.PASSWORD_QUEUE_LIMIT:
+            REJECTED.labels(op).inc()
+            raise PasswordPoolBusy(op)
+        _in_flight += 1
+        IN_FLIGHT.set(_in_flight)
+    started = time.perf_counter()
+    try:
+        fut = pool.submit(fn, *args)
+    except Exception:
+        _release()
+        raise
+    # The slot is freed when the worker is done, not when the caller gives up waiting
+    fut.add_done_callback(_release)
+    try:
+        return fut.result(timeout=settings.PASSWORD_TIMEOUT_SECONDS)
+    except FutureTimeout:
+        fut.cancel()
+        REJECTED.labels(op).inc()
+        raise PasswordPoolBusy(op)
+    finally:
+        HASH_SECONDS.labels(op).observe(time.perf_counter() - started)
+
+def hash_password(password: str) -> str:
+    return _run("hash", _hash, password, settings.BCRYPT_ROUNDS)
+
+def verify_password(password: str, hashed: str) -> bool:
+    return _run("verify", _verify, password, hashed)
+
+def start():
+    """Spawn the workers ahead of the first login (each imports bcrypt once)."""
+    pool = _executor()
+    for f in [pool.submit(cost, "") for _ in range(settings.PASSWORD_WORKERS)]:
+        f.result()
+
+def close():
+    global _pool
+    with _lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=True, cancel_futures=True)
@@ -1,14 +1,9 @@
-from passlib.context import CryptContext
 from datetime import datetime, timedelta
 import jwt, uuid, hashlib
 from typing import Tuple
 from app.core.config import settings
-
-pwd_ctx = CryptContext(schemes=['bcrypt'], deprecated='auto')
-
-def hash_password(p: str) -> str: return pwd_ctx.hash(p)
-
-def verify_password(p: str, h: str) -> bool: return pwd_ctx.verify(p, h)
+# bcrypt runs in a bounded process pool; see passwords.py
+from app.security.passwords import hash_password, verify_password, needs_rehash, PasswordPoolBusy
 
 def now_utc() -> datetime: return datetime.utcnow()
 
@@ -0,0 +1,39 @@
+import threading
+import pytest
+from app.core.config import settings
+from app.security import passwords
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(settings, "BCRYPT_ROUNDS", 4)
+    monkeypatch.setattr(settings, "PASSWORD_WORKERS", 2)
+    yield passwords
+    passwords.close()
+
+def test_hash_and_verify_in_the_pool(pool):
+    h = pool.hash_password("P@ssw0rd!")
+    assert pool.cost(h) == 4 and not pool.needs_rehash(h)
+    assert pool.verify_password("P@ssw0rd!", h)
+    assert not pool.verify_password("wrong", h)
+    assert not pool.verify_password("P@ssw0rd!", "not-a-bcrypt-hash")
+    # bcrypt reads 72 bytes; longer passwords verify against their prefix instead of raising
+    long = "x" * 100
+    assert pool.verify_password(long, pool.hash_password(long))
+
+def test_cost_change_marks_hash_for_rehash(pool, monkeypatch):
+    h = pool.hash_password("P@ssw0rd!")
+    monkeypatch.setattr(settings, "BCRYPT_ROUNDS", 5)
+    assert pool.needs_rehash(h) and pool.verify_password("P@ssw0rd!", h)
+    assert pool.cost(pool.hash_password("P@ssw0rd!")) == 5
+
+def test_full_queue_rejects_immediately(pool, monkeypatch):
+    monkeypatch.setattr(settings, "PASSWORD_QUEUE_LIMIT", 1)
+    monkeypatch.setattr(settings, "BCRYPT_ROUNDS", 13)  # long enough to hold the only slot
+    slow = threading.Thread(target=pool.hash_password, args=("P@ssw0rd!",))
+    slow.start()
+    while passwords._in_flight == 0:
+        pass
+    with pytest.raises(passwords.PasswordPoolBusy):
+        pool.verify_password("P@ssw0rd!", "$2b$04$" + "a" * 53)
+    slow.join()
+    assert passwords._in_flight == 0
@@ -0,0 +1,55 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.api.deps import get_db
+from app.core.config import settings
+from app.db.models import RefreshToken, User
+from app.db.session import Base
+from app.main import app
+from app.security import passwords
+
+CREDS = {"email": "a@example.com", "password": "P@ssw0rd!"}
+
+@pytest.fixture
+def client(monkeypatch):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine, autoflush=False, autocommit=False)
+
+    def db():
+        with Session() as s:
+            yield s
+
+    app.dependency_overrides[get_db] = db
+    monkeypatch.setattr(settings, "BCRYPT_ROUNDS", 4)
+    monkeypatch.setattr(settings, "PASSWORD_WORKERS", 1)
+    yield TestClient(app), Session
+    app.dependency_overrides.pop(get_db, None)
+    passwords.close()
+
+def test_full_password_pool_answers_503_with_retry_after(client, monkeypatch):
+    http, _ = client
+    assert http.post("/auth/register", json=CREDS).status_code == 201
+    monkeypatch.setattr(settings, "PASSWORD_QUEUE_LIMIT", 0)
+    for r in (http.post("/auth/register", json=dict(CREDS, email="b@example.com")),
+              http.post("/auth/login", json=CREDS)):
+        assert r.status_code == 503 and r.headers["Retry-After"] == "1"
+
+def test_login_rehashes_an_outdated_hash_and_keeps_it(client, monkeypatch):
+    http, Session = client
+    assert http.post("/auth/register", json=CREDS).status_code == 201
+    with Session() as db:
+        old = db.query(User).one().password_hash
+    assert passwords.cost(old) == 4
+
+    monkeypatch.setattr(settings, "BCRYPT_ROUNDS", 5)
+    assert http.post("/auth/login", json=CREDS).status_code == 200
+    with Session() as db:
+        user = db.query(User).one()
+        assert passwords.cost(user.password_hash) == 5
+        assert db.query(RefreshToken).filter(RefreshToken.user_id == user.id).count() == 1
+    # the new hash is the one that verifies from now on
+    assert http.post("/auth/login", json=CREDS).status_code == 200
+    assert http.post("/auth/login", json=dict(CREDS, password="wrong")).status_code == 401
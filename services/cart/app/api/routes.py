@@ -7,10 +7,15 @@ import httpx
 
 from app.core.auth import get_current_identity
 from app.core.config import settings
-from app.store.cart_store import get_cart, put_item, delete_item, clear_cart
+from app.core.http import get_client
+from app.store.cart_store import get_cart, put_item, delete_item, clear_cart, is_checkout_locked
 
 router = APIRouter()
 
+def ensure_unlocked(email: str):
+    if is_checkout_locked(email):
+        raise HTTPException(status_code=409, detail="Checkout in progress")
+
 class CartItemAdd(BaseModel):
     product_id: int
     qty: int = Field(ge=1)
@@ -35,14 +40,14 @@ def get_my_cart(identity: dict = Depends(get_current_identity)):
 @router.post("/v1/cart/items", response_model=CartRead, status_code=201)
 def add_item(payload: CartItemAdd, identity: dict = Depends(get_current_identity)):
     email = identity.get("sub")
+    ensure_unlocked(email)
     # fetch product from catalog to snapshot price/title
-    url = f"{settings.CATALOG_BASE}/catalog/v1/products/{payload.product_id}"
+    catalog = get_client("catalog", settings.CATALOG_BASE)
     try:
-        with httpx.Client(timeout=5.0) as client:
-            resp = client.get(url)
-            if resp.status_code != 200:
-                raise HTTPException(status_code=404, detail="Product not found")
-            p = resp.json()
+        resp = catalog.get(f"/catalog/v1/products/{payload.product_id}")
+        if resp.status_code != 200:
+            raise HTTPException(status_code=404, detail="Product not found")
+        p = resp.json()
     except httpx.RequestError:
         raise HTTPException(status_code=503, detail="Catalog unavailable")
 
@@ -58,6 +63,7 @@ def add_item(payload: CartItemAdd, identity: dict = Depends(get_current_identity
 @router.patch("/v1/cart/items/{product_id}", response_model=CartRead)
 def update_item(product_id: int, payload: CartItemUpdate, identity: dict = Depends(get_current_identity)):
     email = identity.get("sub")
+    ensure_unlocked(email)
     if payload.qty == 0:
         delete_item(email, product_id)
         return get_cart(email)
@@ -73,11 +79,13 @@ def update_item(product_id: int, payload: CartItemUpdate, identity: dict = Depen
 @router.delete("/v1/cart/items/{product_id}", response_model=CartRead)
 def remove_item(product_id: int, identity: dict = Depends(get_current_identity)):
     email = identity.get("sub")
+    ensure_unlocked(email)
     delete_item(email, product_id)
     return get_cart(email)
 
 @router.post("/v1/cart/clear", response_model=CartRead)
 def clear(identity: dict = Depends(get_current_identity)):
     email = identity.get("sub")
+    ensure_unlocked(email)
     clear_cart(email)
     return get_cart(email)
@@ -7,5 +7,14 @@ class Settings(BaseModel):
     CATALOG_BASE: str = os.getenv("CATALOG_BASE", "http://catalog:8000")
     JWT_SECRET: str = os.getenv("JWT_SECRET", "devsecret")
     JWT_ALGORITHM: str = os.getenv("JWT_ALGORITHM", "HS256")
+    HTTP_TIMEOUT_SECONDS: float = float(os.getenv("HTTP_TIMEOUT_SECONDS", "5.0"))
+    HTTP_CONNECT_TIMEOUT_SECONDS: float = float(os.getenv("HTTP_CONNECT_TIMEOUT_SECONDS", "1.0"))
+    HTTP_MAX_CONNECTIONS: int = int(os.getenv("HTTP_MAX_CONNECTIONS", "50"))
+    HTTP_MAX_KEEPALIVE: int = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+    HTTP2: bool = os.getenv("HTTP2", "false").lower() == "true"
+    HTTP_RETRIES: int = int(os.getenv("HTTP_RETRIES", "2"))
+    HTTP_BACKOFF_SECONDS: float = float(os.getenv("HTTP_BACKOFF_SECONDS", "0.05"))
+    HTTP_BREAKER_FAILURES: int = int(os.getenv("HTTP_BREAKER_FAILURES", "5"))
+    HTTP_BREAKER_RESET_SECONDS: float = float(os.getenv("HTTP_BREAKER_RESET_SECONDS", "15"))
 
 settings = Settings()
@@ -1,6 +1,7 @@
 from fastapi import FastAPI
 from app.version import VERSION
 from app.api import routes as cart_routes
+from app.core import http
 from prometheus_fastapi_instrumentator import Instrumentator
 
 # Create instrumentator first
@@ -34,4 +35,8 @@ async def startup_event():
         if hasattr(route, "methods") and hasattr(route, "path"):
             print(f"{route.methods} {route.path}")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    http.close_all()
+
 app.include_router(cart_routes.router, prefix='/cart', tags=['cart'])
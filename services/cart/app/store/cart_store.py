@@ -10,6 +10,10 @@ def get_client() -> Redis:
 def cart_key(email: str) -> str:
     return f"cart:{email}"
 
+def is_checkout_locked(email: str) -> bool:
+    # Set by the order service while it checks out a snapshot of this cart
+    return bool(get_client().exists(f"{cart_key(email)}:lock"))
+
 def get_cart(email: str) -> Dict[str, Any]:
     r = get_client()
     key = cart_key(email)
@@ -0,0 +1,31 @@
+import httpx, pytest
+from app.core.config import settings
+from app.core.http import CircuitOpenError, ServiceClient
+
+def make_client(handler) -> ServiceClient:
+    c = ServiceClient("test-target", "http://upstream")
+    c._client = httpx.Client(base_url="http://upstream", transport=httpx.MockTransport(handler))
+    return c
+
+def test_get_retries_then_succeeds(monkeypatch):
+    monkeypatch.setattr(settings, "HTTP_BACKOFF_SECONDS", 0.0)
+    calls = []
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(503 if len(calls) < 2 else 200)
+    client = make_client(handler)
+    assert client.get("/x").status_code == 200
+    assert len(calls) == 2 and client.breaker._failures == 0
+
+def test_breaker_opens_after_failed_calls_not_attempts(monkeypatch):
+    monkeypatch.setattr(settings, "HTTP_BACKOFF_SECONDS", 0.0)
+    monkeypatch.setattr(settings, "HTTP_RETRIES", 2)
+    def handler(request):
+        raise httpx.ConnectError("refused", request=request)
+    client = make_client(handler)
+    client.breaker.failure_threshold = 2
+    for _ in range(2):
+        with pytest.raises(httpx.ConnectError):
+            client.get("/x")
+    with pytest.raises(CircuitOpenError):
+        client.get("/x")
@@ -0,0 +1,11 @@
+from alembic import op
+import sqlalchemy as sa
+
+revision='20261019120000'
+down_revision='20250823142354'
+
+def upgrade():
+    op.create_table('inventory_ledger', sa.Column('order_id', sa.Integer(), primary_key=True), sa.Column('op', sa.String(16), primary_key=True), sa.Column('created_at', sa.DateTime(), nullable=False, server_default=sa.text("(now() at time zone 'utc')")))
+
+def downgrade():
+    op.drop_table('inventory_ledger')
@@ -1,10 +1,12 @@
 # services/catalog/app/api/inventory.py
 from fastapi import APIRouter, Depends, Header, HTTPException
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import List, Optional, Tuple
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from app.api.deps import get_db
-from app.db.models import Inventory, Product
+from app.db.models import Inventory, InventoryLedger, Product
 from app.core.config import settings
 import jwt
 
@@ -14,9 +16,47 @@ class Item(BaseModel):
     product_id: int
     qty: int
 
-class ItemsReq(BaseModel):
+class OrderItems(BaseModel):
+    order_id: int
     items: List[Item]
 
+class ItemsReq(BaseModel):
+    items: List[Item] = []
+    # Per-order mode: each order's reserve/commit/release is applied once (inventory_ledger),
+    # so a caller may replay the request after a crash without moving stock twice
+    orders: List[OrderItems] = []
+
+def _claim(db: Session, req: ItemsReq, op: str, requires: Optional[str] = None,
+           unless: Tuple[str, ...] = (), refuse: Tuple[str, ...] = ()) -> Tuple[List[Item], List[int], List[int]]:
+    """Items to apply: the plain `items`, plus those of orders whose `op` isn't in the ledger yet
+    (recorded now, in the same transaction). Returns (items, applied order ids, skipped order ids).
+    An order that already went through a `refuse` step is a 409."""
+    items, applied, skipped = list(req.items), [], []
+    ids = [o.order_id for o in req.orders]
+    done = set(db.execute(
+        select(InventoryLedger.order_id, InventoryLedger.op).where(InventoryLedger.order_id.in_(ids))
+    ).all()) if ids else set()
+    for o in req.orders:
+        for r in refuse:
+            if (o.order_id, r) in done:
+                raise HTTPException(status_code=409, detail=f"Order {o.order_id} already had its inventory {r}d")
+        if ((o.order_id, op) in done or o.order_id in applied or any((o.order_id, u) in done for u in unless)
+                or (requires and (o.order_id, requires) not in done)):
+            skipped.append(o.order_id)
+            continue
+        db.add(InventoryLedger(order_id=o.order_id, op=op))
+        items += o.items
+        applied.append(o.order_id)
+    return items, applied, skipped
+
+def _commit(db: Session):
+    try:
+        db.commit()
+    except IntegrityError:
+        # Two requests claimed the same order's step at once; this one changed nothing
+        db.rollback()
+        raise HTTPException(status_code=409, detail="Concurrent request for the same order; retry")
+
 def admin_or_internal(
     x_internal_key: Optional[str] = Header(default=None, alias="X-Internal-Key"),
     auth: Optional[str] = Header(default=None, alias="Authorization"),
@@ -47,7 +87,9 @@ def admin_or_internal(
 @router.post("/v1/inventory/reserve")
 def reserve(req: ItemsReq, db: Session = Depends(get_db),
             _=Depends(admin_or_internal)):
-    for it in req.items:
+    # A released order can't take stock again: its checkout was given up on
+    items, applied, skipped = _claim(db, req, "reserve", refuse=("release",))
+    for it in items:
         inv = db.get(Inventory, it.product_id)
         if not inv:
             raise HTTPException(status_code=404, detail=f"Inventory missing for product_id {it.product_id}")
@@ -55,21 +97,37 @@ def reserve(req: ItemsReq, db: Session = Depends(get_db),
             raise HTTPException(status_code=409, detail=f"Insufficient stock for product_id {it.product_id}")
         inv.reserved = (inv.reserved or 0) + it.qty
         db.add(inv)
-    db.commit()
-    return {"status": "reserved"}
+    _commit(db)
+    return {"status": "reserved", "applied": applied, "skipped": skipped}
 
 @router.post("/v1/inventory/commit")
 def commit(req: ItemsReq, db: Session = Depends(get_db),
            _=Depends(admin_or_internal)):
-    for it in req.items:
+    items, applied, skipped = _claim(db, req, "commit")
+    for it in items:
         inv = db.get(Inventory, it.product_id)
         if not inv:
             raise HTTPException(status_code=404, detail=f"Inventory missing for product_id {it.product_id}")
         inv.in_stock = (inv.in_stock or 0) - it.qty
         inv.reserved = max(0, (inv.reserved or 0) - it.qty)
         db.add(inv)
-    db.commit()
-    return {"status": "committed"}
+    _commit(db)
+    return {"status": "committed", "applied": applied, "skipped": skipped}
+
+@router.post("/v1/inventory/release")
+def release(req: ItemsReq, db: Session = Depends(get_db),
+            _=Depends(admin_or_internal)):
+    # Compensation for reserve: hand held stock back without touching in_stock. Per order, only
+    # what that order actually reserved and hasn't committed is released
+    items, applied, skipped = _claim(db, req, "release", requires="reserve", unless=("commit",))
+    for it in items:
+        inv = db.get(Inventory, it.product_id)
+        if not inv:
+            raise HTTPException(status_code=404, detail=f"Inventory missing for product_id {it.product_id}")
+        inv.reserved = max(0, (inv.reserved or 0) - it.qty)
+        db.add(inv)
+    _commit(db)
+    return {"status": "released", "applied": applied, "skipped": skipped}
 
 @router.post("/v1/inventory/restock")
 def restock(req: ItemsReq, db: Session = Depends(get_db),
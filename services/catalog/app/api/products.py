@@ -5,7 +5,7 @@ from sqlalchemy import select
 from app.api.deps import get_db
 from app.core.auth import require_admin
 from app.db import models
-from app.schemas import ProductCreate, ProductUpdate, ProductRead
+from app.schemas import ProductCreate, ProductUpdate, ProductRead, ProductLookup, ProductPriceRead
 from app.services.storage import upload_bytes
 
 router = APIRouter()
@@ -21,6 +21,21 @@ def list_products(db: Session = Depends(get_db), q: Optional[str] = None, limit:
     stmt = stmt.offset(offset).limit(limit)
     return db.execute(stmt).scalars().unique().all()
 
+@router.post('/lookup', response_model=List[ProductPriceRead])
+def lookup_products(payload: ProductLookup, db: Session = Depends(get_db)):
+    # Bulk price/availability read for checkout revalidation: one query, no images/ORM objects
+    stmt = (
+        select(models.Product.id, models.Product.title, models.Product.price_cents, models.Product.currency,
+               models.Product.active, models.Inventory.in_stock, models.Inventory.reserved)
+        .outerjoin(models.Inventory, models.Inventory.product_id == models.Product.id)
+        .where(models.Product.id.in_(set(payload.ids)))
+    )
+    return [
+        ProductPriceRead(id=r.id, title=r.title, price_cents=r.price_cents, currency=r.currency or 'USD',
+                         active=bool(r.active), available=max(0, (r.in_stock or 0) - (r.reserved or 0)))
+        for r in db.execute(stmt)
+    ]
+
 @router.get('/{product_id}', response_model=ProductRead)
 def get_product(product_id: int, db: Session = Depends(get_db)):
     obj = db.get(models.Product, product_id)
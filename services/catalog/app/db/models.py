@@ -1,5 +1,6 @@
 from sqlalchemy.orm import Mapped, mapped_column, relationship
-from sqlalchemy import Integer,String,Text,Boolean,ForeignKey,BigInteger
+from sqlalchemy import Integer,String,Text,Boolean,ForeignKey,BigInteger,DateTime
+from datetime import datetime
 from app.db.session import Base
 
 class Category(Base):
@@ -36,3 +37,10 @@ class Inventory(Base):
     in_stock: Mapped[int] = mapped_column(Integer, default=0)
     reserved: Mapped[int] = mapped_column(Integer, default=0)
     product = relationship('Product', back_populates='inventory')
+
+class InventoryLedger(Base):
+    """Which inventory operations already ran for an order, so a replayed reserve/commit/release is a no-op."""
+    __tablename__='inventory_ledger'
+    order_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    op: Mapped[str] = mapped_column(String(16), primary_key=True)  # reserve | commit | release
+    created_at: Mapped[datetime] = mapped_column(DateTime(), default=lambda: datetime.utcnow())
@@ -37,3 +37,12 @@ class ProductRead(ProductBase):
     images: List[ProductImageRead] = []
     inventory: Optional[InventoryRead] = None
     class Config: from_attributes = True
+class ProductLookup(BaseModel):
+    ids: List[int] = Field(max_length=500)
+class ProductPriceRead(BaseModel):
+    id: int
+    title: str
+    price_cents: int
+    currency: str
+    active: bool
+    available: int
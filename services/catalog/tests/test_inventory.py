@@ -0,0 +1,71 @@
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.api.deps import get_db
+from app.core.config import settings
+from app.db.models import Inventory, Product
+from app.db.session import Base
+from app.main import app
+
+def _client():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    with Session() as db:
+        db.add(Product(id=1, title="Mug", price_cents=900, sku="MUG"))
+        db.add(Inventory(product_id=1, in_stock=10, reserved=0))
+        db.commit()
+    def override():
+        with Session() as db:
+            yield db
+    app.dependency_overrides[get_db] = override
+    return TestClient(app, headers={"X-Internal-Key": settings.SVC_INTERNAL_KEY}), Session
+
+def _stock(Session):
+    with Session() as db:
+        inv = db.get(Inventory, 1)
+        return inv.in_stock, inv.reserved
+
+def test_per_order_steps_apply_once():
+    client, Session = _client()
+    try:
+        body = {"orders": [{"order_id": 7, "items": [{"product_id": 1, "qty": 3}]}]}
+        assert client.post("/catalog/v1/inventory/reserve", json=body).json()["applied"] == [7]
+        assert client.post("/catalog/v1/inventory/reserve", json=body).json()["skipped"] == [7]
+        assert _stock(Session) == (10, 3)
+
+        assert client.post("/catalog/v1/inventory/commit", json=body).json()["applied"] == [7]
+        assert client.post("/catalog/v1/inventory/commit", json=body).json()["skipped"] == [7]
+        assert _stock(Session) == (7, 0)
+
+        # committed: a late compensation must not hand the stock back
+        assert client.post("/catalog/v1/inventory/release", json=body).json()["skipped"] == [7]
+        # never reserved: nothing to release
+        other = {"orders": [{"order_id": 8, "items": [{"product_id": 1, "qty": 2}]}]}
+        assert client.post("/catalog/v1/inventory/release", json=other).json()["skipped"] == [8]
+        assert _stock(Session) == (7, 0)
+    finally:
+        app.dependency_overrides.clear()
+
+def test_released_order_cannot_reserve_again():
+    client, Session = _client()
+    try:
+        body = {"orders": [{"order_id": 9, "items": [{"product_id": 1, "qty": 2}]}]}
+        client.post("/catalog/v1/inventory/reserve", json=body)
+        assert client.post("/catalog/v1/inventory/release", json=body).json()["applied"] == [9]
+        assert client.post("/catalog/v1/inventory/reserve", json=body).status_code == 409
+        assert _stock(Session) == (10, 0)
+    finally:
+        app.dependency_overrides.clear()
+
+def test_plain_items_keep_working():
+    client, Session = _client()
+    try:
+        r = client.post("/catalog/v1/inventory/reserve", json={"items": [{"product_id": 1, "qty": 4}]})
+        assert r.status_code == 200
+        assert client.post("/catalog/v1/inventory/release", json={"items": [{"product_id": 1, "qty": 4}]}).status_code == 200
+        assert _stock(Session) == (10, 0)
+        assert client.post("/catalog/v1/inventory/reserve", json={"items": [{"product_id": 1, "qty": 11}]}).status_code == 409
+    finally:
+        app.dependency_overrides.clear()
@@ -1,6 +1,8 @@
-from fastapi import APIRouter
+from concurrent.futures import TimeoutError as FutureTimeout
+from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel, EmailStr
-from app.kafka.consumer import send_email
+from app.core.config import settings
+from app.services import mailer
 
 router = APIRouter()
 
@@ -11,5 +13,11 @@ class TestEmail(BaseModel):
 
 @router.post("/notifications/v1/test-email")
 def test_email(payload: TestEmail):
-    send_email(payload.to, payload.subject, payload.body)
+    # Goes through the same pool, rate limit and retries as event emails, and waits for the outcome
+    try:
+        mailer.send(payload.to, payload.subject, payload.body, timeout=settings.SMTP_TIMEOUT_SECONDS * 3)
+    except FutureTimeout:
+        return {"sent": False, "queued": True}  # still retrying in the background
+    except Exception as exc:
+        raise HTTPException(status_code=502, detail=f"Email not delivered: {exc}")
     return {"sent": True}
@@ -9,5 +9,50 @@ class Settings(BaseModel):
     SMTP_HOST: str = os.getenv("SMTP_HOST", "mailhog")
     SMTP_PORT: int = int(os.getenv("SMTP_PORT", "1025"))
     FROM_EMAIL: str = os.getenv("FROM_EMAIL", "no-reply@example.local")
+    REDIS_URL: str = os.getenv("REDIS_URL", "redis://redis:6379/0")
+    ORDER_BASE: str = os.getenv("ORDER_BASE", "http://order:8000")
+    SVC_INTERNAL_KEY: str = os.getenv("SVC_INTERNAL_KEY", "devkey")
+    # order_id -> email lookups (app/store/order_emails.py)
+    ORDER_EMAIL_CACHE_SIZE: int = int(os.getenv("ORDER_EMAIL_CACHE_SIZE", "50000"))
+    ORDER_EMAIL_TTL_SECONDS: int = int(os.getenv("ORDER_EMAIL_TTL_SECONDS", "2592000"))
+    CONSUMER_MAX_RECORDS: int = int(os.getenv("CONSUMER_MAX_RECORDS", "500"))
+    CONSUMER_POLL_MS: int = int(os.getenv("CONSUMER_POLL_MS", "1000"))
+    # Consumer runtime (app/kafka/runtime.py): events keyed by order_id across CONSUMER_WORKERS threads
+    CONSUMER_WORKERS: int = int(os.getenv("CONSUMER_WORKERS", "8"))
+    CONSUMER_MAX_IN_FLIGHT: int = int(os.getenv("CONSUMER_MAX_IN_FLIGHT", "5000"))
+    CONSUMER_MAX_ATTEMPTS: int = int(os.getenv("CONSUMER_MAX_ATTEMPTS", "5"))
+    CONSUMER_RETRY_BACKOFF_SECONDS: float = float(os.getenv("CONSUMER_RETRY_BACKOFF_SECONDS", "0.5"))
+    CONSUMER_RETRY_MAX_BACKOFF_SECONDS: float = float(os.getenv("CONSUMER_RETRY_MAX_BACKOFF_SECONDS", "30"))
+    CONSUMER_DLQ_TOPIC: str = os.getenv("CONSUMER_DLQ_TOPIC", "notifications.events.dlq")
+    CONSUMER_SHUTDOWN_SECONDS: float = float(os.getenv("CONSUMER_SHUTDOWN_SECONDS", "10"))
+    HTTP_TIMEOUT_SECONDS: float = float(os.getenv("HTTP_TIMEOUT_SECONDS", "5.0"))
+    HTTP_CONNECT_TIMEOUT_SECONDS: float = float(os.getenv("HTTP_CONNECT_TIMEOUT_SECONDS", "1.0"))
+    HTTP_MAX_CONNECTIONS: int = int(os.getenv("HTTP_MAX_CONNECTIONS", "50"))
+    HTTP_MAX_KEEPALIVE: int = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+    HTTP2: bool = os.getenv("HTTP2", "false").lower() == "true"
+    HTTP_RETRIES: int = int(os.getenv("HTTP_RETRIES", "2"))
+    HTTP_BACKOFF_SECONDS: float = float(os.getenv("HTTP_BACKOFF_SECONDS", "0.05"))
+    HTTP_BREAKER_FAILURES: int = int(os.getenv("HTTP_BREAKER_FAILURES", "5"))
+    HTTP_BREAKER_RESET_SECONDS: float = float(os.getenv("HTTP_BREAKER_RESET_SECONDS", "15"))
+    # Delivery engine (app/services/mailer.py): persistent connections, one per worker
+    SMTP_WORKERS: int = int(os.getenv("SMTP_WORKERS", "8"))
+    SMTP_TIMEOUT_SECONDS: float = float(os.getenv("SMTP_TIMEOUT_SECONDS", "10"))
+    SMTP_MAX_MESSAGES_PER_CONNECTION: int = int(os.getenv("SMTP_MAX_MESSAGES_PER_CONNECTION", "100"))
+    SMTP_IDLE_CHECK_SECONDS: float = float(os.getenv("SMTP_IDLE_CHECK_SECONDS", "30"))
+    # Emails/sec per recipient domain; "*" is shared by every domain not listed; 0 = unlimited
+    SMTP_PROVIDER_RATES: str = os.getenv("SMTP_PROVIDER_RATES", "*=50")
+    SMTP_MAX_ATTEMPTS: int = int(os.getenv("SMTP_MAX_ATTEMPTS", "5"))
+    SMTP_RETRY_BACKOFF_SECONDS: float = float(os.getenv("SMTP_RETRY_BACKOFF_SECONDS", "1"))
+    SMTP_RETRY_MAX_BACKOFF_SECONDS: float = float(os.getenv("SMTP_RETRY_MAX_BACKOFF_SECONDS", "60"))
+    EMAIL_QUEUE_SIZE: int = int(os.getenv("EMAIL_QUEUE_SIZE", "10000"))
+    EMAIL_SHUTDOWN_SECONDS: float = float(os.getenv("EMAIL_SHUTDOWN_SECONDS", "10"))
+
+    # Coalescing (app/services/digest.py): a recipient's events within the window become one email
+    DIGEST_WINDOW_SECONDS: float = float(os.getenv("DIGEST_WINDOW_SECONDS", "60"))
+    DIGEST_TICK_SECONDS: float = float(os.getenv("DIGEST_TICK_SECONDS", "1"))
+    DIGEST_MAX_ITEMS: int = int(os.getenv("DIGEST_MAX_ITEMS", "20"))
+    DIGEST_URGENT_TYPES: str = os.getenv("DIGEST_URGENT_TYPES", "shipping.dispatched")
+    EMAIL_TEMPLATE_DIR: str = os.getenv("EMAIL_TEMPLATE_DIR", "")
+    EMAIL_RENDER_CACHE_SIZE: int = int(os.getenv("EMAIL_RENDER_CACHE_SIZE", "4096"))
 
 settings = Settings()
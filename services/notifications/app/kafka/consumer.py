@@ -1,66 +1,164 @@
-import json, threading, smtplib
-from email.mime.text import MIMEText
-from kafka import KafkaConsumer
+import json, logging, threading
+from concurrent.futures import Future
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Optional
+from kafka import ConsumerRebalanceListener, KafkaConsumer, KafkaProducer
 from app.core.config import settings
+from app.kafka.runtime import LAG, PAUSED, KeyedWorkers
+from app.services import digest
+from app.store import order_emails
+
+log = logging.getLogger(__name__)
 
 _stop = threading.Event()
 _thread = None
+_dlq: Optional[KafkaProducer] = None
+
+# Events that may arrive without user_email; their order's email is looked up in bulk per batch
+_NEEDS_EMAIL = {"payment.succeeded", "shipping.ready", "shipping.dispatched"}
 
-# Cache order_id -> user_email learned from order.created
-_order_email = {}
+def _invalid(ev) -> Optional[ValueError]:
+    """Why an event can never be handled (a bad payload stays bad on replay), or None."""
+    if not isinstance(ev, dict):
+        return ValueError("event is not an object")
+    if not isinstance(ev.get("type") or "", str) or not isinstance(ev.get("user_email") or "", str):
+        return ValueError("type and user_email must be strings")
+    order_id = ev.get("order_id")
+    if order_id is not None and (isinstance(order_id, bool) or not isinstance(order_id, (int, str))
+                                 or not str(order_id).isdecimal() or int(order_id) == 0):
+        return ValueError("order_id must be a positive integer")
+    return None
 
-def send_email(to: str, subject: str, body: str):
-    msg = MIMEText(body)
-    msg["Subject"] = subject
-    msg["From"] = settings.FROM_EMAIL
-    msg["To"] = to
-    with smtplib.SMTP(settings.SMTP_HOST, settings.SMTP_PORT) as s:
-        s.sendmail(settings.FROM_EMAIL, [to], msg.as_string())
+def resolve_emails(events: Iterable[dict]) -> Dict[int, Optional[str]]:
+    """Remember emails from order.created, then look up (in bulk) those the other events lack.
+    Orders the order service couldn't be asked about map to None; their events ask again on their worker."""
+    events = list(events)
+    learned = {ev["order_id"]: ev["user_email"] for ev in events
+               if ev.get("type") == "order.created" and ev.get("order_id") and ev.get("user_email")}
+    if learned:
+        order_emails.remember(learned)
+    missing = {ev["order_id"] for ev in events
+               if ev.get("type") in _NEEDS_EMAIL and ev.get("order_id") and not ev.get("user_email")}
+    if not missing:
+        return {}
+    try:
+        return order_emails.lookup(missing)
+    except order_emails.LookupUnavailable as exc:
+        return {**exc.found, **dict.fromkeys(exc.order_ids)}
 
-def _handle(ev: dict):
+def _handle(ev: dict, known: Dict[int, Optional[str]]) -> Optional[Future]:
+    """Hand the event's email to the digest stage; the returned Future settles once it is delivered."""
     t = ev.get("type")
     if t == "order.created":
-        if ev.get("order_id") and ev.get("user_email"):
-            _order_email[ev["order_id"]] = ev["user_email"]
         # Email: order received
-        if ev.get("user_email"):
-            send_email(ev["user_email"], "Order received",
-                       f"We received your order {ev['order_id']} for {ev.get('amount_cents','?')} cents.")
-    elif t == "payment.succeeded":
-        email = ev.get("user_email") or _order_email.get(ev.get("order_id"))
-        if email:
-            send_email(email, "Payment received",
-                       f"Payment for order {ev['order_id']} succeeded.")
-    elif t == "shipping.ready":
-        email = ev.get("user_email") or _order_email.get(ev.get("order_id"))
-        if email:
-            send_email(email, "Order ready to ship",
-                       f"Your order {ev['order_id']} is ready to ship.")
-    elif t == "shipping.dispatched":
-        email = ev.get("user_email") or _order_email.get(ev.get("order_id"))
-        if email:
-            send_email(email, "Order dispatched",
-                       f"Your order {ev['order_id']} has been dispatched. "
-                       f"Tracking: {ev.get('tracking_number','TBA')}")
+        return digest.notify(ev["user_email"], ev) if ev.get("user_email") else None
+    if t not in _NEEDS_EMAIL:
+        return None
+    order_id = int(ev.get("order_id") or 0)
+    email = ev.get("user_email") or known.get(order_id)
+    if not email and order_id in known:
+        # The batch lookup couldn't reach the order service: if this one can't either, it raises and is retried
+        email = order_emails.get(order_id)
+    if not email:
+        log.warning("no email known for order %s; %s not sent", ev.get("order_id"), t)
+        return None
+    # Rendered from app/templates/<type>.txt; may be merged with the recipient's other events
+    return digest.notify(email, ev)
 
-def _run():
+def dead_letter(rec, exc: BaseException):
+    global _dlq
+    if _dlq is None:
+        _dlq = KafkaProducer(bootstrap_servers=[settings.KAFKA_BOOTSTRAP], acks="all",
+                             value_serializer=lambda v: json.dumps(v).encode("utf-8"))
+    _dlq.send(settings.CONSUMER_DLQ_TOPIC, value={
+        "topic": rec.topic, "partition": rec.partition, "offset": rec.offset, "value": rec.value,
+        "error": repr(exc), "failed_at": datetime.now(timezone.utc).isoformat(),
+    }).get(timeout=10)
+
+def dispatch(records, workers: KeyedWorkers):
+    """Hand a polled batch to the workers, keyed by order_id so each order's events stay in order.
+    Malformed events are dead-lettered in their turn instead of failing the whole batch here."""
+    errors = [_invalid(rec.value) for rec in records]
+    known = resolve_emails(rec.value for rec, error in zip(records, errors) if error is None)
+    for rec, error in zip(records, errors):
+        if error is not None:
+            workers.reject(rec, error)
+            continue
+        ev = rec.value
+        workers.dispatch(rec, ev.get("order_id"), lambda ev=ev: _handle(ev, known))
+
+class _Rebalance(ConsumerRebalanceListener):
+    def __init__(self, consumer: KafkaConsumer, workers: KeyedWorkers):
+        self.consumer, self.workers = consumer, workers
+
+    def on_partitions_revoked(self, revoked):
+        # Keep what finished; the rest is redelivered to the partitions' next owner
+        offsets = self.workers.offsets(set(revoked))
+        if offsets:
+            try:
+                self.consumer.commit(offsets)
+            except Exception:
+                log.warning("offset commit on revoke failed", exc_info=True)
+        self.workers.forget(revoked)
+
+    def on_partitions_assigned(self, assigned):
+        pass
+
+def _record_lag(consumer: KafkaConsumer):
+    for tp in consumer.assignment():
+        hw = consumer.highwater(tp)  # cached from fetch responses, no broker round trip
+        if hw is not None:
+            LAG.labels(tp.topic, tp.partition).set(max(0, hw - consumer.position(tp)))
+
+def _consume():
     consumer = KafkaConsumer(
-        settings.TOPIC_ORDER_EVENTS,
-        settings.TOPIC_PAYMENT_EVENTS,
-        settings.TOPIC_SHIPPING_EVENTS,
         bootstrap_servers=[settings.KAFKA_BOOTSTRAP],
         group_id="notifications-service",
         value_deserializer=lambda v: json.loads(v.decode("utf-8")),
-        enable_auto_commit=True,
+        enable_auto_commit=False,
         auto_offset_reset="earliest",
+        max_poll_records=settings.CONSUMER_MAX_RECORDS,
     )
+    workers = KeyedWorkers(settings.CONSUMER_WORKERS, dead_letter)
     try:
-        for msg in consumer:
-            if _stop.is_set():
-                break
-            _handle(msg.value)
+        consumer.subscribe([settings.TOPIC_ORDER_EVENTS, settings.TOPIC_PAYMENT_EVENTS, settings.TOPIC_SHIPPING_EVENTS],
+                           listener=_Rebalance(consumer, workers))
+        while not _stop.is_set():
+            batch = consumer.poll(timeout_ms=settings.CONSUMER_POLL_MS)
+            if batch:
+                dispatch([rec for recs in batch.values() for rec in recs], workers)
+            offsets = workers.offsets()
+            if offsets:
+                consumer.commit(offsets)
+            # Saturated workers: stop fetching (the group membership stays alive) until they catch up
+            saturated = workers.in_flight() >= settings.CONSUMER_MAX_IN_FLIGHT
+            if saturated and not consumer.paused():
+                consumer.pause(*consumer.assignment())
+            elif not saturated and consumer.paused():
+                consumer.resume(*consumer.paused())
+            PAUSED.set(1 if saturated else 0)
+            _record_lag(consumer)
     finally:
-        consumer.close()
+        workers.close(settings.CONSUMER_SHUTDOWN_SECONDS)
+        # Buffered events hold their offsets open: send them now so they can be committed, not resent
+        waiting = digest.flush(settings.CONSUMER_SHUTDOWN_SECONDS)
+        if waiting:
+            log.warning("%d event(s) still awaiting their email; they will be redelivered", waiting)
+        try:
+            offsets = workers.offsets()
+            if offsets:
+                consumer.commit(offsets)
+        finally:
+            consumer.close()
+
+def _run():
+    # A crash (broker, commit, bug) restarts the consumer rather than silently ending notifications
+    while not _stop.is_set():
+        try:
+            _consume()
+        except Exception:
+            log.exception("notifications consumer crashed; restarting")
+            _stop.wait(settings.CONSUMER_RETRY_BACKOFF_SECONDS)
 
 def start():
     global _thread
@@ -72,3 +170,6 @@ def start():
 
 def stop():
     _stop.set()
+    if _thread:
+        # Lets the workers finish and the final offsets be committed
+        _thread.join(timeout=settings.CONSUMER_SHUTDOWN_SECONDS + settings.CONSUMER_POLL_MS / 1000)
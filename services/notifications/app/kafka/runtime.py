@@ -0,0 +1,235 @@
+import logging, queue, random, threading, time, zlib
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional
+from kafka.structs import OffsetAndMetadata, TopicPartition
+from prometheus_client import Counter, Gauge
+from app.core.config import settings
+
+log = logging.getLogger(__name__)
+
+# Keyed worker pool behind a Kafka consumer:
+#   poll thread -> worker[crc32(key) % CONSUMER_WORKERS] (one FIFO each) -> handler -> retries -> DLQ
+# Events with the same key (order_id) always land on the same worker, so they are handled in order;
+# different orders proceed in parallel. A failing event is retried with exponential backoff on its
+# worker (holding back only that worker's later events), then published to the dead-letter topic.
+# A record that can never be handled (reject()) is dead-lettered in its partition's turn, without retries.
+# Offsets are tracked per partition and committed only up to the lowest one not yet finished, so a
+# crash re-delivers the unfinished tail instead of skipping it.
+# A handler may return a Future (the email carrying the event, still buffered or queued in the mailer):
+# the worker moves on, and the offset is finished only once the Future succeeds. If it fails, the job
+# is retried ahead of everything its worker hasn't started yet, so the order's later events that are
+# still queued stay behind it. Those already handed off before the failure can't be called back.
+
+EVENTS = Counter("notifications_consumer_events_total", "Consumed events by outcome", ["outcome"])  # handled, retried, dead_lettered
+LAG = Gauge("notifications_consumer_lag", "Messages behind the partition high watermark", ["topic", "partition"])
+BUSY = Gauge("notifications_consumer_workers_busy", "Workers currently handling an event")
+IN_FLIGHT = Gauge("notifications_consumer_in_flight", "Events dispatched to workers and not yet finished")
+WORKER_QUEUE = Gauge("notifications_consumer_worker_queue_depth", "Events waiting for a worker", ["worker"])
+PAUSED = Gauge("notifications_consumer_paused", "1 while fetching is paused because workers are saturated")
+
+class OffsetTracker:
+    """One partition's dispatched offsets in order. committable() is the lowest offset not yet
+    finished, or one past the last dispatched once all are."""
+
+    def __init__(self):
+        self._pending: deque = deque()
+        self._done: set = set()
+        self._next: Optional[int] = None
+        self.revoked = False
+
+    def add(self, offset: int):
+        self._pending.append(offset)
+        self._next = offset + 1
+
+    def done(self, offset: int):
+        self._done.add(offset)
+
+    def committable(self) -> Optional[int]:
+        while self._pending and self._pending[0] in self._done:
+            self._done.discard(self._pending.popleft())
+        return self._pending[0] if self._pending else self._next
+
+    def __len__(self) -> int:
+        return len(self._pending) - len(self._done)
+
+@dataclass
+class Job:
+    tp: TopicPartition
+    offset: int
+    record: object
+    run: Optional[Callable[[], Optional[Future]]]  # None: rejected, dead-letter as is
+    tracker: OffsetTracker
+    worker: int
+    attempt: int = 0
+    error: Optional[BaseException] = None
+
+class WorkerQueue(queue.Queue):
+    """A worker's FIFO, except that retried jobs go ahead of everything not yet started (oldest retry first)."""
+
+    def _init(self, maxsize):
+        super()._init(maxsize)
+        self.retries: deque = deque()
+
+    def _qsize(self):
+        return len(self.queue) + len(self.retries)
+
+    def _get(self):
+        return self.retries.popleft() if self.retries else self.queue.popleft()
+
+    def put_retry(self, item):
+        with self.not_empty:
+            self.retries.append(item)
+            self.unfinished_tasks += 1
+            self.not_empty.notify()
+
+def backoff(attempt: int) -> float:
+    delay = min(settings.CONSUMER_RETRY_MAX_BACKOFF_SECONDS, settings.CONSUMER_RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+class KeyedWorkers:
+    """dispatch() from the poll thread; workers call `job.run()` (and wait on the Future it may
+    return) and, when it keeps failing, `dead_letter(record, exc)`. offsets() gives what may be
+    committed now."""
+
+    def __init__(self, workers: int, dead_letter: Callable[[object, BaseException], None]):
+        self.dead_letter = dead_letter
+        self._queues: List[WorkerQueue] = [WorkerQueue() for _ in range(max(1, workers))]
+        self._trackers: Dict[TopicPartition, OffsetTracker] = {}
+        self._committed: Dict[TopicPartition, int] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = [threading.Thread(target=self._work, args=(n,), daemon=True, name=f"consumer-{n}")
+                         for n in range(len(self._queues))]
+        for t in self._threads:
+            t.start()
+
+    def worker_for(self, key) -> int:
+        return zlib.crc32(str(key).encode()) % len(self._queues)
+
+    def dispatch(self, record, key, run: Callable[[], Optional[Future]]):
+        self._enqueue(record, key, run)
+
+    def reject(self, record, error: BaseException):
+        """A record no attempt can handle (e.g. a malformed payload): dead-lettered without retries."""
+        self._enqueue(record, None, None, error)
+
+    def _enqueue(self, record, key, run: Optional[Callable[[], Optional[Future]]],
+                 error: Optional[BaseException] = None):
+        tp = TopicPartition(record.topic, record.partition)
+        with self._lock:
+            tracker = self._trackers.get(tp)
+            if tracker is None:
+                tracker = self._trackers[tp] = OffsetTracker()
+                self._committed.setdefault(tp, record.offset)  # where the group already stands
+            tracker.add(record.offset)
+        n = self.worker_for(record.partition if key is None else key)
+        self._queues[n].put(Job(tp, record.offset, record, run, tracker, n, error=error))
+        WORKER_QUEUE.labels(str(n)).set(self._queues[n].qsize())
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return sum(len(t) for t in self._trackers.values())
+
+    def offsets(self, tps: Optional[Iterable[TopicPartition]] = None) -> Dict[TopicPartition, OffsetAndMetadata]:
+        """Committable offsets that moved since the last call (only `tps` if given)."""
+        out = {}
+        with self._lock:
+            for tp, tracker in self._trackers.items():
+                if tps is not None and tp not in tps:
+                    continue
+                offset = tracker.committable()
+                if offset is not None and offset != self._committed.get(tp):
+                    out[tp] = OffsetAndMetadata(offset, "", -1)
+                    self._committed[tp] = offset
+            IN_FLIGHT.set(sum(len(t) for t in self._trackers.values()))
+        return out
+
+    def forget(self, tps: Iterable[TopicPartition]):
+        """Partitions revoked in a rebalance: their queued events now belong to another consumer."""
+        with self._lock:
+            for tp in tps:
+                tracker = self._trackers.pop(tp, None)
+                if tracker is not None:
+                    tracker.revoked = True
+                self._committed.pop(tp, None)
+
+    def _work(self, n: int):
+        q = self._queues[n]
+        while True:
+            job = q.get()
+            WORKER_QUEUE.labels(str(n)).set(q.qsize())
+            if job is None:
+                return
+            if job.tracker.revoked:
+                continue
+            BUSY.inc()
+            try:
+                self._process(job)
+            finally:
+                BUSY.dec()
+
+    def _finish(self, job: Job, outcome: str):
+        EVENTS.labels(outcome).inc()
+        with self._lock:
+            job.tracker.done(job.offset)
+
+    def _process(self, job: Job):
+        # Returning without _finish leaves the offset unfinished (shutting down mid-retry): the event is redelivered
+        while True:
+            if job.error is not None:
+                if job.run is None or job.attempt >= settings.CONSUMER_MAX_ATTEMPTS:
+                    self._give_up(job)
+                    return
+                EVENTS.labels("retried").inc()
+                log.warning("event %s[%d]@%d failed (attempt %d): %s", job.tp.topic, job.tp.partition,
+                            job.offset, job.attempt, job.error)
+                if self._stop.wait(backoff(job.attempt)):
+                    return
+            job.attempt += 1
+            try:
+                pending = job.run()
+            except Exception as exc:
+                job.error = exc
+                continue
+            if pending is None:
+                self._finish(job, "handled")
+            else:
+                pending.add_done_callback(lambda fut, job=job: self._delivered(job, fut))
+            return
+
+    def _delivered(self, job: Job, fut: Future):
+        # Runs on the thread that settled the Future (a mailer worker): bookkeeping only
+        exc = fut.exception()
+        if exc is None:
+            self._finish(job, "handled")
+        elif not self._stop.is_set() and not job.tracker.revoked:
+            job.error = exc
+            self._queues[job.worker].put_retry(job)
+
+    def _give_up(self, job: Job):
+        attempt = 0
+        while True:
+            try:
+                self.dead_letter(job.record, job.error)
+            except Exception:
+                attempt += 1
+                log.exception("dead-letter publish failed for %s[%d]@%d", job.tp.topic, job.tp.partition, job.offset)
+                if self._stop.wait(backoff(attempt)):
+                    return
+                continue
+            log.error("event %s[%d]@%d dead-lettered after %d attempts: %s", job.tp.topic, job.tp.partition,
+                      job.offset, job.attempt, job.error)
+            self._finish(job, "dead_lettered")
+            return
+
+    def close(self, timeout: float):
+        """Finish what is already queued (no further retries), then stop the workers."""
+        self._stop.set()
+        for q in self._queues:
+            q.put(None)
+        deadline = time.monotonic() + timeout
+        for t in self._threads:
+            t.join(timeout=max(0.1, deadline - time.monotonic()))
+        BUSY.set(0)
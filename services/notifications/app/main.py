@@ -1,6 +1,7 @@
 from fastapi import FastAPI
 from app.api.routes import router
 from app.kafka import consumer
+from app.services import digest, mailer
 from prometheus_fastapi_instrumentator import Instrumentator
 
 # Create instrumentator first
@@ -23,6 +24,9 @@ async def startup():
 @app.on_event("shutdown")
 async def shutdown():
     consumer.stop()
+    # Send buffered digests, then deliver what's already queued before the process exits
+    digest.close()
+    mailer.close()
 
 @app.get("/health")
 def health():
@@ -0,0 +1,191 @@
+import logging, threading, time
+from concurrent.futures import Future, wait
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+from prometheus_client import Counter, Gauge
+from app.core.config import settings
+from app.services import mailer, templates
+
+log = logging.getLogger(__name__)
+
+# Coalescing stage between the consumer and the mailer:
+#   notify() -> per-recipient pending list, due DIGEST_WINDOW_SECONDS after its first event
+# Due times are kept in a timing wheel of DIGEST_TICK_SECONDS buckets (slot -> recipients), so the
+# flusher only visits the buckets that have elapsed instead of scanning every recipient. A recipient's
+# events in one window go out as a single digest email; one event goes out as its usual email.
+# DIGEST_URGENT_TYPES skip the wait: they are sent at once, together with anything already pending
+# for that recipient. A window of 0 turns the stage off.
+# notify() returns a Future per event that settles with the email carrying it: the consumer keeps the
+# event's offset open until then, and retries it if the email finally fails.
+
+EVENTS = Counter("notifications_digest_events_total", "Events entering the coalescing stage", ["path"])  # buffered, urgent
+DIGESTS = Counter("notifications_digests_sent_total", "Emails sent by the coalescing stage", ["kind"])  # single, digest
+SAVED = Counter("notifications_emails_saved_total", "Emails not sent because their event was merged into a digest")
+PENDING = Gauge("notifications_digest_pending_recipients", "Recipients with buffered events")
+
+@dataclass
+class Pending:
+    slot: int
+    items: List[Tuple[str, Dict]] = field(default_factory=list)  # (event type, template fields)
+    waiters: List[Future] = field(default_factory=list)  # one per item, settled when its email is
+
+class DigestBuffer:
+    """Per-recipient pending events bucketed by due tick. add() returns the entry to send right away
+    (urgent event, or DIGEST_MAX_ITEMS reached); due() pops every recipient whose bucket elapsed."""
+
+    def __init__(self, window: float, tick: float, max_items: int):
+        self.window, self.tick, self.max_items = window, max(tick, 0.01), max(1, max_items)
+        self._pending: Dict[str, Pending] = {}
+        self._buckets: Dict[int, List[str]] = {}
+        self._lock = threading.Lock()
+
+    def _slot(self, t: float) -> int:
+        return int(t // self.tick)
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def add(self, to: str, item: Tuple[str, Dict], urgent: bool, now: float,
+            waiter: Optional[Future] = None) -> Optional[Pending]:
+        waiter = waiter or Future()
+        with self._lock:
+            entry = self._pending.get(to)
+            if urgent:
+                # Its bucket entry stays behind; due() skips it because the slot no longer matches
+                entry = self._pending.pop(to) if entry else Pending(-1)
+                entry.items.append(item)
+                entry.waiters.append(waiter)
+                return entry
+            if entry is None:
+                slot = self._slot(now + self.window)
+                self._pending[to] = Pending(slot, [item], [waiter])
+                self._buckets.setdefault(slot, []).append(to)
+                return None
+            entry.items.append(item)
+            entry.waiters.append(waiter)
+            if len(entry.items) >= self.max_items:
+                return self._pending.pop(to)
+            return None
+
+    def due(self, now: float) -> List[Tuple[str, Pending]]:
+        out = []
+        current = self._slot(now)
+        with self._lock:
+            for slot in sorted(s for s in self._buckets if s < current):
+                for to in self._buckets.pop(slot):
+                    entry = self._pending.get(to)
+                    if entry is not None and entry.slot == slot:
+                        out.append((to, self._pending.pop(to)))
+        return out
+
+    def drain(self) -> List[Tuple[str, Pending]]:
+        with self._lock:
+            out = list(self._pending.items())
+            self._pending.clear()
+            self._buckets.clear()
+        return out
+
+_buffer: Optional[DigestBuffer] = None
+_lock = threading.Lock()
+_stop = threading.Event()
+_thread: Optional[threading.Thread] = None
+
+def _urgent_types() -> set:
+    return {t.strip() for t in settings.DIGEST_URGENT_TYPES.split(",") if t.strip()}
+
+def fields_for(ev: dict) -> Dict:
+    return {"order_id": ev.get("order_id"), "amount_cents": ev.get("amount_cents"),
+            "tracking_number": ev.get("tracking_number")}
+
+def compose(items: List[Tuple[str, Dict]]) -> Tuple[str, str]:
+    """One email for a recipient's items: the event's own template if there is one, else a digest."""
+    unique = list({(t, tuple(sorted(f.items(), key=lambda kv: kv[0]))): (t, f) for t, f in items}.values())
+    if len(unique) == 1:
+        t, f = unique[0]
+        return templates.render(t, **f)
+    orders = list(dict.fromkeys(str(f.get("order_id")) for _, f in unique))
+    lines = "\n".join(f"- {templates.render(t, **f)[1]}" for t, f in unique)
+    label = f"order {orders[0]}" if len(orders) == 1 else "orders " + ", ".join(orders)
+    return templates.render("digest", orders=label, lines=lines)
+
+def _settle(waiters: List[Future], exc: Optional[BaseException]):
+    for w in waiters:
+        if exc is None:
+            w.set_result(True)
+        else:
+            w.set_exception(exc)
+
+def _send(to: str, entry: Pending) -> Future:
+    try:
+        subject, body = compose(entry.items)
+        sent = mailer.submit(to, subject, body)
+    except Exception as exc:
+        _settle(entry.waiters, exc)
+        raise
+    DIGESTS.labels("single" if len(entry.items) == 1 else "digest").inc()
+    if len(entry.items) > 1:
+        SAVED.inc(len(entry.items) - 1)
+    sent.add_done_callback(lambda f: _settle(entry.waiters, f.exception()))
+    return sent
+
+def _flusher():
+    while not _stop.wait(_buffer.tick):
+        for to, entry in _buffer.due(time.monotonic()):
+            try:
+                _send(to, entry)
+            except Exception:
+                log.exception("digest for %s not sent", to)
+        PENDING.set(len(_buffer))
+
+def start():
+    global _buffer, _thread
+    with _lock:
+        if _thread and _thread.is_alive():
+            return
+        _stop.clear()
+        _buffer = DigestBuffer(settings.DIGEST_WINDOW_SECONDS, settings.DIGEST_TICK_SECONDS,
+                               settings.DIGEST_MAX_ITEMS)
+        _thread = threading.Thread(target=_flusher, daemon=True, name="digest-flusher")
+        _thread.start()
+
+def notify(to: str, ev: dict) -> Future:
+    """Email `to` about `ev`, now or as part of the recipient's next digest. The Future resolves once
+    that email is delivered, or raises the mailer's final error."""
+    item, waiter = (ev["type"], fields_for(ev)), Future()
+    if settings.DIGEST_WINDOW_SECONDS <= 0:
+        EVENTS.labels("urgent").inc()
+        _send(to, Pending(-1, [item], [waiter]))
+        return waiter
+    start()
+    urgent = ev["type"] in _urgent_types()
+    EVENTS.labels("urgent" if urgent else "buffered").inc()
+    ready = _buffer.add(to, item, urgent, time.monotonic(), waiter)
+    if ready:
+        _send(to, ready)
+    PENDING.set(len(_buffer))
+    return waiter
+
+def flush(timeout: Optional[float] = None) -> int:
+    """Send everything buffered now and wait (up to `timeout`) for it to be delivered or to fail.
+    Returns how many events are still waiting on their email."""
+    if _buffer is None:
+        return 0
+    sent = []
+    for to, entry in _buffer.drain():
+        try:
+            _send(to, entry)
+        except Exception:
+            log.exception("digest for %s not sent", to)
+        sent.extend(entry.waiters)
+    PENDING.set(0)
+    return len(wait(sent, timeout).not_done) if sent else 0
+
+def close():
+    """Stop the flusher and send everything still buffered (before mailer.close())."""
+    global _thread
+    _stop.set()
+    with _lock:
+        thread, _thread = _thread, None
+    if thread:
+        thread.join(timeout=5)
+    flush(timeout=0)
@@ -0,0 +1,282 @@
+import heapq, itertools, logging, queue, random, smtplib, threading, time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from email.mime.text import MIMEText
+from email.utils import formatdate
+from typing import Dict, List, Optional
+from prometheus_client import Counter, Gauge, Histogram
+from app.core.config import settings
+
+log = logging.getLogger(__name__)
+
+# Email delivery engine:
+#   submit() -> bounded ready queue -> SMTP_WORKERS threads, each holding one persistent SMTP connection
+# Every provider (recipient domain, or "*" for all others; SMTP_PROVIDER_RATES) has a token bucket.
+# A message whose provider is out of tokens, or that failed with a transient error, is parked on a
+# delay heap and re-queued when due, so it never ties up a worker. 5xx replies fail at once.
+
+EMAILS = Counter("notifications_emails_total", "Emails by outcome", ["outcome"])  # sent, retried, failed
+THROTTLED = Counter("notifications_email_throttled_total", "Sends deferred by a provider rate limit", ["provider"])
+SEND_SECONDS = Histogram("notifications_email_send_seconds", "SMTP transaction time per email",
+                         buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10))
+CONNECTIONS = Counter("notifications_smtp_connections_opened_total", "SMTP connections opened")
+QUEUE_DEPTH = Gauge("notifications_email_queue_depth", "Emails waiting for a worker")
+DELAYED = Gauge("notifications_email_delayed", "Emails waiting out a rate limit or retry backoff")
+
+@dataclass
+class Email:
+    to: str
+    subject: str
+    body: str
+    attempt: int = 0
+    future: Future = field(default_factory=Future)
+
+    @property
+    def domain(self) -> str:
+        return self.to.rpartition("@")[2].lower()
+
+class TokenBucket:
+    """`rate` tokens/sec, up to `burst` banked. take() returns 0 when a token was taken, else the
+    seconds until one will be available (nothing is taken)."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate, self.burst = rate, max(1.0, burst)
+        self.tokens, self.stamp = self.burst, time.monotonic()
+
+    def take(self) -> float:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+def parse_rates(spec: str) -> Dict[str, float]:
+    """"gmail.com=20,*=50" -> {"gmail.com": 20.0, "*": 50.0}; 0 or absent means unlimited."""
+    rates = {}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        provider, _, rate = part.partition("=")
+        rates[provider.strip().lower()] = float(rate)
+    return rates
+
+class RateLimiter:
+    def __init__(self, rates: Dict[str, float]):
+        self._buckets = {p: TokenBucket(r, r) for p, r in rates.items() if r > 0}
+        self._lock = threading.Lock()
+
+    def provider(self, domain: str) -> str:
+        return domain if domain in self._buckets else "*"
+
+    def take(self, domain: str) -> float:
+        bucket = self._buckets.get(self.provider(domain))
+        if bucket is None:
+            return 0.0
+        with self._lock:
+            return bucket.take()
+
+class _Connection:
+    """One worker's SMTP session, opened on first use and kept across messages."""
+
+    def __init__(self):
+        self.smtp: Optional[smtplib.SMTP] = None
+        self.sent = 0
+        self.last_used = 0.0
+
+    def _usable(self) -> bool:
+        if self.sent >= settings.SMTP_MAX_MESSAGES_PER_CONNECTION:
+            return False
+        if time.monotonic() - self.last_used > settings.SMTP_IDLE_CHECK_SECONDS:
+            try:
+                return self.smtp.noop()[0] == 250
+            except (smtplib.SMTPException, OSError):
+                return False
+        return True
+
+    def send(self, to: str, data: str):
+        if self.smtp is not None and not self._usable():
+            self.close()
+        if self.smtp is None:
+            self.smtp = smtplib.SMTP(settings.SMTP_HOST, settings.SMTP_PORT, timeout=settings.SMTP_TIMEOUT_SECONDS)
+            self.sent = 0
+            CONNECTIONS.inc()
+        try:
+            self.smtp.sendmail(settings.FROM_EMAIL, [to], data)
+        except OSError as exc:  # smtplib's errors included
+            # A refused recipient or message leaves the session usable; a disconnect or timeout doesn't
+            if not isinstance(exc, (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused)):
+                self.close()
+            raise
+        finally:
+            self.last_used = time.monotonic()
+        self.sent += 1
+
+    def close(self):
+        if self.smtp is not None:
+            try:
+                self.smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                self.smtp.close()
+            self.smtp = None
+
+def _smtp_code(exc: Exception) -> Optional[int]:
+    if isinstance(exc, smtplib.SMTPResponseException):
+        return exc.smtp_code
+    if isinstance(exc, smtplib.SMTPRecipientsRefused) and exc.recipients:
+        return next(iter(exc.recipients.values()))[0]
+    return None
+
+def _retryable(exc: Exception) -> bool:
+    code = _smtp_code(exc)
+    if code is not None:
+        return 400 <= code < 500
+    return isinstance(exc, OSError)  # disconnects, timeouts, refused connections
+
+def backoff(attempt: int) -> float:
+    """Exponential with full jitter: 1, 2, 4 ... x SMTP_RETRY_BACKOFF_SECONDS, capped."""
+    ceiling = min(settings.SMTP_RETRY_MAX_BACKOFF_SECONDS, settings.SMTP_RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1))
+    return random.uniform(ceiling / 2, ceiling)
+
+def render(email: Email) -> str:
+    msg = MIMEText(email.body)
+    msg["Subject"] = email.subject
+    msg["From"] = settings.FROM_EMAIL
+    msg["To"] = email.to
+    msg["Date"] = formatdate(localtime=True)
+    return msg.as_string()
+
+# --- engine state ---
+_lock = threading.Lock()
+_cv = threading.Condition()
+_ready: "queue.Queue[Optional[Email]]" = queue.Queue()
+_delayed: List[tuple] = []  # heap of (due, seq, email)
+_seq = itertools.count()
+_stop = threading.Event()
+_threads: List[threading.Thread] = []
+_limiter: Optional[RateLimiter] = None
+_outstanding = 0  # submitted, not yet sent or failed
+
+def _finish(email: Email, exc: Optional[BaseException]):
+    global _outstanding
+    with _lock:
+        _outstanding -= 1
+    if exc is None:
+        email.future.set_result(True)
+    else:
+        email.future.set_exception(exc)
+
+def _defer(email: Email, delay: float):
+    with _cv:
+        heapq.heappush(_delayed, (time.monotonic() + delay, next(_seq), email))
+        DELAYED.set(len(_delayed))
+        _cv.notify()
+
+def _deliver(conn: _Connection, email: Email):
+    started = time.perf_counter()
+    try:
+        conn.send(email.to, render(email))
+    except Exception as exc:
+        email.attempt += 1
+        if _retryable(exc) and email.attempt < settings.SMTP_MAX_ATTEMPTS:
+            EMAILS.labels("retried").inc()
+            log.warning("email to %s failed (attempt %d): %s; retrying", email.to, email.attempt, exc)
+            _defer(email, backoff(email.attempt))
+        else:
+            EMAILS.labels("failed").inc()
+            log.error("email to %s (%r) not delivered after %d attempt(s): %s",
+                      email.to, email.subject, email.attempt, exc)
+            _finish(email, exc)
+        return
+    SEND_SECONDS.observe(time.perf_counter() - started)
+    EMAILS.labels("sent").inc()
+    _finish(email, None)
+
+def _worker():
+    conn = _Connection()
+    try:
+        while True:
+            email = _ready.get()
+            if email is None:
+                return
+            QUEUE_DEPTH.set(_ready.qsize())
+            wait = _limiter.take(email.domain)
+            if wait:
+                THROTTLED.labels(_limiter.provider(email.domain)).inc()
+                _defer(email, wait)
+                continue
+            _deliver(conn, email)
+    finally:
+        conn.close()
+
+def _timer():
+    # Moves due messages from the delay heap back onto the ready queue
+    while not _stop.is_set():
+        with _cv:
+            now = time.monotonic()
+            if not _delayed or _delayed[0][0] > now:
+                _cv.wait(min(1.0, _delayed[0][0] - now) if _delayed else 1.0)
+                continue
+            due = []
+            while _delayed and _delayed[0][0] <= now:
+                due.append(heapq.heappop(_delayed)[2])
+            DELAYED.set(len(_delayed))
+        for email in due:
+            _ready.put(email)
+
+def start():
+    global _ready, _limiter
+    with _lock:
+        if _threads:
+            return
+        _stop.clear()
+        _ready = queue.Queue(maxsize=settings.EMAIL_QUEUE_SIZE)
+        _limiter = RateLimiter(parse_rates(settings.SMTP_PROVIDER_RATES))
+        _threads.append(threading.Thread(target=_timer, daemon=True, name="mail-timer"))
+        _threads.extend(threading.Thread(target=_worker, daemon=True, name=f"mail-{n}")
+                        for n in range(settings.SMTP_WORKERS))
+        for t in _threads:
+            t.start()
+
+def submit(to: str, subject: str, body: str) -> Future:
+    """Queue an email; returns a Future that resolves when it is delivered or finally fails.
+    Blocks (backpressure on the caller) while EMAIL_QUEUE_SIZE messages are already waiting."""
+    global _outstanding
+    start()
+    email = Email(to, subject, body)
+    with _lock:
+        _outstanding += 1
+    _ready.put(email)
+    QUEUE_DEPTH.set(_ready.qsize())
+    return email.future
+
+def send(to: str, subject: str, body: str, timeout: Optional[float] = None):
+    """Queue an email and wait for the outcome; raises the last SMTP error if it was not delivered."""
+    submit(to, subject, body).result(timeout)
+
+def close(timeout: Optional[float] = None):
+    """Deliver what is outstanding (up to EMAIL_SHUTDOWN_SECONDS), then close every connection."""
+    deadline = time.monotonic() + (settings.EMAIL_SHUTDOWN_SECONDS if timeout is None else timeout)
+    while _outstanding and time.monotonic() < deadline:
+        time.sleep(0.05)
+    with _lock:
+        threads = list(_threads)
+        _threads.clear()
+    if not threads:
+        return
+    _stop.set()
+    with _cv:
+        _cv.notify_all()
+    workers = [t for t in threads if t.name != "mail-timer"]
+    # Sentinels go after whatever is still queued; a worker exits when it reaches one
+    for _ in workers:
+        _ready.put(None)
+    for t in threads:
+        t.join(timeout=max(0.1, deadline - time.monotonic()))
+    with _cv:
+        lost = [entry[2] for entry in _delayed]
+        _delayed.clear()
+        DELAYED.set(0)
+    if _outstanding:
+        log.error("mailer closed with %d email(s) undelivered", _outstanding)
+    for email in lost:
+        _finish(email, RuntimeError("mailer closed before delivery"))
@@ -0,0 +1,38 @@
+import os
+from functools import lru_cache
+from string import Template
+from typing import Tuple
+from app.core.config import settings
+
+# Email templates live in app/templates/<name>.txt (or EMAIL_TEMPLATE_DIR): a "Subject: ..." first
+# line, then the body, both string.Template. Files are read and compiled once; rendered
+# (subject, body) pairs are kept in an LRU of EMAIL_RENDER_CACHE_SIZE, since a digest re-renders
+# the same event lines and redelivered events render identically.
+
+_DEFAULTS = {"amount_cents": "?", "tracking_number": "TBA"}
+
+def template_dir() -> str:
+    return settings.EMAIL_TEMPLATE_DIR or os.path.join(os.path.dirname(os.path.dirname(__file__)), "templates")
+
+@lru_cache(maxsize=None)
+def load(name: str) -> Tuple[Template, Template]:
+    with open(os.path.join(template_dir(), f"{name}.txt"), encoding="utf-8") as f:
+        first, _, body = f.read().partition("\n")
+    if not first.startswith("Subject:"):
+        raise ValueError(f"template {name} must start with a 'Subject:' line")
+    return Template(first[len("Subject:"):].strip()), Template(body.rstrip("\n"))
+
+@lru_cache(maxsize=settings.EMAIL_RENDER_CACHE_SIZE)
+def _render(name: str, fields: Tuple[Tuple[str, str], ...]) -> Tuple[str, str]:
+    subject, body = load(name)
+    values = dict(_DEFAULTS, **dict(fields))
+    return subject.safe_substitute(values), body.safe_substitute(values)
+
+def render(name: str, **fields) -> Tuple[str, str]:
+    """(subject, body) for template `name`; missing amount/tracking fall back to "?"/"TBA"."""
+    return _render(name, tuple(sorted((k, str(v)) for k, v in fields.items() if v is not None)))
+
+def clear():
+    """Forget compiled and rendered templates (e.g. after editing the files)."""
+    load.cache_clear()
+    _render.cache_clear()
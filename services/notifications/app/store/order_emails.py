@@ -0,0 +1,124 @@
+import logging, threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
+import httpx
+from prometheus_client import Counter, Gauge
+from redis import Redis, RedisError
+from app.core.config import settings
+from app.core.http import get_client
+
+log = logging.getLogger(__name__)
+
+# order_id -> user_email, for events that don't carry the email (three tiers, each filling the ones above):
+#   1. in-process LRU, at most ORDER_EMAIL_CACHE_SIZE entries
+#   2. Redis  notifications:order_email:{order_id}  (ORDER_EMAIL_TTL_SECONDS), survives restarts
+#   3. the order service, POST /order/v1/orders/emails, one call per _LOOKUP_CHUNK remaining misses
+
+LOOKUPS = Counter("notifications_order_email_lookups_total", "order_id -> email lookups by where they were answered",
+                  ["result"])  # lru, redis, order_service, not_found, unavailable
+ENTRIES = Gauge("notifications_order_email_cache_entries", "Entries in the in-process order email LRU")
+
+# The order service answers at most this many ids per call (more is a 422)
+_LOOKUP_CHUNK = 1000
+
+_lru: "OrderedDict[int, str]" = OrderedDict()
+_lock = threading.Lock()
+_redis: Redis | None = None
+
+class LookupUnavailable(Exception):
+    """The order service couldn't be asked about `order_ids`; `found` holds what was answered anyway."""
+
+    def __init__(self, order_ids: List[int], found: Dict[int, str]):
+        super().__init__(f"order email lookup unavailable for {len(order_ids)} order(s)")
+        self.order_ids, self.found = order_ids, found
+
+def redis_client() -> Redis:
+    # One client (and connection pool) per process; Redis clients are thread-safe
+    global _redis
+    if _redis is None:
+        _redis = Redis.from_url(settings.REDIS_URL, decode_responses=True)
+    return _redis
+
+def _key(order_id: int) -> str:
+    return f"notifications:order_email:{order_id}"
+
+def _lru_put(found: Dict[int, str]):
+    with _lock:
+        for oid, email in found.items():
+            _lru[oid] = email
+            _lru.move_to_end(oid)
+        while len(_lru) > settings.ORDER_EMAIL_CACHE_SIZE:
+            _lru.popitem(last=False)
+        ENTRIES.set(len(_lru))
+
+def _redis_put(found: Dict[int, str]):
+    try:
+        pipe = redis_client().pipeline(transaction=False)
+        for oid, email in found.items():
+            pipe.set(_key(oid), email, ex=settings.ORDER_EMAIL_TTL_SECONDS)
+        pipe.execute()
+    except RedisError:
+        log.warning("order email cache write failed", exc_info=True)
+
+def remember(found: Dict[int, str]):
+    """Learned from order.created events: cached in the LRU and in Redis (one pipeline)."""
+    found = {int(oid): email for oid, email in found.items()}
+    _lru_put(found)
+    _redis_put(found)
+
+def lookup(order_ids: Iterable[int]) -> Dict[int, str]:
+    """Emails for many orders; ids the order service doesn't know are absent. Raises LookupUnavailable
+    when it can't be asked, so the caller can retry instead of treating those orders as unknown."""
+    wanted = {int(oid) for oid in order_ids}
+    found: Dict[int, str] = {}
+    with _lock:
+        for oid in wanted:
+            email = _lru.get(oid)
+            if email is not None:
+                _lru.move_to_end(oid)
+                found[oid] = email
+    LOOKUPS.labels("lru").inc(len(found))
+    misses = [oid for oid in wanted if oid not in found]
+    if not misses:
+        return found
+
+    try:
+        from_redis = {oid: email for oid, email in zip(misses, redis_client().mget([_key(o) for o in misses])) if email}
+    except RedisError:
+        log.warning("order email cache read failed", exc_info=True)
+        from_redis = {}
+    LOOKUPS.labels("redis").inc(len(from_redis))
+    _lru_put(from_redis)
+    found.update(from_redis)
+    misses = [oid for oid in misses if oid not in from_redis]
+    if not misses:
+        return found
+
+    from_orders: Dict[int, str] = {}
+    unavailable: List[int] = []
+    for start in range(0, len(misses), _LOOKUP_CHUNK):
+        chunk = misses[start:start + _LOOKUP_CHUNK]
+        try:
+            resp = get_client("order", settings.ORDER_BASE).post(
+                "/order/v1/orders/emails", json={"order_ids": chunk},
+                headers={"X-Internal-Key": settings.SVC_INTERNAL_KEY}, idempotent=True,
+            )
+            resp.raise_for_status()
+            from_orders.update({int(oid): email for oid, email in resp.json()["emails"].items()})
+        except (httpx.HTTPError, KeyError, ValueError):
+            log.warning("order email lookup for %d order(s) failed", len(chunk), exc_info=True)
+            unavailable += chunk
+    LOOKUPS.labels("order_service").inc(len(from_orders))
+    LOOKUPS.labels("not_found").inc(len(misses) - len(from_orders) - len(unavailable))
+    LOOKUPS.labels("unavailable").inc(len(unavailable))
+    _lru_put(from_orders)
+    _redis_put(from_orders)
+    found.update(from_orders)
+    if unavailable:
+        raise LookupUnavailable(unavailable, found)
+    return found
+
+def get(order_id: Optional[int]) -> Optional[str]:
+    if not order_id:
+        return None
+    return lookup([order_id]).get(int(order_id))
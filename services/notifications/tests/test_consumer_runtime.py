@@ -0,0 +1,158 @@
+import smtplib, threading, time
+from collections import namedtuple
+from concurrent.futures import Future
+import pytest
+from kafka.structs import TopicPartition
+from app.core.config import settings
+from app.kafka import consumer
+from app.kafka.runtime import KeyedWorkers, OffsetTracker
+from app.services import digest, mailer
+
+Record = namedtuple("Record", "topic partition offset value")
+
+def _wait(cond, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not cond() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert cond()
+
+def test_offsets_commit_only_up_to_the_lowest_unfinished():
+    t = OffsetTracker()
+    for off in (10, 11, 12, 13):
+        t.add(off)
+    t.done(11)
+    t.done(13)
+    assert t.committable() == 10 and len(t) == 2
+    t.done(10)
+    assert t.committable() == 12
+    t.done(12)
+    assert t.committable() == 14 and len(t) == 0
+
+def test_same_key_stays_ordered_and_failures_are_dead_lettered(monkeypatch):
+    monkeypatch.setattr(settings, "CONSUMER_MAX_ATTEMPTS", 3)
+    monkeypatch.setattr(settings, "CONSUMER_RETRY_BACKOFF_SECONDS", 0.001)
+    handled, attempts, dead = [], [], []
+    lock = threading.Lock()
+
+    def run(rec):
+        def go():
+            if rec.value["poison"]:
+                attempts.append(rec.offset)
+                raise RuntimeError("smtp down")
+            with lock:
+                handled.append((rec.value["order_id"], rec.offset))
+        return go
+
+    workers = KeyedWorkers(4, lambda rec, exc: dead.append((rec.offset, str(exc))))
+    records = [Record("payment.events", 0, n, {"order_id": n % 5, "poison": n == 7}) for n in range(40)]
+    for rec in records:
+        workers.dispatch(rec, rec.value["order_id"], run(rec))
+    _wait(lambda: workers.in_flight() == 0)
+    workers.close(1)
+
+    assert dead == [(7, "smtp down")] and attempts == [7, 7, 7]
+    for key in range(5):
+        offsets = [off for k, off in handled if k == key]
+        assert offsets == sorted(offsets)
+    assert workers.offsets() == {TopicPartition("payment.events", 0): (40, "", -1)}
+    assert workers.offsets() == {}  # nothing new to commit
+
+def test_failed_delivery_is_retried_before_the_orders_queued_events(monkeypatch):
+    monkeypatch.setattr(settings, "CONSUMER_RETRY_BACKOFF_SECONDS", 0.001)
+    runs, gate, first = [], threading.Event(), Future()
+
+    def job(name, results=()):
+        results = iter(results)
+        def go():
+            runs.append(name)
+            if name == "X":
+                gate.wait(5)
+            return next(results, None)
+        return go
+
+    done = Future()
+    done.set_result(None)
+    workers = KeyedWorkers(1, lambda rec, exc: None)
+    workers.dispatch(Record("order.events", 0, 0, {}), 1, job("A", [first, done]))  # email pending
+    workers.dispatch(Record("order.events", 0, 1, {}), 2, job("X"))  # another order, keeps the worker busy
+    workers.dispatch(Record("order.events", 0, 2, {}), 1, job("B"))  # same order as A, still queued
+    _wait(lambda: runs == ["A", "X"])
+    first.set_exception(smtplib.SMTPDataError(554, b"rejected"))  # A's email fails while X runs
+    gate.set()
+    _wait(lambda: workers.in_flight() == 0)
+    workers.close(1)
+    # A's retry went ahead of B, not behind it
+    assert runs == ["A", "X", "A", "B"]
+    assert workers.offsets() == {TopicPartition("order.events", 0): (3, "", -1)}
+
+@pytest.fixture
+def mail(monkeypatch):
+    """The real digest stage and mailer, with SMTP replaced by a list of outcomes per send."""
+    sent, replies = [], []
+    def send(conn, to, data):
+        sent.append(to)
+        if replies:
+            raise replies.pop(0)
+    monkeypatch.setattr(mailer._Connection, "send", send)
+    monkeypatch.setattr(settings, "SMTP_PROVIDER_RATES", "*=0")
+    monkeypatch.setattr(settings, "CONSUMER_RETRY_BACKOFF_SECONDS", 0.001)
+    monkeypatch.setattr(consumer.order_emails, "remember", lambda found: None)
+    monkeypatch.setattr(digest, "_buffer", None)
+    yield sent, replies
+    digest.close()
+    mailer.close(timeout=1)
+
+def created(offset, order_id=3):
+    return Record("order.events", 1, offset, {"type": "order.created", "order_id": order_id, "user_email": "a@x.com"})
+
+def test_failed_email_is_retried_then_dead_lettered(mail, monkeypatch):
+    sent, replies = mail
+    monkeypatch.setattr(settings, "DIGEST_WINDOW_SECONDS", 0)
+    monkeypatch.setattr(settings, "CONSUMER_MAX_ATTEMPTS", 3)
+    replies.extend([smtplib.SMTPDataError(554, b"rejected")] * 3)
+    dead = []
+    workers = KeyedWorkers(2, lambda rec, exc: dead.append((rec.offset, type(exc).__name__)))
+    consumer.dispatch([created(5)], workers)
+    _wait(lambda: workers.in_flight() == 0)
+    workers.close(1)
+    # the SMTP error came back to the worker: three sends, then the DLQ, then the offset moves on
+    assert sent == ["a@x.com"] * 3 and dead == [(5, "SMTPDataError")]
+    assert workers.offsets()[TopicPartition("order.events", 1)].offset == 6
+
+def buffered() -> int:
+    return sum(len(entry.items) for entry in digest._buffer._pending.values()) if digest._buffer else 0
+
+def test_offset_waits_for_the_buffered_email(mail, monkeypatch):
+    sent, replies = mail
+    monkeypatch.setattr(settings, "DIGEST_WINDOW_SECONDS", 30)
+    replies.append(smtplib.SMTPDataError(554, b"rejected"))
+    workers = KeyedWorkers(2, lambda rec, exc: None)
+    consumer.dispatch([created(5), created(6)], workers)
+    _wait(lambda: buffered() == 2)
+    assert sent == [] and workers.offsets() == {}  # handled, but the digest hasn't gone out
+    digest.flush(timeout=5)
+    # the first digest failed: both events went back to their worker and were buffered again
+    _wait(lambda: buffered() == 2)
+    assert workers.offsets() == {}
+    digest.flush(timeout=5)
+    _wait(lambda: workers.in_flight() == 0)
+    workers.close(1)
+    assert sent == ["a@x.com", "a@x.com"]
+    assert workers.offsets()[TopicPartition("order.events", 1)].offset == 7
+
+def test_malformed_records_are_dead_lettered_without_stalling_the_batch(monkeypatch):
+    handled, dead = [], []
+    monkeypatch.setattr(consumer, "resolve_emails", lambda events: {})
+    monkeypatch.setattr(consumer, "_handle", lambda ev, known: handled.append(ev["order_id"]))
+    workers = KeyedWorkers(2, lambda rec, exc: dead.append((rec.offset, str(exc))))
+    values = [{"type": "order.created", "order_id": 1}, "not an object", {"type": "payment.succeeded", "order_id": [2]},
+              {"type": ["payment.succeeded"], "order_id": 3}, {"type": "payment.succeeded", "order_id": -4},
+              {"type": "payment.succeeded", "order_id": "5"}]
+    consumer.dispatch([Record("payment.events", 0, n, v) for n, v in enumerate(values)], workers)
+    _wait(lambda: workers.in_flight() == 0)
+    workers.close(1)
+
+    assert sorted(handled, key=int) == [1, "5"]
+    assert sorted(off for off, _ in dead) == [1, 2, 3, 4]
+    assert dict(dead)[1] == "event is not an object"
+    assert workers.offsets() == {TopicPartition("payment.events", 0): (6, "", -1)}
@@ -0,0 +1,75 @@
+import smtplib
+from concurrent.futures import Future
+import pytest
+from app.core.config import settings
+from app.services import digest, templates
+
+@pytest.fixture
+def sent(monkeypatch):
+    out = []
+    def submit(to, subject, body):
+        out.append((to, subject, body))
+        done = Future()
+        done.set_result(True)
+        return done
+    monkeypatch.setattr(digest.mailer, "submit", submit)
+    return out
+
+def test_buffer_releases_a_recipient_once_its_bucket_elapses():
+    buf = digest.DigestBuffer(window=10, tick=1, max_items=20)
+    assert buf.add("a@x.com", ("payment.succeeded", {"order_id": 1}), False, now=100.2) is None
+    assert buf.add("a@x.com", ("shipping.ready", {"order_id": 1}), False, now=105) is None
+    assert buf.add("b@x.com", ("order.created", {"order_id": 2}), False, now=104) is None
+    assert buf.due(110.5) == []
+    assert [to for to, _ in buf.due(111.0)] == ["a@x.com"]
+    assert [(to, len(entry.items)) for to, entry in buf.due(115.0)] == [("b@x.com", 1)]
+    assert len(buf) == 0
+
+def test_urgent_event_flushes_pending_items_immediately():
+    buf = digest.DigestBuffer(window=10, tick=1, max_items=20)
+    buf.add("a@x.com", ("shipping.ready", {"order_id": 1}), False, now=0)
+    ready = buf.add("a@x.com", ("shipping.dispatched", {"order_id": 1}), True, now=1)
+    assert [t for t, _ in ready.items] == ["shipping.ready", "shipping.dispatched"]
+    # the stale bucket entry must not release the recipient's next window early
+    buf.add("a@x.com", ("order.created", {"order_id": 2}), False, now=5)
+    assert buf.due(12) == [] and len(buf) == 1
+
+def test_events_in_one_window_become_one_digest(sent, monkeypatch):
+    monkeypatch.setattr(settings, "DIGEST_WINDOW_SECONDS", 30)
+    monkeypatch.setattr(digest, "_buffer", None)
+    before = digest.SAVED._value.get()
+    digest.notify("c@x.com", {"type": "order.created", "order_id": 7, "amount_cents": 2599})
+    digest.notify("c@x.com", {"type": "payment.succeeded", "order_id": 7})
+    digest.notify("c@x.com", {"type": "payment.succeeded", "order_id": 7})  # redelivery
+    digest.notify("d@x.com", {"type": "shipping.dispatched", "order_id": 8, "tracking_number": "ZX1"})
+    assert sent == [("d@x.com", "Order dispatched", "Your order 8 has been dispatched. Tracking: ZX1")]
+
+    digest.close()
+    to, subject, body = sent[1]
+    assert (to, subject) == ("c@x.com", "Updates on order 7")
+    assert "- We received your order 7 for 2599 cents." in body and body.count("Payment for order 7") == 1
+    assert digest.SAVED._value.get() - before == 2
+
+def test_each_event_waits_on_the_email_that_carries_it(monkeypatch):
+    monkeypatch.setattr(settings, "DIGEST_WINDOW_SECONDS", 30)
+    monkeypatch.setattr(digest, "_buffer", None)
+    outcomes = []
+    monkeypatch.setattr(digest.mailer, "submit", lambda to, subject, body: outcomes.append(Future()) or outcomes[-1])
+    first = digest.notify("f@x.com", {"type": "order.created", "order_id": 5})
+    second = digest.notify("f@x.com", {"type": "payment.succeeded", "order_id": 5})
+    assert not first.done() and outcomes == []  # still buffered
+    assert digest.flush(timeout=0) == 2
+    outcomes[0].set_exception(smtplib.SMTPDataError(554, b"rejected"))
+    for waiter in (first, second):
+        with pytest.raises(smtplib.SMTPDataError):
+            waiter.result(0)
+    digest.close()
+
+def test_zero_window_sends_each_event_and_templates_are_cached(sent, monkeypatch):
+    monkeypatch.setattr(settings, "DIGEST_WINDOW_SECONDS", 0)
+    templates.clear()
+    for _ in range(3):
+        digest.notify("e@x.com", {"type": "shipping.ready", "order_id": 9})
+    assert [s for _, s, _ in sent] == ["Order ready to ship"] * 3
+    assert templates.load.cache_info().misses == 1
+    assert templates._render.cache_info().hits == 2
@@ -0,0 +1,82 @@
+import smtplib, socket, time
+import pytest
+from app.core.config import settings
+from app.services import mailer
+
+controller_mod = pytest.importorskip("aiosmtpd.controller")
+
+class Handler:
+    """Records messages; replies to RCPT with a queued code per address if one is set."""
+
+    def __init__(self):
+        self.messages = []
+        self.sessions = set()
+        self.rcpt_replies = {}
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        replies = self.rcpt_replies.get(address)
+        if replies:
+            return replies.pop(0)
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        self.sessions.add(id(session))
+        self.messages.append((envelope.rcpt_tos[0], envelope.content))
+        return "250 Message accepted"
+
+@pytest.fixture
+def smtp(monkeypatch):
+    handler = Handler()
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    ctl = controller_mod.Controller(handler, hostname="127.0.0.1", port=port)
+    ctl.start()
+    monkeypatch.setattr(settings, "SMTP_HOST", "127.0.0.1")
+    monkeypatch.setattr(settings, "SMTP_PORT", port)
+    monkeypatch.setattr(settings, "SMTP_WORKERS", 4)
+    monkeypatch.setattr(settings, "SMTP_PROVIDER_RATES", "*=0")
+    monkeypatch.setattr(settings, "SMTP_RETRY_BACKOFF_SECONDS", 0.01)
+    yield handler
+    mailer.close(timeout=5)
+    ctl.stop()
+
+def test_connections_are_reused(smtp):
+    opened = mailer.CONNECTIONS._value.get()
+    futures = [mailer.submit(f"user{i}@example.com", "Hi", f"Body {i}") for i in range(60)]
+    assert all(f.result(10) for f in futures)
+    assert len(smtp.messages) == 60
+    # one connection per worker at most, not one per email
+    assert mailer.CONNECTIONS._value.get() - opened <= settings.SMTP_WORKERS
+    assert len(smtp.sessions) <= settings.SMTP_WORKERS
+
+def test_transient_failure_is_retried_and_permanent_is_not(smtp):
+    smtp.rcpt_replies["slow@example.com"] = ["451 Try again later", "421 Busy"]
+    smtp.rcpt_replies["gone@example.com"] = ["550 No such user"]
+    ok = mailer.submit("slow@example.com", "Hi", "eventually")
+    bad = mailer.submit("gone@example.com", "Hi", "never")
+    assert ok.result(10) is True
+    with pytest.raises(smtplib.SMTPRecipientsRefused):
+        bad.result(10)
+    assert [to for to, _ in smtp.messages] == ["slow@example.com"]
+
+def test_provider_rate_limit(smtp, monkeypatch):
+    monkeypatch.setattr(settings, "SMTP_PROVIDER_RATES", "slow.example=10,*=0")
+    t0 = time.monotonic()
+    futures = [mailer.submit(f"u{i}@slow.example", "Hi", "x") for i in range(15)]
+    futures += [mailer.submit(f"u{i}@fast.example", "Hi", "x") for i in range(15)]
+    for f in futures[15:]:
+        f.result(10)
+    fast_done = time.monotonic() - t0
+    for f in futures[:15]:
+        f.result(10)
+    # 10 banked tokens, then 10/s: the last 5 wait about half a second; other domains don't
+    assert time.monotonic() - t0 >= 0.4
+    assert fast_done < 0.4
+
+def test_token_bucket():
+    bucket = mailer.TokenBucket(rate=2, burst=2)
+    assert bucket.take() == 0 and bucket.take() == 0
+    assert 0.4 < bucket.take() <= 0.5
+    assert mailer.parse_rates("Gmail.com=20, *=50") == {"gmail.com": 20.0, "*": 50.0}
@@ -0,0 +1,101 @@
+import fakeredis, httpx, pytest
+from types import SimpleNamespace
+from app.core.config import settings
+from app.kafka import consumer
+from app.store import order_emails
+
+class FakeOrders:
+    def __init__(self, emails):
+        self.emails, self.calls, self.down = emails, [], False
+    def post(self, url, json=None, headers=None, idempotent=None):
+        self.calls.append(sorted(json["order_ids"]))
+        if self.down:
+            raise httpx.ConnectError("order service down")
+        if len(json["order_ids"]) > 1000:
+            return httpx.Response(422, request=httpx.Request("POST", url))
+        found = {str(o): self.emails[o] for o in json["order_ids"] if o in self.emails}
+        return httpx.Response(200, json={"emails": found}, request=httpx.Request("POST", url))
+
+@pytest.fixture
+def orders(monkeypatch):
+    monkeypatch.setattr(order_emails, "_redis", fakeredis.FakeRedis(decode_responses=True))
+    monkeypatch.setattr(order_emails, "_lru", order_emails.OrderedDict())
+    monkeypatch.setattr(settings, "ORDER_EMAIL_CACHE_SIZE", 3)
+    fake = FakeOrders({10: "ten@example.com", 11: "eleven@example.com"})
+    monkeypatch.setattr(order_emails, "get_client", lambda name, base: fake)
+    return fake
+
+def test_lru_is_bounded_and_redis_backs_it(orders):
+    order_emails.remember({n: f"u{n}@example.com" for n in range(1, 6)})
+    assert list(order_emails._lru) == [3, 4, 5]
+    # evicted from the LRU, still in Redis with a TTL; no order-service call
+    assert order_emails.lookup([1, 5]) == {1: "u1@example.com", 5: "u5@example.com"}
+    assert orders.calls == []
+    assert 0 < order_emails.redis_client().ttl("notifications:order_email:1") <= settings.ORDER_EMAIL_TTL_SECONDS
+
+def test_misses_fall_back_to_one_bulk_order_lookup(orders):
+    assert order_emails.lookup([10, 11, 12]) == {10: "ten@example.com", 11: "eleven@example.com"}
+    assert orders.calls == [[10, 11, 12]]
+    # backfilled: the next lookup is answered from the LRU
+    assert order_emails.get(10) == "ten@example.com"
+    assert orders.calls == [[10, 11, 12]]
+
+def test_large_lookups_are_split_into_chunks(orders):
+    assert order_emails.lookup(range(5, 2505)) == {10: "ten@example.com", 11: "eleven@example.com"}
+    assert [len(c) for c in orders.calls] == [1000, 1000, 500]
+
+def test_outage_raises_instead_of_reporting_not_found(orders):
+    order_emails.remember({1: "u1@example.com"})
+    orders.down = True
+    with pytest.raises(order_emails.LookupUnavailable) as err:
+        order_emails.lookup([1, 10])
+    assert err.value.order_ids == [10] and err.value.found == {1: "u1@example.com"}
+
+class InlineWorkers:
+    """Runs each dispatched job on the spot, recording the key it was routed by and what it raised."""
+    def __init__(self):
+        self.keys, self.errors = [], []
+    def dispatch(self, record, key, run):
+        self.keys.append(key)
+        try:
+            run()
+        except Exception as exc:
+            self.errors.append((key, exc, run))
+
+def test_batch_after_restart_still_sends(orders, monkeypatch):
+    sent = []
+    monkeypatch.setattr(consumer.digest, "notify", lambda to, ev: sent.append((to, ev["type"])))
+    events = [
+        {"type": "payment.succeeded", "order_id": 10},
+        {"type": "shipping.ready", "order_id": 11},
+        {"type": "shipping.dispatched", "order_id": 11, "tracking_number": "X1"},
+        {"type": "payment.succeeded", "order_id": 99},  # unknown everywhere
+    ]
+    workers = InlineWorkers()
+    consumer.dispatch([SimpleNamespace(value=ev) for ev in events], workers)
+    assert orders.calls == [[10, 11, 99]]
+    assert workers.keys == [10, 11, 11, 99]
+    assert sent == [("ten@example.com", "payment.succeeded"), ("eleven@example.com", "shipping.ready"),
+                    ("eleven@example.com", "shipping.dispatched")]
+
+def test_order_created_teaches_the_email_without_a_lookup(orders):
+    known = consumer.resolve_emails([
+        {"type": "order.created", "order_id": 12, "user_email": "twelve@example.com"},
+        {"type": "payment.succeeded", "order_id": 12},
+    ])
+    assert known == {12: "twelve@example.com"} and orders.calls == []
+
+def test_events_are_retried_while_the_order_service_is_down(orders, monkeypatch):
+    sent = []
+    monkeypatch.setattr(consumer.digest, "notify", lambda to, ev: sent.append((to, ev["type"])))
+    orders.down = True
+    workers = InlineWorkers()
+    record = SimpleNamespace(value={"type": "payment.succeeded", "order_id": 10})
+    consumer.dispatch([record], workers)
+    # the job fails (so the runtime retries, then dead-letters it) rather than finishing unsent
+    [(key, exc, retry)] = workers.errors
+    assert sent == [] and key == 10 and isinstance(exc, order_emails.LookupUnavailable)
+
+    orders.down = False
+    retry()
+    assert sent == [("ten@example.com", "payment.succeeded")]
@@ -0,0 +1,19 @@
+from alembic import op
+import sqlalchemy as sa
+
+revision = "20261019090000"
+down_revision = "20250823142909"
+
+def upgrade():
+    # Serves GET /v1/orders?mine: equality on user_email, keyset on (created_at, id) newest first
+    op.create_index(
+        'ix_orders_user_created',
+        'orders',
+        ['user_email', sa.text('created_at DESC'), sa.text('id DESC')],
+    )
+    # FK was unindexed: selectinload / cascades scanned the whole table
+    op.create_index('ix_order_items_order_id', 'order_items', ['order_id'])
+
+def downgrade():
+    op.drop_index('ix_order_items_order_id', table_name='order_items')
+    op.drop_index('ix_orders_user_created', table_name='orders')
@@ -0,0 +1,32 @@
+from alembic import op
+import sqlalchemy as sa
+
+revision = "20261019100000"
+down_revision = "20261019090000"
+
+def upgrade():
+    op.create_table(
+        'order_sagas',
+        sa.Column('order_id', sa.Integer(), sa.ForeignKey('orders.id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('state', sa.String(length=32), nullable=False, server_default='RESERVED'),
+        sa.Column('shipment_id', sa.Integer(), nullable=True),
+        sa.Column('expires_at', sa.DateTime(), nullable=False),
+        sa.Column('reserved_at', sa.DateTime(), nullable=True),
+        sa.Column('shipment_drafted_at', sa.DateTime(), nullable=True),
+        sa.Column('paid_at', sa.DateTime(), nullable=True),
+        sa.Column('committed_at', sa.DateTime(), nullable=True),
+        sa.Column('compensated_at', sa.DateTime(), nullable=True),
+        sa.Column('last_error', sa.String(length=255), nullable=False, server_default=''),
+        sa.Column('updated_at', sa.DateTime(), nullable=False, server_default=sa.text("(now() at time zone 'utc')")),
+    )
+    # Partial index: stays as small as the number of unpaid orders, not the order history
+    op.create_index(
+        'ix_order_sagas_open_expiry',
+        'order_sagas',
+        ['expires_at'],
+        postgresql_where=sa.text("state IN ('RESERVED', 'SHIPMENT_DRAFTED')"),
+    )
+
+def downgrade():
+    op.drop_index('ix_order_sagas_open_expiry', table_name='order_sagas')
+    op.drop_table('order_sagas')
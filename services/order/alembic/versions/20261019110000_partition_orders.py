@@ -0,0 +1,134 @@
+from datetime import date, datetime
+from alembic import op
+import sqlalchemy as sa
+
+revision = "20261019110000"
+down_revision = "20261019100000"
+
+MONTHS_AHEAD = 3
+
+def _add_months(d: date, n: int) -> date:
+    m = d.month - 1 + n
+    return date(d.year + m // 12, m % 12 + 1, 1)
+
+def _create_month(month: date):
+    nxt = _add_months(month, 1)
+    for parent in ("orders", "order_items"):
+        op.execute(
+            f"CREATE TABLE {parent}_{month:%Y_%m} PARTITION OF {parent} "
+            f"FOR VALUES FROM ('{month}') TO ('{nxt}')"
+        )
+
+def upgrade():
+    # Postgres requires the partition key in every unique constraint, so the keys become
+    # (id, created_at) and items carry their order's created_at for the composite FK.
+    # order_sagas can no longer reference orders(id) alone; the FK is dropped.
+    op.drop_constraint('order_sagas_order_id_fkey', 'order_sagas', type_='foreignkey')
+
+    op.rename_table('order_items', 'order_items_legacy')
+    op.rename_table('orders', 'orders_legacy')
+    op.execute("ALTER TABLE orders_legacy RENAME CONSTRAINT orders_pkey TO orders_legacy_pkey")
+    op.execute("ALTER TABLE order_items_legacy RENAME CONSTRAINT order_items_pkey TO order_items_legacy_pkey")
+    op.drop_index('ix_orders_user_created', table_name='orders_legacy')
+    op.drop_index('ix_orders_user_email', table_name='orders_legacy')
+    op.drop_index('ix_order_items_order_id', table_name='order_items_legacy')
+
+    op.execute("""
+        CREATE TABLE orders (
+            id integer NOT NULL DEFAULT nextval('orders_id_seq'),
+            user_email varchar(255) NOT NULL,
+            status varchar(32) NOT NULL DEFAULT 'CREATED',
+            total_cents bigint NOT NULL,
+            currency varchar(3) NOT NULL DEFAULT 'USD',
+            created_at timestamp NOT NULL DEFAULT (now() at time zone 'utc'),
+            updated_at timestamp NOT NULL DEFAULT (now() at time zone 'utc'),
+            PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at)
+    """)
+    op.execute("""
+        CREATE TABLE order_items (
+            id integer NOT NULL DEFAULT nextval('order_items_id_seq'),
+            order_id integer NOT NULL,
+            order_created_at timestamp NOT NULL,
+            product_id integer NOT NULL,
+            qty integer NOT NULL,
+            unit_price_cents bigint NOT NULL,
+            title_snapshot varchar(255) NOT NULL,
+            PRIMARY KEY (id, order_created_at),
+            FOREIGN KEY (order_id, order_created_at) REFERENCES orders (id, created_at) ON DELETE CASCADE
+        ) PARTITION BY RANGE (order_created_at)
+    """)
+    op.execute("ALTER SEQUENCE orders_id_seq OWNED BY orders.id")
+    op.execute("ALTER SEQUENCE order_items_id_seq OWNED BY order_items.id")
+
+    # Partitioned indexes: created on every partition, present and future
+    op.create_index('ix_orders_user_created', 'orders',
+                    ['user_email', sa.text('created_at DESC'), sa.text('id DESC')])
+    op.create_index('ix_orders_created', 'orders', [sa.text('created_at DESC'), sa.text('id DESC')])
+    op.create_index('ix_order_items_order_id', 'order_items', ['order_id'])
+
+    # One partition per month from the oldest existing order to MONTHS_AHEAD ahead, plus a
+    # default partition so a missed `app.db.partitions ensure` can't fail inserts
+    oldest = op.get_bind().execute(sa.text("SELECT min(created_at) FROM orders_legacy")).scalar()
+    today = datetime.utcnow().date()
+    month = date((oldest or today).year, (oldest or today).month, 1)
+    last = _add_months(date(today.year, today.month, 1), MONTHS_AHEAD)
+    while month <= last:
+        _create_month(month)
+        month = _add_months(month, 1)
+    op.execute("CREATE TABLE orders_default PARTITION OF orders DEFAULT")
+    op.execute("CREATE TABLE order_items_default PARTITION OF order_items DEFAULT")
+
+    op.execute("""
+        INSERT INTO orders (id, user_email, status, total_cents, currency, created_at, updated_at)
+        SELECT id, user_email, status, total_cents, currency, created_at, updated_at FROM orders_legacy
+    """)
+    op.execute("""
+        INSERT INTO order_items (id, order_id, order_created_at, product_id, qty, unit_price_cents, title_snapshot)
+        SELECT i.id, i.order_id, o.created_at, i.product_id, i.qty, i.unit_price_cents, i.title_snapshot
+        FROM order_items_legacy i JOIN orders_legacy o ON o.id = i.order_id
+    """)
+    op.drop_table('order_items_legacy')
+    op.drop_table('orders_legacy')
+
+def downgrade():
+    op.rename_table('order_items', 'order_items_partitioned')
+    op.rename_table('orders', 'orders_partitioned')
+    op.execute("ALTER TABLE orders_partitioned RENAME CONSTRAINT orders_pkey TO orders_partitioned_pkey")
+    op.execute("ALTER TABLE order_items_partitioned RENAME CONSTRAINT order_items_pkey TO order_items_partitioned_pkey")
+    op.drop_index('ix_orders_user_created', table_name='orders_partitioned')
+    op.drop_index('ix_orders_created', table_name='orders_partitioned')
+    op.drop_index('ix_order_items_order_id', table_name='order_items_partitioned')
+
+    op.create_table(
+        'orders',
+        sa.Column('id', sa.Integer(), primary_key=True, server_default=sa.text("nextval('orders_id_seq')")),
+        sa.Column('user_email', sa.String(length=255), index=True, nullable=False),
+        sa.Column('status', sa.String(length=32), nullable=False, server_default='CREATED'),
+        sa.Column('total_cents', sa.BigInteger(), nullable=False),
+        sa.Column('currency', sa.String(length=3), nullable=False, server_default='USD'),
+        sa.Column('created_at', sa.DateTime(), nullable=False, server_default=sa.text("(now() at time zone 'utc')")),
+        sa.Column('updated_at', sa.DateTime(), nullable=False, server_default=sa.text("(now() at time zone 'utc')")),
+    )
+    op.create_table(
+        'order_items',
+        sa.Column('id', sa.Integer(), primary_key=True, server_default=sa.text("nextval('order_items_id_seq')")),
+        sa.Column('order_id', sa.Integer(), sa.ForeignKey('orders.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('product_id', sa.Integer(), nullable=False),
+        sa.Column('qty', sa.Integer(), nullable=False),
+        sa.Column('unit_price_cents', sa.BigInteger(), nullable=False),
+        sa.Column('title_snapshot', sa.String(length=255), nullable=False),
+    )
+    op.execute("ALTER SEQUENCE orders_id_seq OWNED BY orders.id")
+    op.execute("ALTER SEQUENCE order_items_id_seq OWNED BY order_items.id")
+    op.execute("INSERT INTO orders SELECT id, user_email, status, total_cents, currency, created_at, updated_at FROM orders_partitioned")
+    op.execute("""
+        INSERT INTO order_items (id, order_id, product_id, qty, unit_price_cents, title_snapshot)
+        SELECT id, order_id, product_id, qty, unit_price_cents, title_snapshot FROM order_items_partitioned
+    """)
+    op.drop_table('order_items_partitioned')
+    op.drop_table('orders_partitioned')
+    op.create_index('ix_orders_user_created', 'orders',
+                    ['user_email', sa.text('created_at DESC'), sa.text('id DESC')])
+    op.create_index('ix_order_items_order_id', 'order_items', ['order_id'])
+    op.create_foreign_key('order_sagas_order_id_fkey', 'order_sagas', 'orders', ['order_id'], ['id'], ondelete='CASCADE')
@@ -1,14 +1,25 @@
-from fastapi import APIRouter, Depends, HTTPException, Header
-from typing import List, Optional
-from pydantic import BaseModel, EmailStr
-from redis import Redis
-import httpx, os
+from fastapi import APIRouter, Depends, HTTPException, Header, Query, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from typing import List, Literal, Optional
+from pydantic import BaseModel, EmailStr, Field
+from redis import Redis, RedisError
+from datetime import datetime
+from sqlalchemy import select, update
 from sqlalchemy.orm import Session
 from app.db.session import SessionLocal
 from app.db import models
 from app.core.config import settings
-from app.kafka.producer import send
-import jwt, json
+from app.core.idempotency import run_idempotent
+from app.services.checkout import CartChanged, revalidate_cart, cart_total, reserve_inventory, release_inventory, create_shipment, emit_order_created, request_checkout
+from app.services import saga
+from app.services.orders import create_order, created_bounds, emails_for, list_orders, load_items
+from app.store.cart_snapshot import checkout_cart, apply_cart_changes
+from app.store.order_view import VIEW_READS, get_view, store_order
+from app.store.order_events import get_hub, stream_order_events
+import jwt, logging
+
+log = logging.getLogger(__name__)
 
 router = APIRouter()
 
@@ -31,8 +42,14 @@ def get_identity_dep(authorization: str | None = Header(default=None, alias="Aut
         raise HTTPException(status_code=401, detail="Invalid access token")
     return payload
 
+_redis: Redis | None = None
+
 def redis_client() -> Redis:
-    return Redis.from_url(settings.REDIS_URL, decode_responses=True)
+    # One client (and connection pool) per process; Redis clients are thread-safe
+    global _redis
+    if _redis is None:
+        _redis = Redis.from_url(settings.REDIS_URL, decode_responses=True)
+    return _redis
 
 # --- New body model for shipping details ---
 class ShippingAddress(BaseModel):
@@ -47,108 +64,196 @@ class CheckoutResponse(BaseModel):
     status: str
     total_cents: int
     currency: str
+    status_url: str | None = None
 
 @router.post("/v1/orders/checkout", response_model=CheckoutResponse)
-def checkout(payload: ShippingAddress, identity: dict = Depends(get_identity_dep), db: Session = Depends(get_db)):
+def checkout(
+    payload: ShippingAddress,
+    response: Response,
+    mode: Literal["sync", "async"] | None = None,
+    identity: dict = Depends(get_identity_dep),
+    db: Session = Depends(get_db),
+    idempotency_key: str | None = Header(default=None, alias="Idempotency-Key"),
+):
     email = identity.get("sub")
-    # Read cart from Redis
     r = redis_client()
-    key = f"cart:{email}"
-    raw = r.hgetall(key)  # {product_id: item_json}
-    if not raw:
-        raise HTTPException(status_code=400, detail="Cart is empty")
-
-    items = []
-    total = 0
-    for _, v in raw.items():
-        it = json.loads(v)
-        items.append(it)
-        total += int(it["qty"]) * int(it["unit_price_cents"])
-
-    # Reserve inventory via Catalog internal API
-    reserve_req = {"items": [{"product_id": it["product_id"], "qty": it["qty"]} for it in items]}
+    run = _accept_checkout if (mode or settings.CHECKOUT_MODE) == "async" else _checkout
     try:
-        with httpx.Client(timeout=5.0) as client:
-            resp = client.post(
-                f"{settings.CATALOG_BASE}/catalog/v1/inventory/reserve",
-                json=reserve_req,
-                headers={"X-Internal-Key": settings.SVC_INTERNAL_KEY},
-            )
-            if resp.status_code != 200:
-                raise HTTPException(status_code=resp.status_code, detail=resp.text)
-    except httpx.RequestError:
-        raise HTTPException(status_code=503, detail="Catalog unavailable")
-
-    # Create order in DB
-    order = models.Order(user_email=email, status="CREATED", total_cents=total, currency="USD")
-    db.add(order); db.commit(); db.refresh(order)
-    for it in items:
-        oi = models.OrderItem(
-            order_id=order.id,
-            product_id=it["product_id"],
-            qty=it["qty"],
-            unit_price_cents=it["unit_price_cents"],
-            title_snapshot=it["title"],
+        body, replayed = run_idempotent(
+            r, f"checkout:{email}", idempotency_key, payload.model_dump(),
+            lambda: run(payload, email, r, db),
         )
-        db.add(oi)
-    db.commit()
+    except CartChanged as exc:
+        # Cart is restored by now; bring it up to date so a resubmit sees catalog's prices
+        apply_cart_changes(r, email, exc.updates, exc.removals)
+        raise HTTPException(status_code=409, detail=exc.report)
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    if body.get("status") == "PENDING":
+        response.status_code = 202
+        response.headers["Location"] = body["status_url"]
+    return body
 
-    # Create shipment in Shipping service (draft: PENDING_PAYMENT)
-    try:
-        with httpx.Client(timeout=5.0) as client:
-            sresp = client.post(
-                f"{settings.SHIPPING_BASE}/shipping/v1/shipments",
-                json={
-                    "order_id": order.id,
-                    "user_email": email,
-                    "address_line1": payload.address_line1,
-                    "address_line2": payload.address_line2 or "",
-                    "city": payload.city,
-                    "country": payload.country,
-                    "postcode": payload.postcode,
-                },
-            )
-            if sresp.status_code >= 400:
-                raise HTTPException(status_code=502, detail="Shipping create failed")
-    except httpx.RequestError:
-        raise HTTPException(status_code=503, detail="Shipping unavailable")
-
-    # Emit event
-    send(
-        topic="order.events",
-        key=str(order.id),
-        value={
-            "type": "order.created",
-            "order_id": order.id,
-            "user_email": email,
-            "amount_cents": total,
-            "items": [
-                {
-                    "product_id": it["product_id"],
-                    "qty": it["qty"],
-                    "unit_price_cents": it["unit_price_cents"],
-                }
-                for it in items
-            ],
-        },
-    )
+def _checkout(payload: ShippingAddress, email: str, r: Redis, db: Session) -> dict:
+    # Cart is frozen + locked for the whole checkout; cleared on success, restored on failure
+    with checkout_cart(r, email) as cart:
+        items = cart.items
+        revalidate_cart(items)
+        total = cart_total(items)
+        reserve_inventory(items)
 
-    return CheckoutResponse(order_id=order.id, status=order.status, total_cents=order.total_cents, currency=order.currency)
+        # Create order + items + saga in DB (one transaction, bulk item insert)
+        try:
+            order = create_order(db, email, items, total)
+            order_id, order_status, currency, created_at = order.id, order.status, order.currency, order.created_at
+            saga.begin(db, order_id)
+            cart.hold()  # lock lapsed: another attempt may own this cart now, don't order it twice
+            db.commit()
+        except Exception:
+            db.rollback()
+            try:
+                release_inventory(items)
+            except Exception:
+                # Surface the original error; the stuck reservation is logged for manual cleanup
+                log.exception("releasing reserved stock failed after checkout error for %s", email)
+            raise
 
-from sqlalchemy import select
+        try:
+            cart.hold()
+            shipment_id = create_shipment(order_id, email, payload.model_dump())
+        except HTTPException:
+            saga.abort(db, order_id, "shipment_failed")
+            raise
+        saga.shipment_drafted(db, order_id, shipment_id)
+        db.commit()
+        emit_order_created(order_id, email, total, items, currency, created_at)
 
-@router.get("/v1/orders/{order_id}")
-def get_order(order_id: int, db: Session = Depends(get_db)):
-    obj = db.get(models.Order, order_id)
-    if not obj:
-        raise HTTPException(status_code=404, detail="Order not found")
+    return CheckoutResponse(order_id=order_id, status=order_status, total_cents=total, currency=currency).model_dump()
+
+def _accept_checkout(payload: ShippingAddress, email: str, r: Redis, db: Session) -> dict:
+    """Async mode: persist a PENDING order, hand the slow steps to the checkout workers."""
+    with checkout_cart(r, email) as cart:
+        items = cart.items
+        revalidate_cart(items)
+        total = cart_total(items)
+        order = create_order(db, email, items, total, status="PENDING")
+        order_id, currency = order.id, order.currency
+        cart.hold()
+        db.commit()
+
+        try:
+            request_checkout(order_id, email, total, items, payload.model_dump())
+        except Exception:
+            # No command, no saga: nothing would ever settle this order. Fail it here (no stock is
+            # reserved yet); re-raising restores the cart
+            try:
+                db.execute(
+                    update(models.Order)
+                    .where(models.Order.id == order_id, models.Order.status == "PENDING", *created_bounds(db, [order_id]))
+                    .values(status="FAILED", updated_at=datetime.utcnow())
+                )
+                db.commit()
+            except Exception:
+                db.rollback()
+                log.exception("order %s left PENDING after its checkout command failed to publish", order_id)
+            raise
+
+    return CheckoutResponse(
+        order_id=order_id, status="PENDING", total_cents=total, currency=currency,
+        status_url=f"/order/v1/orders/{order_id}",
+    ).model_dump()
+
+def _order_out(obj: models.Order) -> dict:
     return {
         "id": obj.id,
         "status": obj.status,
         "total_cents": obj.total_cents,
         "currency": obj.currency,
+        "created_at": obj.created_at.isoformat() if obj.created_at else None,
         "items": [
             {"product_id": it.product_id, "qty": it.qty, "unit_price_cents": it.unit_price_cents}
             for it in obj.items
         ],
     }
+
+@router.get("/v1/orders")
+def list_my_orders(
+    mine: bool = True,
+    status: Optional[List[str]] = Query(default=None),
+    limit: int = Query(default=20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    identity: dict = Depends(get_identity_dep),
+    db: Session = Depends(get_db),
+):
+    if not mine and identity.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="Admin only")
+    email = identity.get("sub") if mine else None
+    try:
+        rows, next_cursor = list_orders(db, email, status, limit, cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return {"items": [_order_out(o) for o in rows], "next_cursor": next_cursor}
+
+def require_internal(x_internal_key: str | None = Header(default=None, alias="X-Internal-Key")):
+    if not x_internal_key or x_internal_key != settings.SVC_INTERNAL_KEY:
+        raise HTTPException(status_code=403, detail="Internal callers only")
+
+class EmailLookup(BaseModel):
+    order_ids: List[int] = Field(min_length=1, max_length=1000)
+
+@router.post("/v1/orders/emails")
+def lookup_emails(payload: EmailLookup, _=Depends(require_internal), db: Session = Depends(get_db)):
+    """Internal: order_id -> user_email for many orders at once (notifications' cache misses).
+    Unknown ids are simply absent."""
+    found = emails_for(db, set(payload.order_ids))
+    return {"emails": {str(oid): email for oid, email in found.items()}}
+
+def _authorized_view(order_id: int, identity: dict, db: Session) -> dict:
+    # Read model first (kept current by app/kafka/projector.py); Postgres only on a miss
+    r = redis_client()
+    try:
+        view = get_view(r, order_id)
+    except RedisError:
+        r, view = None, None
+    if view is not None:
+        VIEW_READS.labels("redis").inc()
+    else:
+        VIEW_READS.labels("db").inc()
+        obj = db.scalars(
+            select(models.Order).where(models.Order.id == order_id, *created_bounds(db, [order_id]))
+        ).one_or_none()
+        if obj:
+            load_items(db, [obj])
+            if r is not None:
+                try:
+                    store_order(r, obj)
+                except RedisError:
+                    pass
+            view = dict(_order_out(obj), user_email=obj.user_email, shipment=None)
+    # Hide other users' orders behind the same 404
+    if not view or (view.pop("user_email") != identity.get("sub") and identity.get("role") != "admin"):
+        raise HTTPException(status_code=404, detail="Order not found")
+    return view
+
+@router.get("/v1/orders/{order_id}")
+def get_order(order_id: int, identity: dict = Depends(get_identity_dep), db: Session = Depends(get_db)):
+    return _authorized_view(order_id, identity, db)
+
+def _check_order_access(order_id: int, identity: dict):
+    # Own short-lived session: a long-lived stream must not pin a pooled DB connection
+    with SessionLocal() as db:
+        _authorized_view(order_id, identity, db)
+
+@router.get("/v1/orders/{order_id}/events")
+async def order_events(
+    order_id: int,
+    identity: dict = Depends(get_identity_dep),
+    last_event_id: str | None = Header(default=None, alias="Last-Event-ID"),
+):
+    """Server-Sent Events: status/shipment transitions for one order as they are projected."""
+    await run_in_threadpool(_check_order_access, order_id, identity)
+    return StreamingResponse(
+        stream_order_events(get_hub(), order_id, last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -8,8 +8,47 @@ class Settings(BaseModel):
     KAFKA_BOOTSTRAP: str = os.getenv("KAFKA_BOOTSTRAP", "kafka:9092")
     CATALOG_BASE: str = os.getenv("CATALOG_BASE", "http://catalog:8000")
     SHIPPING_BASE: str = os.getenv("SHIPPING_BASE", "http://shipping:8000")
+    PAYMENT_BASE: str = os.getenv("PAYMENT_BASE", "http://payment:8000")
     SVC_INTERNAL_KEY: str = os.getenv("SVC_INTERNAL_KEY", "devkey")
     JWT_SECRET: str = os.getenv("JWT_SECRET", "devsecret")
     JWT_ALGORITHM: str = os.getenv("JWT_ALGORITHM", "HS256")
+    HTTP_TIMEOUT_SECONDS: float = float(os.getenv("HTTP_TIMEOUT_SECONDS", "5.0"))
+    HTTP_CONNECT_TIMEOUT_SECONDS: float = float(os.getenv("HTTP_CONNECT_TIMEOUT_SECONDS", "1.0"))
+    HTTP_MAX_CONNECTIONS: int = int(os.getenv("HTTP_MAX_CONNECTIONS", "50"))
+    HTTP_MAX_KEEPALIVE: int = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+    HTTP2: bool = os.getenv("HTTP2", "false").lower() == "true"
+    HTTP_RETRIES: int = int(os.getenv("HTTP_RETRIES", "2"))
+    HTTP_BACKOFF_SECONDS: float = float(os.getenv("HTTP_BACKOFF_SECONDS", "0.05"))
+    HTTP_BREAKER_FAILURES: int = int(os.getenv("HTTP_BREAKER_FAILURES", "5"))
+    HTTP_BREAKER_RESET_SECONDS: float = float(os.getenv("HTTP_BREAKER_RESET_SECONDS", "15"))
+    CART_LOCK_SECONDS: float = float(os.getenv("CART_LOCK_SECONDS", "120"))
+    PRICE_CACHE_TTL_SECONDS: float = float(os.getenv("PRICE_CACHE_TTL_SECONDS", "10"))
+    PRICE_CACHE_MAX_ENTRIES: int = int(os.getenv("PRICE_CACHE_MAX_ENTRIES", "10000"))
+    CHECKOUT_MODE: str = os.getenv("CHECKOUT_MODE", "sync")  # "sync" | "async"
+    TOPIC_ORDER_COMMANDS: str = os.getenv("TOPIC_ORDER_COMMANDS", "order.commands")
+    CHECKOUT_WORKERS: int = int(os.getenv("CHECKOUT_WORKERS", "8"))
+    CHECKOUT_MAX_RECORDS: int = int(os.getenv("CHECKOUT_MAX_RECORDS", "64"))
+    CHECKOUT_MAX_ATTEMPTS: int = int(os.getenv("CHECKOUT_MAX_ATTEMPTS", "5"))
+    CHECKOUT_DLQ_TOPIC: str = os.getenv("CHECKOUT_DLQ_TOPIC", "order.commands.dlq")
+    ORDER_VIEW_TTL_SECONDS: int = int(os.getenv("ORDER_VIEW_TTL_SECONDS", "604800"))
+    ORDER_STREAM_MAXLEN: int = int(os.getenv("ORDER_STREAM_MAXLEN", "50"))
+    SSE_HEARTBEAT_SECONDS: float = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+    SSE_RETRY_MS: int = int(os.getenv("SSE_RETRY_MS", "3000"))
+    SSE_REDIS_MAX_CONNECTIONS: int = int(os.getenv("SSE_REDIS_MAX_CONNECTIONS", "20"))
+    SSE_QUEUE_SIZE: int = int(os.getenv("SSE_QUEUE_SIZE", "16"))
+    ORDER_PAYMENT_TIMEOUT_SECONDS: int = int(os.getenv("ORDER_PAYMENT_TIMEOUT_SECONDS", "900"))
+    SAGA_SWEEP_INTERVAL_SECONDS: float = float(os.getenv("SAGA_SWEEP_INTERVAL_SECONDS", "15"))
+    SAGA_SWEEP_BATCH: int = int(os.getenv("SAGA_SWEEP_BATCH", "200"))
+    SAGA_RECHECK_SECONDS: float = float(os.getenv("SAGA_RECHECK_SECONDS", "60"))
+    CONSUMER_MAX_RECORDS: int = int(os.getenv("CONSUMER_MAX_RECORDS", "500"))
+    CONSUMER_POLL_MS: int = int(os.getenv("CONSUMER_POLL_MS", "1000"))
+    CONSUMER_RETRY_BACKOFF_SECONDS: float = float(os.getenv("CONSUMER_RETRY_BACKOFF_SECONDS", "2"))
+    CONSUMER_RETRY_MAX_BACKOFF_SECONDS: float = float(os.getenv("CONSUMER_RETRY_MAX_BACKOFF_SECONDS", "60"))
+    CONSUMER_MAX_ATTEMPTS: int = int(os.getenv("CONSUMER_MAX_ATTEMPTS", "8"))
+    CONSUMER_DLQ_TOPIC: str = os.getenv("CONSUMER_DLQ_TOPIC", "order.payment-events.dlq")
+    PROJECTION_DLQ_TOPIC: str = os.getenv("PROJECTION_DLQ_TOPIC", "order.projection.dlq")
+    IDEMPOTENCY_TTL_SECONDS: int = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+    IDEMPOTENCY_LOCK_SECONDS: float = float(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "30"))
+    IDEMPOTENCY_POLL_SECONDS: float = float(os.getenv("IDEMPOTENCY_POLL_SECONDS", "0.05"))
 
 settings = Settings()
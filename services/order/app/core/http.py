@@ -0,0 +1,174 @@
+import random, threading, time
+from typing import Dict, Optional
+import httpx
+from prometheus_client import Counter, Gauge, Histogram
+from app.core.config import settings
+
+REQUEST_SECONDS = Histogram("http_client_request_seconds", "Outbound request latency", ["target", "method"])
+REQUEST_ERRORS = Counter("http_client_errors_total", "Outbound request failures", ["target", "kind"])
+REQUEST_RETRIES = Counter("http_client_retries_total", "Outbound request retries", ["target"])
+BREAKER_STATE = Gauge("http_client_breaker_state", "Circuit breaker state (0=closed, 1=half-open, 2=open)", ["target"])
+
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+RETRY_STATUSES = {502, 503, 504}
+
+class CircuitOpenError(httpx.RequestError):
+    """Raised instead of calling a target whose breaker is open.
+
+    Subclasses httpx.RequestError so existing `except httpx.RequestError` -> 503
+    handling covers it without changes.
+    """
+
+class CircuitBreaker:
+    CLOSED, HALF_OPEN, OPEN = 0, 1, 2
+
+    def __init__(self, name: str, failure_threshold: int, reset_seconds: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._failures = 0
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+        BREAKER_STATE.labels(name).set(self.CLOSED)
+
+    @property
+    def state(self) -> int:
+        return self._state
+
+    def _set(self, state: int):
+        self._state = state
+        BREAKER_STATE.labels(self.name).set(state)
+
+    def admit(self) -> Optional[bool]:
+        """None if the call may not go out; otherwise whether it is the half-open trial."""
+        with self._lock:
+            if self._state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.reset_seconds:
+                    return None
+                self._set(self.HALF_OPEN)
+            if self._state == self.HALF_OPEN:
+                # one trial request at a time decides whether to close again
+                if self._trial_in_flight:
+                    return None
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def allow(self) -> bool:
+        return self.admit() is not None
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            if self._state != self.CLOSED:
+                self._set(self.CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                self._set(self.OPEN)
+
+    def release(self, trial: bool):
+        """End a call let through by admit(); callers run it in `finally`, so a trial that raised
+        something other than a recorded failure can't leave the breaker half-open forever."""
+        if trial:
+            with self._lock:
+                self._trial_in_flight = False
+
+class ServiceClient:
+    """Pooled keep-alive client for one downstream service.
+
+    Retries connect failures for any method (the request never left), and read
+    errors / 502-504 only for idempotent methods or when `idempotent=True`,
+    with full-jitter exponential backoff. Each call goes through the target's
+    circuit breaker once and counts as one success or failure, however many
+    attempts it took; the half-open trial call is not retried.
+    """
+
+    def __init__(self, name: str, base_url: str):
+        self.name = name
+        self.breaker = CircuitBreaker(name, settings.HTTP_BREAKER_FAILURES, settings.HTTP_BREAKER_RESET_SECONDS)
+        self._client = httpx.Client(
+            base_url=base_url,
+            timeout=httpx.Timeout(settings.HTTP_TIMEOUT_SECONDS, connect=settings.HTTP_CONNECT_TIMEOUT_SECONDS),
+            limits=httpx.Limits(
+                max_connections=settings.HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE,
+            ),
+            http2=settings.HTTP2,
+        )
+
+    def request(self, method: str, url: str, *, idempotent: Optional[bool] = None, **kwargs) -> httpx.Response:
+        method = method.upper()
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+        trial = self.breaker.admit()
+        if trial is None:
+            REQUEST_ERRORS.labels(self.name, "circuit_open").inc()
+            raise CircuitOpenError(f"{self.name} circuit open")
+        try:
+            return self._attempts(method, url, idempotent, 0 if trial else settings.HTTP_RETRIES, **kwargs)
+        finally:
+            self.breaker.release(trial)
+
+    def _attempts(self, method: str, url: str, idempotent: bool, retries: int, **kwargs) -> httpx.Response:
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                resp = self._client.request(method, url, **kwargs)
+            except httpx.RequestError as exc:
+                REQUEST_ERRORS.labels(self.name, type(exc).__name__).inc()
+                retryable = idempotent or isinstance(exc, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout))
+                if not retryable or attempt >= retries:
+                    self.breaker.record_failure()
+                    raise
+            else:
+                REQUEST_SECONDS.labels(self.name, method).observe(time.perf_counter() - started)
+                if resp.status_code < 500:
+                    self.breaker.record_success()
+                    return resp
+                REQUEST_ERRORS.labels(self.name, str(resp.status_code)).inc()
+                if not (idempotent and resp.status_code in RETRY_STATUSES) or attempt >= retries:
+                    self.breaker.record_failure()
+                    return resp
+                resp.close()
+            if self.breaker.state == self.breaker.OPEN:
+                # Other calls tripped the breaker meanwhile: fail fast instead of retrying into it
+                REQUEST_ERRORS.labels(self.name, "circuit_open").inc()
+                raise CircuitOpenError(f"{self.name} circuit open")
+            attempt += 1
+            REQUEST_RETRIES.labels(self.name).inc()
+            time.sleep(random.uniform(0, settings.HTTP_BACKOFF_SECONDS * (2 ** attempt)))
+
+    def get(self, url: str, **kwargs) -> httpx.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> httpx.Response:
+        return self.request("POST", url, **kwargs)
+
+    def close(self):
+        self._client.close()
+
+_clients: Dict[str, ServiceClient] = {}
+_clients_lock = threading.Lock()
+
+def get_client(name: str, base_url: str) -> ServiceClient:
+    """Process-wide client per target; connections are pooled and reused across requests."""
+    client = _clients.get(name)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(name)
+            if client is None:
+                client = _clients[name] = ServiceClient(name, base_url)
+    return client
+
+def close_all():
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
@@ -0,0 +1,94 @@
+import hashlib, json, threading, time, uuid
+from typing import Any, Callable, Optional, Tuple
+from fastapi import HTTPException
+from redis import Redis
+from redis.exceptions import RedisError
+from app.core.config import settings
+
+# Delete the in-flight lock only if we still own it
+_RELEASE_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# Push the in-flight lock's expiry out, again only if we still own it
+_EXTEND_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+def _keep_lock(r: Redis, lock_key: str, token: str, stop: threading.Event):
+    # Renews the lock every third of its TTL while `fn` runs, so a slow call never loses it
+    ttl = int(settings.IDEMPOTENCY_LOCK_SECONDS * 1000)
+    while not stop.wait(settings.IDEMPOTENCY_LOCK_SECONDS / 3):
+        try:
+            if not r.eval(_EXTEND_LUA, 1, lock_key, token, ttl):
+                return
+        except RedisError:
+            pass
+
+def fingerprint(payload: Any) -> str:
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+def run_idempotent(r: Redis, scope: str, key: Optional[str], payload: Any, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+    """Execute `fn` at most once per (scope, Idempotency-Key).
+
+    The first caller takes an in-flight lock (SET NX PX, renewed while `fn`
+    runs), runs `fn` and stores its JSON result with a TTL. Concurrent
+    duplicates poll until the stored result appears and get it back instead of
+    re-executing; if the lock goes away without a result, or they wait longer
+    than IDEMPOTENCY_LOCK_SECONDS, they get 409 and never run `fn` themselves.
+    Failures (any exception from `fn`) release the lock without storing, so a
+    later retry runs again.
+
+    Returns (result, replayed). Without a key, or if Redis is down, `fn` simply runs.
+    """
+    if not key:
+        return fn(), False
+
+    base = f"idem:{scope}:{key}"
+    resp_key, lock_key = f"{base}:resp", f"{base}:lock"
+    fp = fingerprint(payload)
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + settings.IDEMPOTENCY_LOCK_SECONDS
+
+    waited = False
+    try:
+        while True:
+            cached = r.get(resp_key)
+            if cached:
+                stored = json.loads(cached)
+                if stored.get("fingerprint") != fp:
+                    raise HTTPException(status_code=422, detail="Idempotency-Key reused with a different request body")
+                return stored["body"], True
+            if waited:
+                if not r.get(lock_key) and not r.get(resp_key):
+                    raise HTTPException(status_code=409, detail="The request with this Idempotency-Key did not complete; retry it")
+            elif r.set(lock_key, token, nx=True, px=int(settings.IDEMPOTENCY_LOCK_SECONDS * 1000)):
+                break
+            waited = True
+            if time.monotonic() > deadline:
+                raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+            time.sleep(settings.IDEMPOTENCY_POLL_SECONDS)
+    except RedisError:
+        return fn(), False
+
+    stop = threading.Event()
+    threading.Thread(target=_keep_lock, args=(r, lock_key, token, stop), daemon=True).start()
+    try:
+        body = fn()
+        try:
+            r.set(resp_key, json.dumps({"fingerprint": fp, "body": body}), ex=settings.IDEMPOTENCY_TTL_SECONDS)
+        except RedisError:
+            pass
+        return body, False
+    finally:
+        stop.set()
+        try:
+            r.eval(_RELEASE_LUA, 1, lock_key, token)
+        except RedisError:
+            pass
@@ -1,28 +1,66 @@
 
 from sqlalchemy.orm import Mapped, mapped_column, relationship
-from sqlalchemy import Integer, String, DateTime, ForeignKey, BigInteger
+from sqlalchemy import Integer, String, DateTime, BigInteger, Index, ForeignKeyConstraint
 from datetime import datetime
 from app.db.session import Base
 
+# In Postgres orders/order_items are range-partitioned by month on created_at (see
+# alembic 20261019110000 and app/db/partitions.py): the real keys are (id, created_at)
+# and (id, order_created_at). The ORM still keys on id, which the sequences keep unique.
+
 class Order(Base):
     __tablename__ = "orders"
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    user_email: Mapped[str] = mapped_column(String(255), index=True)
+    user_email: Mapped[str] = mapped_column(String(255))
     status: Mapped[str] = mapped_column(String(32), default="CREATED")
     total_cents: Mapped[int] = mapped_column(BigInteger)
     currency: Mapped[str] = mapped_column(String(3), default="USD")
     created_at: Mapped[datetime] = mapped_column(DateTime(), default=lambda: datetime.utcnow())
     updated_at: Mapped[datetime] = mapped_column(DateTime(), default=lambda: datetime.utcnow())
 
-    items = relationship("OrderItem", back_populates="order", cascade="all, delete-orphan")
+    items = relationship(
+        "OrderItem", back_populates="order", cascade="all, delete-orphan",
+        primaryjoin="Order.id == foreign(OrderItem.order_id)",
+    )
+
+    __table_args__ = (
+        Index("ix_orders_user_created", "user_email", created_at.desc(), id.desc()),
+        Index("ix_orders_created", created_at.desc(), id.desc()),
+    )
 
 class OrderItem(Base):
     __tablename__ = "order_items"
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    order_id: Mapped[int] = mapped_column(ForeignKey("orders.id", ondelete="CASCADE"))
+    order_id: Mapped[int] = mapped_column(Integer, index=True)
+    order_created_at: Mapped[datetime] = mapped_column(DateTime())  # partition key, copied from the order
     product_id: Mapped[int] = mapped_column(Integer)
     qty: Mapped[int] = mapped_column(Integer)
     unit_price_cents: Mapped[int] = mapped_column(BigInteger)
     title_snapshot: Mapped[str] = mapped_column(String(255))
 
-    order = relationship("Order", back_populates="items")
+    order = relationship("Order", back_populates="items", primaryjoin="Order.id == foreign(OrderItem.order_id)")
+
+    __table_args__ = (
+        ForeignKeyConstraint(["order_id", "order_created_at"], ["orders.id", "orders.created_at"], ondelete="CASCADE"),
+    )
+
+class OrderSaga(Base):
+    """Checkout saga progress for one order: which steps ran, and when it must be paid by."""
+    __tablename__ = "order_sagas"
+    order_id: Mapped[int] = mapped_column(Integer, primary_key=True)  # no FK: orders is partitioned
+    state: Mapped[str] = mapped_column(String(32), default="RESERVED")
+    shipment_id: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    expires_at: Mapped[datetime] = mapped_column(DateTime())
+    reserved_at: Mapped[datetime | None] = mapped_column(DateTime(), nullable=True)
+    shipment_drafted_at: Mapped[datetime | None] = mapped_column(DateTime(), nullable=True)
+    paid_at: Mapped[datetime | None] = mapped_column(DateTime(), nullable=True)
+    committed_at: Mapped[datetime | None] = mapped_column(DateTime(), nullable=True)
+    compensated_at: Mapped[datetime | None] = mapped_column(DateTime(), nullable=True)
+    last_error: Mapped[str] = mapped_column(String(255), default="")
+    updated_at: Mapped[datetime] = mapped_column(DateTime(), default=lambda: datetime.utcnow())
+
+    __table_args__ = (
+        # The expiry sweeper only ever scans open sagas in deadline order
+        Index("ix_order_sagas_open_expiry", expires_at,
+              postgresql_where=state.in_(("RESERVED", "SHIPMENT_DRAFTED"))),
+    )
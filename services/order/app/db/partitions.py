@@ -0,0 +1,184 @@
+"""Monthly partition maintenance for orders / order_items (Postgres).
+
+    python -m app.db.partitions ensure [--months-ahead 3]
+    python -m app.db.partitions archive --older-than-months 24 --out /archive [--keep-tables]
+
+`ensure` creates next months' partitions ahead of time (run it daily from cron; it
+is idempotent). `archive` writes every month older than the cutoff to
+`orders_YYYY_MM.ndjson.gz` (one order per line, items embedded), then drops its
+partitions — or, with --keep-tables, only detaches them for cold storage.
+"""
+import argparse, gzip, json, os, re, threading, time
+from datetime import date, datetime, timedelta
+from typing import Iterable, List, Optional, Tuple
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+
+PARENTS = ("orders", "order_items")
+_SUFFIX = re.compile(r"_(\d{4})_(\d{2})$")
+
+def add_months(d: date, n: int) -> date:
+    m = d.month - 1 + n
+    return date(d.year + m // 12, m % 12 + 1, 1)
+
+def month_floor(d: date) -> date:
+    return date(d.year, d.month, 1)
+
+def partition_name(parent: str, month: date) -> str:
+    return f"{parent}_{month:%Y_%m}"
+
+def list_partitions(conn: Connection, parent: str) -> List[Tuple[str, date]]:
+    """Monthly partitions of `parent`, oldest first (the DEFAULT partition is skipped)."""
+    names = conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+        "WHERE p.relname = :parent"
+    ), {"parent": parent}).scalars()
+    found = []
+    for name in names:
+        m = _SUFFIX.search(name)
+        if m:
+            found.append((name, date(int(m[1]), int(m[2]), 1)))
+    return sorted(found, key=lambda p: p[1])
+
+def ensure_partitions(conn: Connection, months_ahead: int, today: date | None = None) -> List[str]:
+    existing = {name for name, _ in list_partitions(conn, "orders")}
+    start = month_floor(today or datetime.utcnow().date())
+    created = []
+    for n in range(months_ahead + 1):
+        month = add_months(start, n)
+        if partition_name("orders", month) in existing:
+            continue
+        for parent in PARENTS:
+            conn.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {partition_name(parent, month)} PARTITION OF {parent} "
+                f"FOR VALUES FROM ('{month}') TO ('{add_months(month, 1)}')"
+            ))
+        created.append(partition_name("orders", month))
+    return created
+
+# Lookups by order id alone can't be pruned: the partition key is created_at. Ids come from
+# one sequence and created_at is stamped in the same INSERT, so each month's lowest id maps an
+# id back to its month. The map is cached for ID_MONTHS_TTL seconds; ID_SKEW covers ids that
+# straddle a month boundary (allocated just before midnight, stamped just after, or the reverse).
+ID_MONTHS_TTL = 300.0
+ID_SKEW = timedelta(hours=1)
+_id_months: Tuple[float, List[Tuple[int, date]]] = (0.0, [])
+_id_months_lock = threading.Lock()
+
+def id_months(conn: Connection) -> List[Tuple[int, date]]:
+    """(lowest order id, month) of every non-empty monthly partition, oldest first."""
+    out = []
+    for name, month in list_partitions(conn, "orders"):
+        low = conn.execute(text(f"SELECT min(id) FROM {name}")).scalar()
+        if low is not None:
+            out.append((int(low), month))
+    return out
+
+def created_window(conn: Connection, order_ids: Iterable[int]) -> Optional[Tuple[datetime, Optional[datetime]]]:
+    """A created_at range [lo, hi) holding every order in `order_ids` (hi None = open-ended),
+    or None when it can't be bounded (not Postgres, ids older than every partition)."""
+    global _id_months
+    ids = list(order_ids)
+    if not ids or conn.dialect.name != "postgresql":
+        return None
+    now = time.monotonic()
+    with _id_months_lock:
+        loaded, months = _id_months
+    if now - loaded > ID_MONTHS_TTL:
+        months = id_months(conn)
+        with _id_months_lock:
+            _id_months = (now, months)
+    lo_id, hi_id = min(ids), max(ids)
+    if not months or lo_id < months[0][0]:
+        return None
+    lo = max(m for low, m in months if low <= lo_id)
+    later = [m for low, m in months if low > hi_id]
+    # The newest month may not be in the cached map yet; without a later month, leave hi open
+    hi = datetime.combine(min(later), datetime.min.time()) + ID_SKEW if later else None
+    return datetime.combine(lo, datetime.min.time()) - ID_SKEW, hi
+
+def export_month(conn: Connection, month: date, out_dir: str) -> Tuple[str, int]:
+    """Stream one month to gzip NDJSON. Both sides are bounded on their partition key,
+    so only that month's partitions are read; the file is fsynced before returning."""
+    path = os.path.join(out_dir, f"orders_{month:%Y_%m}.ndjson.gz")
+    rows = conn.execution_options(stream_results=True, yield_per=1000).execute(text(
+        "SELECT o.id, o.user_email, o.status, o.total_cents, o.currency, o.created_at, o.updated_at, "
+        "       coalesce(json_agg(json_build_object("
+        "           'id', i.id, 'product_id', i.product_id, 'qty', i.qty,"
+        "           'unit_price_cents', i.unit_price_cents, 'title_snapshot', i.title_snapshot) ORDER BY i.id"
+        "       ) FILTER (WHERE i.id IS NOT NULL), '[]') AS items "
+        "FROM orders o "
+        "LEFT JOIN order_items i ON i.order_id = o.id AND i.order_created_at = o.created_at "
+        "     AND i.order_created_at >= :lo AND i.order_created_at < :hi "
+        "WHERE o.created_at >= :lo AND o.created_at < :hi "
+        "GROUP BY o.id, o.created_at ORDER BY o.created_at, o.id"
+    ), {"lo": month, "hi": add_months(month, 1)})
+    n = 0
+    tmp = path + ".part"
+    with open(tmp, "wb") as raw:
+        with gzip.GzipFile(fileobj=raw, mode="wb") as gz:
+            for row in rows:
+                doc = dict(row._mapping)
+                doc["created_at"] = doc["created_at"].isoformat()
+                doc["updated_at"] = doc["updated_at"].isoformat()
+                gz.write(json.dumps(doc, separators=(",", ":")).encode("utf-8") + b"\n")
+                n += 1
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(tmp, path)
+    return path, n
+
+def retire_month(conn: Connection, month: date, keep_tables: bool):
+    orders_part, items_part = partition_name("orders", month), partition_name("order_items", month)
+    conn.execute(text(f"DELETE FROM order_sagas s USING {orders_part} o WHERE s.order_id = o.id"))
+    if keep_tables:
+        # Items first: its FK to orders would otherwise block detaching the orders month
+        conn.execute(text(f"ALTER TABLE order_items DETACH PARTITION {items_part}"))
+        for fk in conn.execute(text(
+            "SELECT conname FROM pg_constraint WHERE conrelid = CAST(:t AS regclass) AND contype = 'f'"
+        ), {"t": items_part}).scalars():
+            conn.execute(text(f'ALTER TABLE {items_part} DROP CONSTRAINT "{fk}"'))
+        conn.execute(text(f"ALTER TABLE orders DETACH PARTITION {orders_part}"))
+    else:
+        conn.execute(text(f"DROP TABLE {items_part}"))
+        conn.execute(text(f"ALTER TABLE orders DETACH PARTITION {orders_part}"))
+        conn.execute(text(f"DROP TABLE {orders_part}"))
+
+def archive(engine: Engine, cutoff: date, out_dir: str, keep_tables: bool = False) -> List[Tuple[str, int]]:
+    """Export, then retire, every monthly partition that ends before `cutoff`."""
+    os.makedirs(out_dir, exist_ok=True)
+    with engine.connect() as conn:
+        months = [m for _, m in list_partitions(conn, "orders") if add_months(m, 1) <= cutoff]
+    done = []
+    for month in months:
+        with engine.connect() as conn:
+            path, n = export_month(conn, month, out_dir)
+        with engine.begin() as conn:
+            retire_month(conn, month, keep_tables)
+        done.append((path, n))
+    return done
+
+def main():
+    ap = argparse.ArgumentParser(description="Monthly partition maintenance for orders")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    ens = sub.add_parser("ensure", help="Create upcoming monthly partitions")
+    ens.add_argument("--months-ahead", type=int, default=3)
+    arc = sub.add_parser("archive", help="Export and retire old monthly partitions")
+    arc.add_argument("--older-than-months", type=int, default=24)
+    arc.add_argument("--out", default=os.getenv("ORDER_ARCHIVE_DIR", "/archive"))
+    arc.add_argument("--keep-tables", action="store_true", help="Detach instead of dropping")
+    args = ap.parse_args()
+
+    from app.db.session import engine
+    if args.cmd == "ensure":
+        with engine.begin() as conn:
+            created = ensure_partitions(conn, args.months_ahead)
+        print(f"created: {', '.join(created) or 'nothing (up to date)'}")
+    else:
+        cutoff = add_months(month_floor(datetime.utcnow().date()), -args.older_than_months)
+        for path, n in archive(engine, cutoff, args.out, args.keep_tables):
+            print(f"archived {n} orders -> {path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+import json, logging, threading, time
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime
+from typing import Dict
+from fastapi import HTTPException
+from kafka import KafkaConsumer
+from prometheus_client import Counter, Gauge, Histogram
+from sqlalchemy import select, update
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.db.models import Order, OrderSaga
+from app.kafka.dead_letter import dead_letter, retryable
+from app.services import saga
+from app.services.orders import created_bounds
+from app.services.checkout import reserve_inventory, release_inventory, create_shipment, emit_order_created, emit_order_rejected, emit_order_failed
+
+log = logging.getLogger(__name__)
+
+_stop = threading.Event()
+_thread = None
+
+CHECKOUT_RESULTS = Counter("order_async_checkout_total", "Async checkout commands processed", ["result"])
+CHECKOUT_SECONDS = Histogram("order_async_checkout_seconds", "Time to run one async checkout command")
+CHECKOUT_IN_FLIGHT = Gauge("order_async_checkout_in_flight", "Async checkout commands currently running")
+
+def _set_status(order_id: int, status: str, expected: str = "PENDING") -> bool:
+    with SessionLocal() as db:
+        moved = db.execute(
+            update(Order)
+            .where(Order.id == order_id, Order.status == expected, *created_bounds(db, [order_id]))
+            .values(status=status, updated_at=datetime.utcnow())
+            .returning(Order.id)
+        ).first()
+        db.commit()
+    return moved is not None
+
+def process_command(cmd: dict) -> str:
+    """Run reservation, shipment creation and order.created for one PENDING order.
+
+    Business rejections (stock, unknown product) settle the order as REJECTED.
+    Catalog being unreachable raises so the batch is retried; a failure after
+    stock was reserved is compensated by the saga and settles as CANCELLED.
+    Every step is safe to replay after a crash: the reservation is keyed by
+    order id in catalog and saga.begin() is a no-op for an existing saga.
+    """
+    if cmd.get("type") != "order.checkout_requested":
+        return "ignored"
+    order_id, email, items = int(cmd["order_id"]), cmd["user_email"], cmd["items"]
+    with SessionLocal() as db:
+        order = db.scalars(select(Order).where(Order.id == order_id, *created_bounds(db, [order_id]))).one_or_none()
+        if not order or order.status != "PENDING":
+            return "duplicate"
+        currency, created_at = order.currency, order.created_at
+
+    try:
+        reserve_inventory(items, order_id=order_id)
+    except HTTPException as exc:
+        if exc.status_code >= 500:
+            raise
+        if _set_status(order_id, "REJECTED"):
+            emit_order_rejected(order_id, email, str(exc.detail)[:255])
+        return "rejected"
+
+    try:
+        with SessionLocal() as db:
+            saga.begin(db, order_id)
+            db.commit()
+    except Exception:
+        release_inventory(items, order_id=order_id)
+        raise
+
+    try:
+        shipment_id = create_shipment(order_id, email, cmd["shipping_address"])
+    except HTTPException:
+        log.exception("shipment creation failed for order %s", order_id)
+        with SessionLocal() as db:
+            saga.abort(db, order_id, "shipment_failed")
+        return "failed"
+
+    with SessionLocal() as db:
+        moved = db.execute(
+            update(Order)
+            .where(Order.id == order_id, Order.status == "PENDING", *created_bounds(db, [order_id]))
+            .values(status="CREATED", updated_at=datetime.utcnow())
+            .returning(Order.id)
+        ).first()
+        saga.shipment_drafted(db, order_id, shipment_id)
+        db.commit()
+    if moved:
+        emit_order_created(order_id, email, int(cmd["amount_cents"]), items, currency, created_at)
+    return "created"
+
+def _timed(cmd: dict) -> str:
+    CHECKOUT_IN_FLIGHT.inc()
+    started = time.perf_counter()
+    try:
+        result = process_command(cmd)
+        CHECKOUT_RESULTS.labels(result).inc()
+        return result
+    finally:
+        CHECKOUT_SECONDS.observe(time.perf_counter() - started)
+        CHECKOUT_IN_FLIGHT.dec()
+
+def give_up(rec, exc: BaseException):
+    """Stop retrying a command: dead-letter it and settle its order, undoing what already ran.
+
+    With a saga the usual compensation cancels the order. Without one the order is marked
+    FAILED and its reservation (if the reserve step got that far) released in the same
+    transaction, so a failed release leaves it PENDING for the next replay to try again.
+    order.failed is sent once that commits (again on a replay, if sending it failed).
+    """
+    dead_letter(settings.CHECKOUT_DLQ_TOPIC, rec, exc)
+    cmd = rec.value
+    try:
+        order_id = int(cmd["order_id"])
+    except (KeyError, TypeError, ValueError):
+        return
+    with SessionLocal() as db:
+        if db.get(OrderSaga, order_id) is not None:
+            saga.abort(db, order_id, "checkout_failed")
+            return
+        bounds = created_bounds(db, [order_id])
+        moved = db.execute(
+            update(Order)
+            .where(Order.id == order_id, Order.status == "PENDING", *bounds)
+            .values(status="FAILED", updated_at=datetime.utcnow())
+            .returning(Order.id)
+        ).first()
+        if moved and cmd.get("items"):
+            release_inventory(cmd["items"], order_id=order_id)
+        db.commit()
+        failed = moved is not None or db.scalar(select(Order.status).where(Order.id == order_id, *bounds)) == "FAILED"
+    if failed:
+        emit_order_failed(order_id, cmd.get("user_email"), repr(exc)[:255])
+
+def _backoff(failures: int) -> float:
+    return min(settings.CONSUMER_RETRY_MAX_BACKOFF_SECONDS, settings.CONSUMER_RETRY_BACKOFF_SECONDS * 2 ** (failures - 1))
+
+def consume(consumer: KafkaConsumer, pool: ThreadPoolExecutor):
+    """Poll/run/commit until stopped.
+
+    A command that fails with a transient error (catalog or DB down) rewinds the batch and is
+    retried with exponential backoff, up to CHECKOUT_MAX_ATTEMPTS times. A non-transient failure
+    (malformed command, a bug) or running out of attempts gives up on that command (give_up)
+    instead, so one command can't hold its partition back forever.
+    """
+    attempts: Dict = {}
+    while not _stop.is_set():
+        batch = consumer.poll(timeout_ms=1000)
+        if not batch:
+            continue
+        # One command per order; redeliveries inside a batch collapse here
+        recs_by_order = {}
+        for recs in batch.values():
+            for rec in recs:
+                key = rec.value.get("order_id") if isinstance(rec.value, dict) else (rec.topic, rec.partition, rec.offset)
+                recs_by_order.setdefault(key, rec)
+        futures = {key: pool.submit(_timed, rec.value) for key, rec in recs_by_order.items()}
+        wait(futures.values())
+        retry = 0
+        for key, fut in futures.items():
+            exc = fut.exception()
+            if exc is None:
+                attempts.pop(key, None)
+                continue
+            attempts[key] = n = attempts.get(key, 0) + 1
+            if retryable(exc) and n < settings.CHECKOUT_MAX_ATTEMPTS:
+                retry = max(retry, n)
+                continue
+            log.error("checkout command for order %s given up after %d attempts: %r", key, n, exc)
+            try:
+                give_up(recs_by_order[key], exc)
+                CHECKOUT_RESULTS.labels("dead_lettered").inc()
+                attempts.pop(key, None)
+            except Exception:
+                log.exception("giving up on order %s failed; retrying", key)
+                retry = max(retry, n)
+        if not retry:
+            consumer.commit()
+        else:
+            # Completed and given-up commands are no-ops on replay (order no longer PENDING)
+            CHECKOUT_RESULTS.labels("retry").inc()
+            for tp, recs in batch.items():
+                consumer.seek(tp, recs[0].offset)
+            _stop.wait(_backoff(retry))
+
+def _run():
+    consumer = KafkaConsumer(
+        settings.TOPIC_ORDER_COMMANDS,
+        bootstrap_servers=[settings.KAFKA_BOOTSTRAP],
+        group_id="order-checkout-workers",
+        value_deserializer=lambda v: json.loads(v.decode("utf-8")),
+        enable_auto_commit=False,
+        auto_offset_reset="earliest",
+        # Backpressure: never hold more than one poll's worth of commands in memory
+        max_poll_records=settings.CHECKOUT_MAX_RECORDS,
+    )
+    pool = ThreadPoolExecutor(max_workers=settings.CHECKOUT_WORKERS, thread_name_prefix="checkout")
+    try:
+        consume(consumer, pool)
+    finally:
+        pool.shutdown(wait=True)
+        consumer.close()
+
+def start():
+    global _thread
+    if _thread and _thread.is_alive():
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_run, daemon=True)
+    _thread.start()
+
+def stop():
+    _stop.set()
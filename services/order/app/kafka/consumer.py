@@ -1,26 +1,147 @@
 
-import threading, time, json
+import threading, json, logging
+from datetime import datetime
+from typing import Iterable, List, Tuple
 from kafka import KafkaConsumer
+from prometheus_client import Gauge, Histogram, Counter
+from sqlalchemy import select, update, func
 from sqlalchemy.orm import Session
 from app.core.config import settings
 from app.db.session import SessionLocal
 from app.db.models import Order, OrderItem
-import httpx
+from app.core.http import ServiceClient, get_client
+from app.kafka.dead_letter import dead_letter, retryable
+from app.services import saga
+from app.services.orders import created_bounds
+
+log = logging.getLogger(__name__)
 
 _stop_event = threading.Event()
 _thread = None
 
-def process_event(ev: dict, db: Session):
-    if ev.get("type") == "payment.succeeded":
-        order_id = ev.get("order_id")
-        order = db.get(Order, order_id)
-        if not order: return
-        # Commit inventory in catalog
-        items = [{"product_id": it.product_id, "qty": it.qty} for it in order.items]
-        with httpx.Client(timeout=5.0) as client:
-            client.post(f"{settings.CATALOG_BASE}/catalog/v1/inventory/commit", json={"items": items}, headers={"X-Internal-Key": settings.SVC_INTERNAL_KEY})
-        order.status = "PAID"
-        db.add(order); db.commit()
+CONSUMER_LAG = Gauge("order_consumer_lag", "Messages behind the partition high watermark", ["topic", "partition"])
+BATCH_SIZE = Histogram("order_consumer_batch_size", "Records per poll() batch", buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000))
+BATCH_FAILURES = Counter("order_consumer_batch_failures_total", "Batches rolled back and retried")
+DEAD_LETTERED = Counter("order_consumer_dead_lettered_total", "Payment events sent to the DLQ", ["reason"])  # invalid, failed
+
+def process_batch(events: Iterable[dict], db: Session, client: ServiceClient) -> list[int]:
+    """Apply a batch of payment events in one transaction.
+
+    All CREATED orders named by `payment.succeeded` events flip to PAID in one
+    UPDATE ... RETURNING (duplicates, already-paid and cancelled orders drop out there), and
+    their items are committed in catalog with one call, itemised per order: catalog applies
+    each order's commit once, so replaying the batch after a failed DB commit doesn't take
+    the stock twice. The DB commit happens only after catalog accepted.
+    """
+    order_ids = {int(ev["order_id"]) for ev in events if ev.get("type") == "payment.succeeded" and ev.get("order_id")}
+    if not order_ids:
+        return []
+
+    paid_at = datetime.utcnow()
+    moved = db.execute(
+        update(Order)
+        .where(Order.id.in_(order_ids), Order.status == "CREATED", *created_bounds(db, order_ids))
+        .values(status="PAID", updated_at=paid_at)
+        .returning(Order.id, Order.created_at)
+    ).all()
+    paid = [oid for oid, _ in moved]
+    if paid:
+        rows = db.execute(
+            select(OrderItem.order_id, OrderItem.product_id, func.sum(OrderItem.qty))
+            .where(OrderItem.order_created_at.in_({c for _, c in moved}), OrderItem.order_id.in_(paid))
+            .group_by(OrderItem.order_id, OrderItem.product_id)
+        ).all()
+        per_order: dict = {}
+        for oid, pid, qty in rows:
+            per_order.setdefault(oid, []).append({"product_id": pid, "qty": int(qty)})
+        resp = client.post(
+            "/catalog/v1/inventory/commit",
+            json={"orders": [{"order_id": oid, "items": items} for oid, items in per_order.items()]},
+            headers={"X-Internal-Key": settings.SVC_INTERNAL_KEY},
+        )
+        resp.raise_for_status()
+        saga.committed(db, paid, paid_at)
+    db.commit()
+    return paid
+
+def validate(records) -> Tuple[list, List[tuple]]:
+    """Split records into (processable, [(record, error)]); a bad payload never becomes valid on replay."""
+    good, bad = [], []
+    for rec in records:
+        ev = rec.value
+        try:
+            if not isinstance(ev, dict):
+                raise ValueError("event is not an object")
+            if ev.get("type") == "payment.succeeded" and int(ev["order_id"]) <= 0:
+                raise ValueError("order_id must be positive")
+            good.append(rec)
+        except (KeyError, TypeError, ValueError) as exc:
+            bad.append((rec, exc))
+    return good, bad
+
+def _isolate(records, client: ServiceClient):
+    # Give up on the batch as a whole: apply records one by one, dead-lettering those that fail
+    for rec in records:
+        try:
+            with SessionLocal() as db:
+                process_batch([rec.value], db, client)
+        except Exception as exc:
+            log.error("payment event %s[%d]@%d dead-lettered: %r", rec.topic, rec.partition, rec.offset, exc)
+            dead_letter(settings.CONSUMER_DLQ_TOPIC, rec, exc)
+            DEAD_LETTERED.labels("failed").inc()
+
+def _backoff(failures: int) -> float:
+    return min(settings.CONSUMER_RETRY_MAX_BACKOFF_SECONDS, settings.CONSUMER_RETRY_BACKOFF_SECONDS * 2 ** (failures - 1))
+
+def _record_lag(consumer: KafkaConsumer):
+    for tp in consumer.assignment():
+        hw = consumer.highwater(tp)  # cached from fetch responses, no broker round trip
+        if hw is not None:
+            CONSUMER_LAG.labels(tp.topic, tp.partition).set(max(0, hw - consumer.position(tp)))
+
+def consume(consumer: KafkaConsumer, client: ServiceClient):
+    """Poll/apply/commit until stopped.
+
+    A batch that fails with a transient error (catalog or DB down) is rewound and retried with
+    exponential backoff, up to CONSUMER_MAX_ATTEMPTS times in a row. A non-transient failure,
+    or running out of attempts, applies the batch record by record instead, and the records
+    that still fail go to CONSUMER_DLQ_TOPIC. Malformed events go there straight away. Either
+    way the partition moves on.
+    """
+    failures = 0
+    while not _stop_event.is_set():
+        batch = consumer.poll(timeout_ms=settings.CONSUMER_POLL_MS)
+        if not batch:
+            _record_lag(consumer)
+            continue
+        records = [rec for recs in batch.values() for rec in recs]
+        BATCH_SIZE.observe(len(records))
+        good, bad = validate(records)
+        try:
+            try:
+                with SessionLocal() as db:
+                    process_batch((rec.value for rec in good), db, client)
+            except Exception as exc:
+                failures += 1
+                BATCH_FAILURES.inc()
+                if retryable(exc) and failures < settings.CONSUMER_MAX_ATTEMPTS:
+                    raise
+                log.error("payment batch failed (%r, attempt %d); applying %d records one by one",
+                          exc, failures, len(good))
+                _isolate(good, client)
+            for rec, exc in bad:
+                log.error("malformed payment event %s[%d]@%d dead-lettered: %s", rec.topic, rec.partition, rec.offset, exc)
+                dead_letter(settings.CONSUMER_DLQ_TOPIC, rec, exc)
+                DEAD_LETTERED.labels("invalid").inc()
+            consumer.commit()
+            failures = 0
+        except Exception:
+            # Nothing was committed: rewind to the batch start and retry after a pause
+            log.exception("payment batch failed; retrying %d records", len(records))
+            for tp, recs in batch.items():
+                consumer.seek(tp, recs[0].offset)
+            _stop_event.wait(_backoff(max(failures, 1)))
+        _record_lag(consumer)
 
 def run_loop():
     consumer = KafkaConsumer(
@@ -28,17 +149,13 @@ def run_loop():
         bootstrap_servers=[settings.KAFKA_BOOTSTRAP],
         group_id="order-service",
         value_deserializer=lambda v: json.loads(v.decode("utf-8")),
-        enable_auto_commit=True,
+        enable_auto_commit=False,
         auto_offset_reset="earliest",
+        max_poll_records=settings.CONSUMER_MAX_RECORDS,
     )
-    db = SessionLocal()
     try:
-        for msg in consumer:
-            if _stop_event.is_set(): break
-            ev = msg.value
-            process_event(ev, db)
+        consume(consumer, get_client("catalog", settings.CATALOG_BASE))
     finally:
-        db.close()
         consumer.close()
 
 def start():
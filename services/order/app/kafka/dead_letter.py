@@ -0,0 +1,26 @@
+from datetime import datetime, timezone
+import httpx
+from fastapi import HTTPException
+from kafka.errors import KafkaError
+from sqlalchemy.exc import InterfaceError, OperationalError
+from app.kafka.producer import send
+
+# Shared by the consumers: what is worth retrying, and where records go once it isn't.
+# Transient means "the same record may well succeed later": a dependency that is down,
+# slow or overloaded. Anything else (bad payload, 4xx, a bug) fails the same way on
+# every replay, so retrying it would only block the partition.
+
+def retryable(exc: BaseException) -> bool:
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code >= 500 or exc.response.status_code == 429
+    if isinstance(exc, HTTPException):
+        return exc.status_code >= 500 or exc.status_code == 429
+    return isinstance(exc, (httpx.RequestError, KafkaError, OperationalError, InterfaceError))
+
+def dead_letter(topic: str, rec, exc: BaseException):
+    """Publish a consumed record that can't be processed to `topic`, for inspection and replay."""
+    key = rec.key.decode("utf-8") if isinstance(rec.key, bytes) else rec.key
+    send(topic, key=key, value={
+        "topic": rec.topic, "partition": rec.partition, "offset": rec.offset, "value": rec.value,
+        "error": repr(exc)[:1000], "failed_at": datetime.now(timezone.utc).isoformat(),
+    })
@@ -0,0 +1,142 @@
+import json, logging, threading, time
+from typing import List, Tuple
+from kafka import KafkaConsumer
+from prometheus_client import Counter, Gauge
+from redis import Redis
+from redis.exceptions import ConnectionError as RedisConnectionError, TimeoutError as RedisTimeoutError
+from app.core.config import settings
+from app.kafka.dead_letter import dead_letter, retryable
+from app.store.order_view import fields_for_event, project
+
+log = logging.getLogger(__name__)
+
+_stop = threading.Event()
+_thread = None
+
+TOPICS = ("order.events", "payment.events", "shipping.events")
+
+PROJECTION_LAG = Gauge("order_projection_lag_seconds", "Age of the newest event applied to the order read-model", ["topic"])
+PROJECTION_BEHIND = Gauge("order_projection_behind", "Messages behind the partition high watermark", ["topic", "partition"])
+PROJECTED = Counter("order_projection_events_total", "Events applied to the order read-model", ["type"])
+DEAD_LETTERED = Counter("order_projection_dead_lettered_total", "Events sent to the projection DLQ", ["reason"])  # invalid, failed
+
+def apply_batch(r: Redis, events) -> int:
+    """Project a batch of events with one pipelined round trip; returns how many touched the view."""
+    pipe = r.pipeline(transaction=False)
+    n = 0
+    for ev in events:
+        fields = fields_for_event(ev)
+        if fields is None or not ev.get("order_id"):
+            continue
+        project(pipe, int(ev["order_id"]), fields)
+        PROJECTED.labels(ev["type"]).inc()
+        n += 1
+    if n:
+        pipe.execute()
+    return n
+
+def validate(records) -> Tuple[list, List[tuple]]:
+    """Split records into (projectable, [(record, error)]); a bad payload never becomes valid on replay."""
+    good, bad = [], []
+    for rec in records:
+        ev = rec.value
+        try:
+            if not isinstance(ev, dict):
+                raise ValueError("event is not an object")
+            if fields_for_event(ev) is not None and ev.get("order_id") and int(ev["order_id"]) <= 0:
+                raise ValueError("order_id must be positive")
+            good.append(rec)
+        except (KeyError, TypeError, ValueError) as exc:
+            bad.append((rec, exc))
+    return good, bad
+
+def _transient(exc: BaseException) -> bool:
+    return isinstance(exc, (RedisConnectionError, RedisTimeoutError)) or retryable(exc)
+
+def _isolate(r: Redis, records):
+    # Give up on the batch as a whole: project records one by one, dead-lettering those that fail
+    for rec in records:
+        try:
+            apply_batch(r, [rec.value])
+        except Exception as exc:
+            log.error("projection event %s[%d]@%d dead-lettered: %r", rec.topic, rec.partition, rec.offset, exc)
+            dead_letter(settings.PROJECTION_DLQ_TOPIC, rec, exc)
+            DEAD_LETTERED.labels("failed").inc()
+
+def _backoff(failures: int) -> float:
+    return min(settings.CONSUMER_RETRY_MAX_BACKOFF_SECONDS, settings.CONSUMER_RETRY_BACKOFF_SECONDS * 2 ** (failures - 1))
+
+def _record_lag(consumer: KafkaConsumer):
+    for tp in consumer.assignment():
+        hw = consumer.highwater(tp)
+        if hw is not None:
+            PROJECTION_BEHIND.labels(tp.topic, tp.partition).set(max(0, hw - consumer.position(tp)))
+
+def consume(consumer: KafkaConsumer, r: Redis):
+    """Poll/project/commit until stopped.
+
+    Redis being unreachable rewinds the batch and retries it with exponential backoff, up to
+    CONSUMER_MAX_ATTEMPTS times in a row. Any other failure, or running out of attempts,
+    projects the batch record by record, and the records that still fail go to
+    PROJECTION_DLQ_TOPIC. Malformed events go there straight away. Either way the
+    read model moves on.
+    """
+    failures = 0
+    while not _stop.is_set():
+        batch = consumer.poll(timeout_ms=settings.CONSUMER_POLL_MS)
+        if not batch:
+            _record_lag(consumer)
+            continue
+        good, bad = validate([rec for recs in batch.values() for rec in recs])
+        try:
+            try:
+                apply_batch(r, (rec.value for rec in good))
+            except Exception as exc:
+                failures += 1
+                if _transient(exc) and failures < settings.CONSUMER_MAX_ATTEMPTS:
+                    raise
+                log.error("projection batch failed (%r, attempt %d); projecting %d records one by one",
+                          exc, failures, len(good))
+                _isolate(r, good)
+            for rec, exc in bad:
+                log.error("malformed event %s[%d]@%d dead-lettered: %s", rec.topic, rec.partition, rec.offset, exc)
+                dead_letter(settings.PROJECTION_DLQ_TOPIC, rec, exc)
+                DEAD_LETTERED.labels("invalid").inc()
+            consumer.commit()
+            failures = 0
+        except Exception:
+            log.exception("projection batch failed; retrying")
+            for tp, recs in batch.items():
+                consumer.seek(tp, recs[0].offset)
+            _stop.wait(_backoff(max(failures, 1)))
+            continue
+        now = time.time()
+        for tp, recs in batch.items():
+            PROJECTION_LAG.labels(tp.topic).set(max(0.0, now - recs[-1].timestamp / 1000))
+        _record_lag(consumer)
+
+def _run():
+    consumer = KafkaConsumer(
+        *TOPICS,
+        bootstrap_servers=[settings.KAFKA_BOOTSTRAP],
+        group_id="order-projection",
+        value_deserializer=lambda v: json.loads(v.decode("utf-8")),
+        enable_auto_commit=False,
+        auto_offset_reset="earliest",
+        max_poll_records=settings.CONSUMER_MAX_RECORDS,
+    )
+    try:
+        consume(consumer, Redis.from_url(settings.REDIS_URL, decode_responses=True))
+    finally:
+        consumer.close()
+
+def start():
+    global _thread
+    if _thread and _thread.is_alive():
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_run, daemon=True)
+    _thread.start()
+
+def stop():
+    _stop.set()
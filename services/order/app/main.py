@@ -2,6 +2,11 @@ from fastapi import FastAPI
 from app.version import VERSION
 from app.api import routes
 from app.kafka import consumer as payment_consumer
+from app.kafka import checkout_worker
+from app.kafka import projector
+from app.core import http
+from app.services import saga
+from app.store.order_events import close_hub
 from prometheus_fastapi_instrumentator import Instrumentator
 
 # Create instrumentator first
@@ -38,12 +43,20 @@ async def startup_event():
         if hasattr(route, "methods") and hasattr(route, "path"):
             print(f"{route.methods} {route.path}")
     
-    # Start Kafka consumer
+    # Start Kafka consumer + async checkout workers + saga expiry sweeper + read-model projector
     payment_consumer.start()
+    checkout_worker.start()
+    saga.start()
+    projector.start()
 
 @app.on_event("shutdown")
 async def shutdown_event():
     payment_consumer.stop()
+    checkout_worker.stop()
+    saga.stop()
+    projector.stop()
+    http.close_all()
+    await close_hub()
 
 # Include routers
 app.include_router(routes.router, prefix='/order', tags=["orders"])
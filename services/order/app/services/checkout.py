@@ -0,0 +1,182 @@
+import threading, time
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import httpx
+from fastapi import HTTPException
+from prometheus_client import Counter
+from app.core.config import settings
+from app.core.http import get_client
+from app.kafka.producer import send
+
+# Checkout steps shared by the synchronous route and the async command worker.
+
+def cart_total(items: List[Dict[str, Any]]) -> int:
+    return sum(int(it["qty"]) * int(it["unit_price_cents"]) for it in items)
+
+PRICE_CACHE_REQUESTS = Counter("order_price_cache_requests_total", "Catalog price lookups by cache result", ["result"])
+
+# product_id -> (expires_at, {price_cents, active, available, title, ...})
+_price_cache: Dict[int, Tuple[float, Dict[str, Any]]] = {}
+_price_lock = threading.Lock()
+
+class CartChanged(Exception):
+    """Catalog disagrees with the cart snapshot; carries the report and the cart fix-ups."""
+    def __init__(self, report: Dict[str, Any], updates: List[Dict[str, Any]], removals: List[int]):
+        super().__init__("cart changed")
+        self.report, self.updates, self.removals = report, updates, removals
+
+def lookup_products(product_ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+    """Current price/availability for many products: in-process TTL cache, then one bulk catalog call."""
+    now = time.monotonic()
+    found, misses = {}, []
+    with _price_lock:
+        for pid in set(product_ids):
+            hit = _price_cache.get(pid)
+            if hit and hit[0] > now:
+                found[pid] = hit[1]
+            else:
+                misses.append(pid)
+    PRICE_CACHE_REQUESTS.labels("hit").inc(len(found))
+    if not misses:
+        return found
+
+    PRICE_CACHE_REQUESTS.labels("miss").inc(len(misses))
+    try:
+        resp = get_client("catalog", settings.CATALOG_BASE).post("/catalog/v1/products/lookup", json={"ids": misses})
+    except httpx.RequestError:
+        raise HTTPException(status_code=503, detail="Catalog unavailable")
+    if resp.status_code != 200:
+        raise HTTPException(status_code=502, detail="Catalog price lookup failed")
+    expires = now + settings.PRICE_CACHE_TTL_SECONDS
+    with _price_lock:
+        if len(_price_cache) + len(misses) > settings.PRICE_CACHE_MAX_ENTRIES:
+            _price_cache.clear()
+        for p in resp.json():
+            _price_cache[p["id"]] = (expires, p)
+            found[p["id"]] = p
+    return found
+
+def revalidate_cart(items: List[Dict[str, Any]]):
+    """Raise CartChanged if any line is repriced, inactive, unknown or short on stock."""
+    products = lookup_products(int(it["product_id"]) for it in items)
+    repriced, unavailable, updates, removals = [], [], [], []
+    for it in items:
+        pid, qty = int(it["product_id"]), int(it["qty"])
+        p: Optional[Dict[str, Any]] = products.get(pid)
+        if p is None or not p["active"]:
+            unavailable.append({"product_id": pid, "reason": "not_found" if p is None else "inactive"})
+            removals.append(pid)
+        elif p["available"] < qty:
+            unavailable.append({"product_id": pid, "reason": "insufficient_stock", "available": p["available"]})
+        elif int(p["price_cents"]) != int(it["unit_price_cents"]):
+            repriced.append({"product_id": pid, "old_unit_price_cents": int(it["unit_price_cents"]),
+                             "new_unit_price_cents": int(p["price_cents"])})
+            updates.append(dict(it, unit_price_cents=int(p["price_cents"]), title=p["title"]))
+    if repriced or unavailable:
+        raise CartChanged({"code": "cart_changed", "repriced": repriced, "unavailable": unavailable}, updates, removals)
+
+def _inventory_body(items: List[Dict[str, Any]], order_id: Optional[int]) -> Dict[str, Any]:
+    lines = [{"product_id": it["product_id"], "qty": it["qty"]} for it in items]
+    # With an order id, catalog applies the step once per order, so a replayed call is a no-op
+    return {"items": lines} if order_id is None else {"orders": [{"order_id": order_id, "items": lines}]}
+
+def reserve_inventory(items: List[Dict[str, Any]], order_id: Optional[int] = None):
+    try:
+        resp = get_client("catalog", settings.CATALOG_BASE).post(
+            "/catalog/v1/inventory/reserve",
+            json=_inventory_body(items, order_id),
+            headers={"X-Internal-Key": settings.SVC_INTERNAL_KEY},
+        )
+    except httpx.RequestError:
+        raise HTTPException(status_code=503, detail="Catalog unavailable")
+    if resp.status_code != 200:
+        raise HTTPException(status_code=resp.status_code, detail=resp.text)
+
+def release_inventory(items: List[Dict[str, Any]], order_id: Optional[int] = None):
+    """Compensation for reserve_inventory: hand the held stock back."""
+    resp = get_client("catalog", settings.CATALOG_BASE).post(
+        "/catalog/v1/inventory/release",
+        json=_inventory_body(items, order_id),
+        headers={"X-Internal-Key": settings.SVC_INTERNAL_KEY},
+    )
+    resp.raise_for_status()
+
+def create_shipment(order_id: int, email: str, address: Dict[str, Any]) -> int:
+    """Create the shipment draft (PENDING_PAYMENT) in Shipping; returns its id."""
+    try:
+        sresp = get_client("shipping", settings.SHIPPING_BASE).post(
+            "/shipping/v1/shipments",
+            json={
+                "order_id": order_id,
+                "user_email": email,
+                "address_line1": address["address_line1"],
+                "address_line2": address.get("address_line2") or "",
+                "city": address["city"],
+                "country": address["country"],
+                "postcode": address["postcode"],
+            },
+        )
+    except httpx.RequestError:
+        raise HTTPException(status_code=503, detail="Shipping unavailable")
+    if sresp.status_code >= 400:
+        raise HTTPException(status_code=502, detail="Shipping create failed")
+    return int(sresp.json()["id"])
+
+def emit_order_created(order_id: int, email: str, total: int, items: List[Dict[str, Any]],
+                       currency: str = "USD", created_at: Optional[datetime] = None):
+    send(
+        topic="order.events",
+        key=str(order_id),
+        value={
+            "type": "order.created",
+            "order_id": order_id,
+            "user_email": email,
+            "amount_cents": total,
+            "currency": currency,
+            "created_at": created_at.isoformat() if created_at else None,
+            "items": [
+                {
+                    "product_id": it["product_id"],
+                    "qty": it["qty"],
+                    "unit_price_cents": it["unit_price_cents"],
+                }
+                for it in items
+            ],
+        },
+    )
+
+def emit_order_rejected(order_id: int, email: str, reason: str):
+    send(
+        topic="order.events",
+        key=str(order_id),
+        value={"type": "order.rejected", "order_id": order_id, "user_email": email, "reason": reason},
+    )
+
+def emit_order_failed(order_id: int, email: str, reason: str):
+    send(
+        topic="order.events",
+        key=str(order_id),
+        value={"type": "order.failed", "order_id": order_id, "user_email": email, "reason": reason},
+    )
+
+def request_checkout(order_id: int, email: str, total: int, items: List[Dict[str, Any]], address: Dict[str, Any]):
+    """Publish the command the checkout worker pool picks up (async mode)."""
+    send(
+        topic=settings.TOPIC_ORDER_COMMANDS,
+        key=str(order_id),
+        value={
+            "type": "order.checkout_requested",
+            "order_id": order_id,
+            "user_email": email,
+            "amount_cents": total,
+            "items": [
+                {
+                    "product_id": it["product_id"],
+                    "qty": it["qty"],
+                    "unit_price_cents": it["unit_price_cents"],
+                }
+                for it in items
+            ],
+            "shipping_address": address,
+        },
+    )
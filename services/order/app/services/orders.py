@@ -0,0 +1,116 @@
+import base64
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from sqlalchemy import insert, select, tuple_
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+from app.db import models
+from app.db.partitions import created_window
+
+def create_order(db: Session, email: str, items: List[Dict[str, Any]], total_cents: int, currency: str = "USD", status: str = "CREATED") -> models.Order:
+    """Persist an order and all of its items in one transaction.
+
+    The order row is flushed (INSERT ... RETURNING id), then every item goes in
+    with a single bulk INSERT ... RETURNING, and `order.items` is populated from
+    the returned rows so callers never trigger a lazy load. The caller commits.
+    """
+    order = models.Order(user_email=email, status=status, total_cents=total_cents, currency=currency)
+    db.add(order)
+    db.flush()
+
+    rows = [
+        {
+            "order_id": order.id,
+            "order_created_at": order.created_at,
+            "product_id": int(it["product_id"]),
+            "qty": int(it["qty"]),
+            "unit_price_cents": int(it["unit_price_cents"]),
+            "title_snapshot": it.get("title", ""),
+        }
+        for it in items
+    ]
+    order_items = list(db.scalars(insert(models.OrderItem).returning(models.OrderItem), rows)) if rows else []
+    set_committed_value(order, "items", order_items)
+    return order
+
+def encode_cursor(order: models.Order) -> str:
+    raw = f"{order.created_at.isoformat()}|{order.id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    created_at, order_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|", 1)
+    return datetime.fromisoformat(created_at), int(order_id)
+
+def load_items(db: Session, orders: Sequence[models.Order]):
+    """Populate `items` for many orders with one SELECT that names the partition key.
+
+    `order_created_at IN (...)` lets Postgres prune order_items to the months the
+    orders live in, instead of probing every monthly partition's order_id index.
+    """
+    if not orders:
+        return
+    by_order: Dict[int, List[models.OrderItem]] = {o.id: [] for o in orders}
+    rows = db.scalars(
+        select(models.OrderItem)
+        .where(
+            models.OrderItem.order_created_at.in_({o.created_at for o in orders}),
+            models.OrderItem.order_id.in_(list(by_order)),
+        )
+        .order_by(models.OrderItem.id)
+    )
+    for it in rows:
+        by_order[it.order_id].append(it)
+    for o in orders:
+        set_committed_value(o, "items", by_order[o.id])
+
+def list_orders(
+    db: Session,
+    email: Optional[str],
+    statuses: Optional[Sequence[str]] = None,
+    limit: int = 20,
+    cursor: Optional[str] = None,
+) -> Tuple[List[models.Order], Optional[str]]:
+    """Newest-first keyset page of orders, items loaded with one extra SELECT (see load_items).
+
+    Ordering matches ix_orders_user_created (user_email, created_at DESC, id DESC),
+    so a page is an index range scan regardless of how deep the cursor is.
+    """
+    stmt = select(models.Order)
+    if email is not None:
+        stmt = stmt.where(models.Order.user_email == email)
+    if statuses:
+        stmt = stmt.where(models.Order.status.in_(list(statuses)))
+    if cursor:
+        created_at, order_id = decode_cursor(cursor)
+        # The plain created_at bound is redundant for correctness but, unlike the row
+        # comparison, lets the planner skip monthly partitions newer than the cursor
+        stmt = stmt.where(
+            models.Order.created_at <= created_at,
+            tuple_(models.Order.created_at, models.Order.id) < (created_at, order_id),
+        )
+    stmt = stmt.order_by(models.Order.created_at.desc(), models.Order.id.desc()).limit(limit + 1)
+
+    rows = list(db.scalars(stmt))
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    rows = rows[:limit]
+    load_items(db, rows)
+    return rows, next_cursor
+
+def created_bounds(db: Session, order_ids: Sequence[int]) -> list:
+    """created_at conditions that let Postgres prune a lookup by id to the months holding `order_ids`
+    (none when the months can't be told, e.g. on SQLite)."""
+    window = created_window(db.connection(), order_ids)
+    if window is None:
+        return []
+    lo, hi = window
+    return [models.Order.created_at >= lo] + ([models.Order.created_at < hi] if hi else [])
+
+def emails_for(db: Session, order_ids: Sequence[int]) -> Dict[int, str]:
+    """order_id -> user_email for the ids that exist, in one SELECT (for notifications' lookups)."""
+    if not order_ids:
+        return {}
+    ids = list(order_ids)
+    return dict(db.execute(
+        select(models.Order.id, models.Order.user_email)
+        .where(models.Order.id.in_(ids), *created_bounds(db, ids))
+    ).all())
@@ -0,0 +1,240 @@
+import logging, threading, time
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+import httpx
+from prometheus_client import Counter, Gauge, Histogram
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.core.http import get_client
+from app.db.models import Order, OrderItem, OrderSaga
+from app.db.session import SessionLocal
+from app.kafka.producer import send
+from app.services.checkout import release_inventory
+from app.services.orders import created_bounds
+
+log = logging.getLogger(__name__)
+
+# Checkout saga, one row per order in order_sagas:
+#   RESERVED -> SHIPMENT_DRAFTED -> COMMITTED        (payment.succeeded; paid_at + committed_at)
+#   RESERVED | SHIPMENT_DRAFTED -> COMPENSATED       (step failed, or unpaid past expires_at)
+# Compensation releases the reserved stock, cancels the shipment draft and the order.
+RESERVED, SHIPMENT_DRAFTED, COMMITTED, COMPENSATED = "RESERVED", "SHIPMENT_DRAFTED", "COMMITTED", "COMPENSATED"
+OPEN_STATES = (RESERVED, SHIPMENT_DRAFTED)
+CANCELLABLE_ORDER_STATUSES = ("PENDING", "CREATED")
+
+SAGA_STEPS = Counter("order_saga_steps_total", "Saga steps recorded", ["step"])
+SAGA_OPEN = Gauge("order_saga_open", "Open sagas by state (sampled by the expiry sweeper)", ["state"])
+COMPENSATIONS = Counter("order_saga_compensations_total", "Orders compensated", ["reason"])
+DEFERRED = Counter("order_saga_expiry_deferred_total", "Expired sagas left open because the order may be paid", ["reason"])
+COMPENSATION_SECONDS = Histogram("order_saga_compensation_seconds", "Time to compensate one batch of orders", ["reason"])
+
+_stop = threading.Event()
+_thread = None
+
+def begin(db: Session, order_id: int):
+    """Stock is held for the order: record it and start the payment clock. Caller commits.
+
+    A no-op when the saga already exists (a checkout command replayed after a crash).
+    """
+    if db.get(OrderSaga, order_id) is not None:
+        return
+    now = datetime.utcnow()
+    db.add(OrderSaga(
+        order_id=order_id, state=RESERVED, reserved_at=now, updated_at=now,
+        expires_at=now + timedelta(seconds=settings.ORDER_PAYMENT_TIMEOUT_SECONDS),
+    ))
+    SAGA_STEPS.labels("reserved").inc()
+
+def shipment_drafted(db: Session, order_id: int, shipment_id: int):
+    now = datetime.utcnow()
+    db.execute(
+        update(OrderSaga)
+        .where(OrderSaga.order_id == order_id, OrderSaga.state == RESERVED)
+        .values(state=SHIPMENT_DRAFTED, shipment_id=shipment_id, shipment_drafted_at=now, updated_at=now)
+    )
+    SAGA_STEPS.labels("shipment_drafted").inc()
+
+def committed(db: Session, order_ids: List[int], paid_at: datetime):
+    """Close the sagas of orders that were paid and committed in catalog (same transaction)."""
+    if not order_ids:
+        return
+    now = datetime.utcnow()
+    n = db.execute(
+        update(OrderSaga)
+        .where(OrderSaga.order_id.in_(order_ids), OrderSaga.state.in_(OPEN_STATES))
+        .values(state=COMMITTED, paid_at=paid_at, committed_at=now, updated_at=now)
+    ).rowcount
+    SAGA_STEPS.labels("paid").inc(n)
+    SAGA_STEPS.labels("committed").inc(n)
+
+def compensate(db: Session, order_ids: Iterable[int], reason: str) -> List[int]:
+    """Cancel still-unpaid orders and undo their completed steps; returns the cancelled ids.
+
+    Orders flip to CANCELLED with one conditional UPDATE, so a payment that commits
+    first wins and the order drops out here. Each saga's reservation is released
+    under its order id before the commit, which catalog applies once per order; if
+    catalog fails the caller rolls back and the sweeper's retry skips the orders
+    already released. Shipment cancels are best
+    effort (a stray PENDING_PAYMENT draft never ships) and only recorded on failure.
+    """
+    started = time.perf_counter()
+    now = datetime.utcnow()
+    order_ids = list(order_ids)
+    cancelled = db.execute(
+        update(Order)
+        .where(Order.id.in_(order_ids), Order.status.in_(CANCELLABLE_ORDER_STATUSES), *created_bounds(db, order_ids))
+        .values(status="CANCELLED", updated_at=now)
+        .returning(Order.id, Order.user_email, Order.created_at)
+    ).all()
+    if not cancelled:
+        db.commit()
+        return []
+    ids = [oid for oid, _, _ in cancelled]
+    created = {oid: c for oid, _, c in cancelled}
+    sagas = list(db.scalars(
+        select(OrderSaga).where(OrderSaga.order_id.in_(ids), OrderSaga.state.in_(OPEN_STATES))
+    ))
+
+    if sagas:
+        lines: Dict[int, List[Dict[str, int]]] = {}
+        for oid, pid, qty in db.execute(
+            select(OrderItem.order_id, OrderItem.product_id, OrderItem.qty)
+            .where(
+                OrderItem.order_created_at.in_({created[s.order_id] for s in sagas}),
+                OrderItem.order_id.in_([s.order_id for s in sagas]),
+            )
+        ):
+            lines.setdefault(oid, []).append({"product_id": pid, "qty": qty})
+        for s in sagas:
+            if lines.get(s.order_id):
+                release_inventory(lines[s.order_id], order_id=s.order_id)
+
+    shipping = get_client("shipping", settings.SHIPPING_BASE)
+    for s in sagas:
+        if s.shipment_id is not None:
+            try:
+                shipping.post(f"/shipping/v1/shipments/{s.shipment_id}/cancel", idempotent=True).raise_for_status()
+            except httpx.HTTPError as exc:
+                log.warning("shipment %s cancel failed for order %s: %s", s.shipment_id, s.order_id, exc)
+                s.last_error = f"shipment cancel failed: {exc}"[:255]
+        s.state, s.compensated_at, s.updated_at = COMPENSATED, now, now
+    db.commit()
+
+    for oid, email, _ in cancelled:
+        send(
+            topic="order.events",
+            key=str(oid),
+            value={"type": "order.cancelled", "order_id": oid, "user_email": email, "reason": reason},
+        )
+    COMPENSATIONS.labels(reason).inc(len(ids))
+    SAGA_STEPS.labels("compensated").inc(len(sagas))
+    COMPENSATION_SECONDS.labels(reason).observe(time.perf_counter() - started)
+    return ids
+
+def abort(db: Session, order_id: int, reason: str):
+    """Compensate right away after a failed step; anything left open is retried by the sweeper."""
+    try:
+        compensate(db, [order_id], reason)
+    except Exception:
+        db.rollback()
+        log.exception("compensation failed for order %s; left to the expiry sweeper", order_id)
+
+def _settled_elsewhere(order_id: int, shipment_id: Optional[int]) -> Optional[str]:
+    """Why an expired order must not be cancelled yet, or None if it may be.
+
+    The payment may have succeeded with its event still on the way (or the consumer behind),
+    in which case the shipment has usually moved past PENDING_PAYMENT too. When payment or
+    shipping can't be asked, the answer is "not yet" rather than a guess.
+    """
+    try:
+        resp = get_client("payment", settings.PAYMENT_BASE).get(f"/payment/v1/payments/pay_{order_id}")
+    except httpx.RequestError:
+        return "payment_unknown"
+    if resp.status_code == 200:
+        if resp.json().get("status") in ("succeeded", "refunded"):
+            return "payment_succeeded"
+    elif resp.status_code != 404:
+        return "payment_unknown"
+    if shipment_id is None:
+        return None
+    try:
+        sresp = get_client("shipping", settings.SHIPPING_BASE).get(f"/shipping/v1/shipments/{shipment_id}")
+    except httpx.RequestError:
+        return "shipment_unknown"
+    if sresp.status_code == 200:
+        status = sresp.json().get("status")
+        return None if status == "PENDING_PAYMENT" else f"shipment_{str(status).lower()}"
+    return None if sresp.status_code == 404 else "shipment_unknown"
+
+def expire_due(db: Session, limit: int) -> List[int]:
+    """Compensate up to `limit` open sagas whose payment deadline has passed, oldest first.
+
+    Each is checked against payment and shipping first; one that was paid meanwhile (or
+    can't be checked) gets another SAGA_RECHECK_SECONDS instead of being cancelled.
+    """
+    due = db.execute(
+        select(OrderSaga.order_id, OrderSaga.shipment_id)
+        .join(Order, Order.id == OrderSaga.order_id)
+        .where(
+            OrderSaga.state.in_(OPEN_STATES),
+            OrderSaga.expires_at <= datetime.utcnow(),
+            Order.status.in_(CANCELLABLE_ORDER_STATUSES),
+        )
+        .order_by(OrderSaga.expires_at)
+        .limit(limit)
+        # Several order replicas can sweep at once without blocking on each other
+        .with_for_update(of=OrderSaga, skip_locked=True)
+    ).all()
+    if not due:
+        db.rollback()
+        return []
+    expired = []
+    now = datetime.utcnow()
+    for order_id, shipment_id in due:
+        reason = _settled_elsewhere(order_id, shipment_id)
+        if reason is None:
+            expired.append(order_id)
+            continue
+        log.info("order %s past its payment deadline but not cancelled: %s", order_id, reason)
+        DEFERRED.labels(reason).inc()
+        db.execute(
+            update(OrderSaga)
+            .where(OrderSaga.order_id == order_id)
+            .values(expires_at=now + timedelta(seconds=settings.SAGA_RECHECK_SECONDS),
+                    last_error=f"expiry deferred: {reason}", updated_at=now)
+        )
+    if not expired:
+        db.commit()
+        return []
+    return compensate(db, expired, "payment_timeout")
+
+def _sample_open(db: Session):
+    counts = dict(db.execute(
+        select(OrderSaga.state, func.count()).where(OrderSaga.state.in_(OPEN_STATES)).group_by(OrderSaga.state)
+    ).all())
+    for state in OPEN_STATES:
+        SAGA_OPEN.labels(state).set(counts.get(state, 0))
+
+def _run():
+    while not _stop.is_set():
+        try:
+            with SessionLocal() as db:
+                # Drain in batches so one sweep never holds thousands of row locks
+                while not _stop.is_set() and len(expire_due(db, settings.SAGA_SWEEP_BATCH)) == settings.SAGA_SWEEP_BATCH:
+                    pass
+                _sample_open(db)
+        except Exception:
+            log.exception("saga expiry sweep failed")
+        _stop.wait(settings.SAGA_SWEEP_INTERVAL_SECONDS)
+
+def start():
+    global _thread
+    if _thread and _thread.is_alive():
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_run, daemon=True)
+    _thread.start()
+
+def stop():
+    _stop.set()
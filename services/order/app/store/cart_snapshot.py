@@ -0,0 +1,117 @@
+import json
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+from fastapi import HTTPException
+from redis import Redis
+from app.core.config import settings
+
+# Keys per user (all derived from the cart key the cart service writes), all passed in KEYS:
+#   cart:{email}                 live cart hash  {product_id: item_json}
+#   cart:{email}:lock            version of the checkout in flight (PX ttl)
+#   cart:{email}:snap            version of the last unfinished snapshot (survives a crash)
+#   cart:{email}:frozen          that snapshot: the cart being checked out
+#   cart:{email}:version         INCR counter
+# There is at most one snapshot per user: a new lock first restores a stale one.
+
+# Put the snapshot back into the live cart without clobbering edits made since.
+_RESTORE_FN = """
+local function restore(cart, ptr, snap)
+  if redis.call('EXISTS', cart) == 0 then
+    if redis.call('EXISTS', snap) == 1 then redis.call('RENAME', snap, cart) end
+  else
+    local kv = redis.call('HGETALL', snap)
+    for i = 1, #kv, 2 do redis.call('HSETNX', cart, kv[i], kv[i + 1]) end
+    redis.call('DEL', snap)
+  end
+  redis.call('DEL', ptr)
+end
+"""
+
+_LOCK_LUA = _RESTORE_FN + """
+local cart, lock, ptr, counter, snap = KEYS[1], KEYS[2], KEYS[3], KEYS[4], KEYS[5]
+if redis.call('EXISTS', lock) == 1 then return {-1} end
+if redis.call('EXISTS', ptr) == 1 then restore(cart, ptr, snap) end
+if redis.call('EXISTS', cart) == 0 then return {0} end
+local ver = redis.call('INCR', counter)
+redis.call('RENAME', cart, snap)
+redis.call('SET', lock, ver, 'PX', ARGV[1])
+redis.call('SET', ptr, ver)
+return {ver, redis.call('HGETALL', snap)}
+"""
+
+_HOLD_LUA = """
+local lock = KEYS[1]
+if redis.call('GET', lock) ~= ARGV[1] then return 0 end
+redis.call('PEXPIRE', lock, ARGV[2])
+return 1
+"""
+
+_FINISH_LUA = _RESTORE_FN + """
+local cart, lock, ptr, snap = KEYS[1], KEYS[2], KEYS[3], KEYS[5]
+local ver, ok = ARGV[1], ARGV[2]
+if redis.call('GET', ptr) ~= ver then return 0 end
+if ok == '1' then
+  redis.call('DEL', snap, ptr)
+else
+  restore(cart, ptr, snap)
+end
+if redis.call('GET', lock) == ver then redis.call('DEL', lock) end
+return 1
+"""
+
+def _keys(email: str) -> List[str]:
+    cart = f"cart:{email}"
+    return [cart, f"{cart}:lock", f"{cart}:snap", f"{cart}:version", f"{cart}:frozen"]
+
+def _ttl_ms() -> int:
+    return int(settings.CART_LOCK_SECONDS * 1000)
+
+def lock_cart(r: Redis, email: str) -> Tuple[str, List[Dict[str, Any]]]:
+    """Atomically move the cart to a versioned snapshot and lock it (one round trip)."""
+    res = r.register_script(_LOCK_LUA)(keys=_keys(email), args=[_ttl_ms()])
+    if res[0] == -1:
+        raise HTTPException(status_code=409, detail="Checkout already in progress")
+    if res[0] == 0:
+        raise HTTPException(status_code=400, detail="Cart is empty")
+    flat = res[1]
+    return str(res[0]), [json.loads(v) for v in flat[1::2]]
+
+def hold_cart(r: Redis, email: str, version: str):
+    """Check the lock is still ours and extend it; 409 if it lapsed.
+
+    Once the lock expires, the next checkout restores the snapshot and may order the same
+    cart, so a checkout calls this before each step that can't be taken back.
+    """
+    if not r.register_script(_HOLD_LUA)(keys=_keys(email)[1:2], args=[version, _ttl_ms()]):
+        raise HTTPException(status_code=409, detail="Checkout lock expired; please retry")
+
+def finish_cart(r: Redis, email: str, version: str, success: bool):
+    """Drop the snapshot on success, or merge it back into the cart on failure (one round trip)."""
+    r.register_script(_FINISH_LUA)(keys=_keys(email), args=[version, "1" if success else "0"])
+
+@dataclass
+class CartCheckout:
+    items: List[Dict[str, Any]]
+    hold: Callable[[], None]
+
+@contextmanager
+def checkout_cart(r: Redis, email: str) -> Iterator[CartCheckout]:
+    version, items = lock_cart(r, email)
+    try:
+        yield CartCheckout(items, lambda: hold_cart(r, email, version))
+    except BaseException:
+        finish_cart(r, email, version, success=False)
+        raise
+    finish_cart(r, email, version, success=True)
+
+def apply_cart_changes(r: Redis, email: str, updates: List[Dict[str, Any]], removals: List[int]):
+    """Write catalog's current prices back into the (restored) cart and drop dead lines, one round trip."""
+    if not updates and not removals:
+        return
+    pipe = r.pipeline(transaction=True)
+    for it in updates:
+        pipe.hset(f"cart:{email}", str(it["product_id"]), json.dumps(it))
+    if removals:
+        pipe.hdel(f"cart:{email}", *[str(pid) for pid in removals])
+    pipe.execute()
@@ -0,0 +1,181 @@
+import asyncio, json, logging, re
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple
+from prometheus_client import Counter, Gauge
+from redis.asyncio import BlockingConnectionPool, Redis as AsyncRedis
+from app.core.config import settings
+from app.store.order_view import channel_for, stream_key
+
+log = logging.getLogger(__name__)
+
+SSE_SUBSCRIBERS = Gauge("order_sse_subscribers", "Open SSE order streams in this process")
+SSE_EVENTS = Counter("order_sse_events_total", "Frames written to SSE order streams", ["kind"])
+
+_STREAM_ID = re.compile(r"^\d+-\d+$")
+
+class Subscriber:
+    """One stream's inbox: a short list, plus a future it parks on only while idle.
+
+    Deliberately not an asyncio.Queue (~3 KB each); thousands of these sit idle per worker.
+    """
+    __slots__ = ("events", "waiter", "overflowed")
+
+    def __init__(self):
+        self.events: List[dict] = []
+        self.waiter: Optional[asyncio.Future] = None
+        self.overflowed = False
+
+    def push(self, event: dict):
+        if len(self.events) >= settings.SSE_QUEUE_SIZE:
+            # Slow client: drop the backlog, it re-reads the stream from its last id instead
+            self.events.clear()
+            self.overflowed = True
+        else:
+            self.events.append(event)
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_result(None)
+
+    async def wait(self, timeout: float) -> bool:
+        """True when there is something to deliver, False on timeout (time for a heartbeat)."""
+        if self.events or self.overflowed:
+            return True
+        self.waiter = asyncio.get_running_loop().create_future()
+        try:
+            await asyncio.wait_for(self.waiter, timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self.waiter = None
+
+class Hub:
+    """Fans one Redis pub/sub connection per process out to every local SSE stream.
+
+    A channel is subscribed only while some local stream watches that order, so
+    an idle stream costs a Subscriber, not a Redis connection.
+    """
+
+    def __init__(self, r: AsyncRedis):
+        self.r = r
+        self._pubsub = r.pubsub(ignore_subscribe_messages=True)
+        self._subs: Dict[int, Set[Subscriber]] = {}
+        self._reader: Optional[asyncio.Task] = None
+
+    async def subscribe(self, order_id: int) -> Subscriber:
+        sub = Subscriber()
+        subs = self._subs.setdefault(order_id, set())
+        subs.add(sub)
+        SSE_SUBSCRIBERS.inc()
+        if len(subs) == 1:
+            await self._pubsub.subscribe(channel_for(order_id))
+        if self._reader is None or self._reader.done():
+            self._reader = asyncio.create_task(self._read())
+        return sub
+
+    async def unsubscribe(self, order_id: int, sub: Subscriber):
+        SSE_SUBSCRIBERS.dec()
+        subs = self._subs.get(order_id)
+        if subs is None:
+            return
+        subs.discard(sub)
+        if not subs:
+            del self._subs[order_id]
+            await self._pubsub.unsubscribe(channel_for(order_id))
+
+    def dispatch(self, channel: str, payload: str):
+        order_id = int(channel.rsplit(":", 1)[1])
+        event = json.loads(payload)
+        for sub in self._subs.get(order_id, ()):
+            sub.push(event)
+
+    async def _read(self):
+        while self._subs:
+            try:
+                if not self._pubsub.subscribed:
+                    await asyncio.sleep(0.05)
+                    continue
+                msg = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception("order updates subscription failed; retrying")
+                await asyncio.sleep(1)
+                continue
+            if msg and msg["type"] == "message":
+                self.dispatch(msg["channel"], msg["data"])
+
+    async def close(self):
+        if self._reader is not None:
+            self._reader.cancel()
+        await self._pubsub.aclose()
+        await self.r.aclose()
+
+_hub: Optional[Hub] = None
+
+def get_hub() -> Hub:
+    global _hub
+    if _hub is None:
+        # Bounded pool: a reconnect storm queues its history reads instead of opening
+        # one Redis connection per stream
+        pool = BlockingConnectionPool.from_url(
+            settings.REDIS_URL, max_connections=settings.SSE_REDIS_MAX_CONNECTIONS, decode_responses=True,
+        )
+        _hub = Hub(AsyncRedis(connection_pool=pool))
+    return _hub
+
+async def close_hub():
+    global _hub
+    if _hub is not None:
+        await _hub.close()
+        _hub = None
+
+def _sid(entry_id: str) -> Tuple[int, int]:
+    ms, seq = entry_id.split("-")
+    return int(ms), int(seq)
+
+def _frame(entry_id: str, data: str) -> str:
+    return f"id: {entry_id}\nevent: status\ndata: {data}\n\n"
+
+def _terminal(data: str) -> bool:
+    ev = json.loads(data)
+    return ev.get("status") in ("CANCELLED", "REJECTED", "FAILED") or ev.get("shipment_status") in ("DELIVERED", "CANCELLED")
+
+async def _history(hub: Hub, order_id: int, after: Optional[str]) -> List[Tuple[str, str]]:
+    if after:
+        entries = await hub.r.xrange(stream_key(order_id), min=f"({after}", max="+")
+    else:
+        entries = await hub.r.xrevrange(stream_key(order_id), count=1)  # current state only
+    return [(eid, fields["data"]) for eid, fields in entries]
+
+async def stream_order_events(hub: Hub, order_id: int, last_event_id: Optional[str] = None) -> AsyncIterator[str]:
+    """SSE frames for one order: replay after Last-Event-ID (or the latest state), then live
+    transitions with comment heartbeats. Ends after a terminal transition."""
+    if last_event_id and not _STREAM_ID.match(last_event_id):
+        last_event_id = None
+    # Subscribe before reading history so nothing published in between is lost
+    sub = await hub.subscribe(order_id)
+    try:
+        yield f"retry: {settings.SSE_RETRY_MS}\n\n"
+        last = last_event_id
+        pending = await _history(hub, order_id, last)
+        while True:
+            for eid, data in pending:
+                if last and _sid(eid) <= _sid(last):
+                    continue
+                last = eid
+                SSE_EVENTS.labels("status").inc()
+                yield _frame(eid, data)
+                if _terminal(data):
+                    return
+            if not await sub.wait(settings.SSE_HEARTBEAT_SECONDS):
+                SSE_EVENTS.labels("heartbeat").inc()
+                yield ": ping\n\n"
+                pending = []
+                continue
+            if sub.overflowed:
+                sub.overflowed = False
+                pending = await _history(hub, order_id, last)
+            else:
+                pending = [(ev["id"], ev["data"]) for ev in sub.events]
+                sub.events.clear()
+    finally:
+        await hub.unsubscribe(order_id, sub)
@@ -0,0 +1,186 @@
+import argparse, json
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from prometheus_client import Counter
+from redis import Redis
+from sqlalchemy import select, tuple_
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.db.models import Order
+from app.services.orders import load_items
+
+# Denormalized order document served to status pollers, one hash per order:
+#   order:view:{id}     user_email, total_cents, currency, created_at, items (json),
+#                       status, shipment_id, shipment_status, carrier, tracking_number
+#   order:stream:{id}   capped stream of status transitions (SSE resume via Last-Event-ID)
+#   order:updates:{id}  pub/sub channel the same transitions are published on
+# Ranked fields keep a `<field>:rank` next to them and only move strictly forward, so events
+# from three topics and DB fills can land in any order without regressing the view.
+# Terminal states share the top rank: the first one recorded wins and a later, different
+# terminal value (which the DB's conditional updates never produce) can't overwrite it.
+
+ORDER_RANK = {"PENDING": 0, "CREATED": 1, "PAID": 2, "REJECTED": 2, "CANCELLED": 2, "FAILED": 2}
+SHIPMENT_RANK = {"PENDING_PAYMENT": 0, "READY_TO_SHIP": 1, "DISPATCHED": 2, "DELIVERED": 3, "CANCELLED": 3}
+
+_PROJECT_LUA = """
+local view, stream = KEYS[1], KEYS[2]
+local ttl, maxlen, channel, order_id = ARGV[1], ARGV[2], ARGV[3], tonumber(ARGV[4])
+local changed = false
+for i = 5, #ARGV, 3 do
+  local f, v, rank = ARGV[i], ARGV[i + 1], tonumber(ARGV[i + 2])
+  if rank < 0 then
+    redis.call('HSET', view, f, v)
+  else
+    local cur = tonumber(redis.call('HGET', view, f .. ':rank') or '-1')
+    if rank > cur then
+      redis.call('HSET', view, f, v, f .. ':rank', rank)
+      changed = true
+    end
+  end
+end
+redis.call('EXPIRE', view, ttl)
+if not changed then return false end
+-- A real transition: append it to the order's stream (resume point for SSE) and fan it out
+local h = redis.call('HMGET', view, 'status', 'shipment_status', 'shipment_id', 'carrier', 'tracking_number')
+local data = cjson.encode({order_id = order_id, status = h[1] or '', shipment_status = h[2] or '',
+                           shipment_id = h[3] or '', carrier = h[4] or '', tracking_number = h[5] or ''})
+local id = redis.call('XADD', stream, 'MAXLEN', '~', maxlen, '*', 'data', data)
+redis.call('EXPIRE', stream, ttl)
+redis.call('PUBLISH', channel, cjson.encode({id = id, data = data}))
+return id
+"""
+
+VIEW_READS = Counter("order_view_reads_total", "GET /v1/orders/{id} reads by source", ["source"])
+
+Fields = List[Tuple[str, Any, int]]  # (field, value, rank); rank -1 = unconditional
+
+def view_key(order_id: int) -> str:
+    return f"order:view:{order_id}"
+
+def stream_key(order_id: int) -> str:
+    return f"order:stream:{order_id}"
+
+def channel_for(order_id: int) -> str:
+    return f"order:updates:{order_id}"
+
+def project(r: Redis, order_id: int, fields: Fields):
+    """Merge fields into the view, publishing a transition if a ranked field moved.
+
+    `r` may be a pipeline to batch many orders into one round trip.
+    """
+    args: List[Any] = [settings.ORDER_VIEW_TTL_SECONDS, settings.ORDER_STREAM_MAXLEN, channel_for(order_id), order_id]
+    for name, value, rank in fields:
+        args += [name, "" if value is None else value, rank]
+    r.register_script(_PROJECT_LUA)(keys=[view_key(order_id), stream_key(order_id)], args=args, client=r)
+
+def _header(email: str, total_cents: int, currency: str, created_at: Optional[str], items: Iterable[Dict[str, Any]]) -> Fields:
+    return [
+        ("user_email", email, -1),
+        ("total_cents", int(total_cents), -1),
+        ("currency", currency or "USD", -1),
+        ("created_at", created_at or "", -1),
+        ("items", json.dumps([
+            {"product_id": it["product_id"], "qty": it["qty"], "unit_price_cents": it["unit_price_cents"]} for it in items
+        ]), -1),
+    ]
+
+def _status(status: str) -> Fields:
+    return [("status", status, ORDER_RANK.get(status, 0))]
+
+def _shipment(status: str, shipment_id: Any = None, **extra: Any) -> Fields:
+    fields = [("shipment_status", status, SHIPMENT_RANK.get(status, 0))]
+    if shipment_id is not None:
+        fields.append(("shipment_id", int(shipment_id), -1))
+    fields += [(k, v, -1) for k, v in extra.items() if v]
+    return fields
+
+def fields_for_event(ev: Dict[str, Any]) -> Optional[Fields]:
+    """Map an order/payment/shipping event to view fields; None if it doesn't touch the view."""
+    kind = ev.get("type")
+    if kind == "order.created":
+        return _header(ev.get("user_email", ""), ev.get("amount_cents", 0), ev.get("currency"),
+                       ev.get("created_at"), ev.get("items") or []) + _status("CREATED")
+    if kind == "order.cancelled":
+        return _status("CANCELLED")
+    if kind == "order.rejected":
+        return _status("REJECTED")
+    if kind == "order.failed":
+        return _status("FAILED")
+    if kind == "payment.succeeded":
+        return _status("PAID")
+    if kind == "shipping.ready":
+        return _shipment("READY_TO_SHIP", ev.get("shipment_id"))
+    if kind == "shipping.dispatched":
+        return _shipment("DISPATCHED", ev.get("shipment_id"), carrier=ev.get("carrier"), tracking_number=ev.get("tracking_number"))
+    if kind == "shipping.delivered":
+        return _shipment("DELIVERED", ev.get("shipment_id"))
+    if kind == "shipping.cancelled":
+        return _shipment("CANCELLED", ev.get("shipment_id"))
+    return None
+
+def store_order(r: Redis, order: Order):
+    """Write the DB's version of an order (read-through fill and rebuild)."""
+    created = order.created_at.isoformat() if order.created_at else None
+    items = [{"product_id": it.product_id, "qty": it.qty, "unit_price_cents": it.unit_price_cents} for it in order.items]
+    project(r, order.id, _header(order.user_email, order.total_cents, order.currency, created, items) + _status(order.status))
+
+def get_view(r: Redis, order_id: int) -> Optional[Dict[str, Any]]:
+    """The order as GET /v1/orders/{id} returns it, or None until its header has been projected."""
+    h = r.hgetall(view_key(order_id))
+    if not h.get("user_email"):
+        return None
+    return {
+        "id": order_id,
+        "user_email": h["user_email"],
+        "status": h.get("status", "CREATED"),
+        "total_cents": int(h["total_cents"]),
+        "currency": h.get("currency") or "USD",
+        "created_at": h.get("created_at") or None,
+        "items": json.loads(h.get("items") or "[]"),
+        "shipment": {
+            "id": int(h["shipment_id"]) if h.get("shipment_id") else None,
+            "status": h["shipment_status"],
+            "carrier": h.get("carrier") or None,
+            "tracking_number": h.get("tracking_number") or None,
+        } if h.get("shipment_status") else None,
+    }
+
+def rebuild(db: Session, r: Redis, since: datetime, batch: int = 500) -> int:
+    """Re-project every order created since `since` from Postgres; keyset batches, one pipeline each."""
+    done, last = 0, None
+    while True:
+        stmt = (
+            select(Order)
+            .where(Order.created_at >= since)
+            .order_by(Order.created_at, Order.id)
+            .limit(batch)
+        )
+        if last:
+            stmt = stmt.where(tuple_(Order.created_at, Order.id) > last)
+        rows = db.scalars(stmt).all()
+        if not rows:
+            return done
+        load_items(db, rows)
+        pipe = r.pipeline(transaction=False)
+        for order in rows:
+            store_order(pipe, order)
+        pipe.execute()
+        done += len(rows)
+        last = (rows[-1].created_at, rows[-1].id)
+        db.expunge_all()
+
+def main():
+    ap = argparse.ArgumentParser(description="Rebuild the Redis order read-model from Postgres")
+    ap.add_argument("--days", type=int, default=settings.ORDER_VIEW_TTL_SECONDS // 86400,
+                    help="Only orders created in the last N days (older views would expire anyway)")
+    ap.add_argument("--batch", type=int, default=500)
+    args = ap.parse_args()
+
+    from app.db.session import SessionLocal
+    r = Redis.from_url(settings.REDIS_URL, decode_responses=True)
+    with SessionLocal() as db:
+        n = rebuild(db, r, datetime.utcnow() - timedelta(days=args.days), args.batch)
+    print(f"rebuilt {n} order views")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+import fakeredis, json, pytest
+from fastapi import HTTPException
+from app.store.cart_snapshot import checkout_cart, finish_cart, hold_cart, lock_cart
+
+def item(pid: int) -> str:
+    return json.dumps({"product_id": pid, "qty": 1, "unit_price_cents": 100, "title": f"p{pid}"})
+
+@pytest.fixture
+def r():
+    return fakeredis.FakeRedis(decode_responses=True)
+
+def test_lock_blocks_double_submit_and_restore_keeps_new_edits(r):
+    r.hset("cart:a@x.com", "1", item(1))
+    version, items = lock_cart(r, "a@x.com")
+    assert [it["product_id"] for it in items] == [1]
+    assert not r.exists("cart:a@x.com")
+
+    with pytest.raises(HTTPException) as exc:
+        lock_cart(r, "a@x.com")
+    assert exc.value.status_code == 409
+
+    r.hset("cart:a@x.com", "2", item(2))
+    finish_cart(r, "a@x.com", version, success=False)
+    assert sorted(r.hkeys("cart:a@x.com")) == ["1", "2"]
+    assert not r.exists("cart:a@x.com:lock")
+
+def test_success_clears_cart(r):
+    r.hset("cart:a@x.com", "1", item(1))
+    with checkout_cart(r, "a@x.com") as cart:
+        assert len(cart.items) == 1
+        cart.hold()
+    assert r.keys("cart:a@x.com*") == ["cart:a@x.com:version"]
+    with pytest.raises(HTTPException) as exc:
+        lock_cart(r, "a@x.com")
+    assert exc.value.status_code == 400
+
+def test_failure_restores_cart(r):
+    r.hset("cart:a@x.com", "1", item(1))
+    with pytest.raises(RuntimeError):
+        with checkout_cart(r, "a@x.com"):
+            raise RuntimeError("catalog down")
+    assert r.hkeys("cart:a@x.com") == ["1"]
+
+def test_lapsed_lock_fails_hold_so_the_cart_is_ordered_once(r):
+    r.hset("cart:a@x.com", "1", item(1))
+    first, _ = lock_cart(r, "a@x.com")
+    r.delete("cart:a@x.com:lock")  # checkout outlived CART_LOCK_SECONDS
+    second, items = lock_cart(r, "a@x.com")  # restores the stale snapshot and takes it over
+    assert [it["product_id"] for it in items] == [1]
+
+    with pytest.raises(HTTPException) as exc:
+        hold_cart(r, "a@x.com", first)
+    assert exc.value.status_code == 409
+    finish_cart(r, "a@x.com", first, success=False)  # no-op: the snapshot isn't its any more
+    hold_cart(r, "a@x.com", second)
+    finish_cart(r, "a@x.com", second, success=True)
+    assert r.keys("cart:a@x.com*") == ["cart:a@x.com:version"]
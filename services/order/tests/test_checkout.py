@@ -0,0 +1,37 @@
+import httpx, pytest
+from app.services import checkout
+
+class FakeCatalog:
+    def __init__(self, products):
+        self.products, self.calls = products, []
+    def post(self, url, json=None, headers=None):
+        self.calls.append(json["ids"])
+        return httpx.Response(200, json=[p for p in self.products if p["id"] in json["ids"]])
+
+@pytest.fixture
+def catalog(monkeypatch):
+    fake = FakeCatalog([
+        {"id": 1, "title": "Shoe", "price_cents": 1500, "currency": "USD", "active": True, "available": 10},
+        {"id": 2, "title": "Sock", "price_cents": 500, "currency": "USD", "active": False, "available": 10},
+        {"id": 3, "title": "Lace", "price_cents": 100, "currency": "USD", "active": True, "available": 10},
+    ])
+    monkeypatch.setattr(checkout, "get_client", lambda name, base: fake)
+    checkout._price_cache.clear()
+    return fake
+
+def line(pid, price, qty=1):
+    return {"product_id": pid, "qty": qty, "unit_price_cents": price, "title": "x"}
+
+def test_revalidate_reports_repriced_and_inactive(catalog):
+    with pytest.raises(checkout.CartChanged) as exc:
+        checkout.revalidate_cart([line(1, 1299), line(2, 500), line(3, 100)])
+    report = exc.value.report
+    assert report["repriced"] == [{"product_id": 1, "old_unit_price_cents": 1299, "new_unit_price_cents": 1500}]
+    assert report["unavailable"] == [{"product_id": 2, "reason": "inactive"}]
+    assert exc.value.updates[0]["unit_price_cents"] == 1500 and exc.value.removals == [2]
+    assert len(catalog.calls) == 1
+
+def test_revalidate_uses_cache_within_ttl(catalog):
+    checkout.revalidate_cart([line(1, 1500), line(3, 100)])
+    checkout.revalidate_cart([line(1, 1500), line(3, 100)])
+    assert len(catalog.calls) == 1
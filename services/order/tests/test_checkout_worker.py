@@ -0,0 +1,199 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+import fakeredis, pytest
+from fastapi import HTTPException
+from kafka.errors import KafkaTimeoutError
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.db.session import Base
+from app.db.models import Order, OrderSaga
+from app.kafka import checkout_worker as worker
+from app.services.orders import create_order
+
+ITEMS = [{"product_id": 1, "qty": 2, "unit_price_cents": 100}]
+ADDRESS = {"address_line1": "1 Main St", "city": "Dublin", "country": "IE", "postcode": "D01"}
+
+class Catalog:
+    """Stands in for reserve/release; per-order steps apply once, like catalog's ledger."""
+    def __init__(self):
+        self.reserved, self.released, self.fail = [], [], None
+    def reserve(self, items, order_id=None):
+        if self.fail:
+            raise self.fail
+        if order_id not in self.reserved:
+            self.reserved.append(order_id)
+    def release(self, items, order_id=None):
+        if order_id in self.reserved and order_id not in self.released:
+            self.released.append(order_id)
+
+@pytest.fixture
+def env(monkeypatch):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    catalog, events, dlq, aborted = Catalog(), [], [], []
+    monkeypatch.setattr(worker, "SessionLocal", Session)
+    monkeypatch.setattr(worker, "reserve_inventory", catalog.reserve)
+    monkeypatch.setattr(worker, "release_inventory", catalog.release)
+    monkeypatch.setattr(worker, "create_shipment", lambda order_id, email, address: 100 + order_id)
+    monkeypatch.setattr(worker, "emit_order_created", lambda order_id, *a: events.append(("created", order_id)))
+    monkeypatch.setattr(worker, "emit_order_rejected", lambda order_id, *a: events.append(("rejected", order_id)))
+    monkeypatch.setattr(worker, "emit_order_failed", lambda order_id, *a: events.append(("failed", order_id)))
+    monkeypatch.setattr(worker, "dead_letter", lambda topic, rec, exc: dlq.append((rec.offset, type(exc).__name__)))
+    monkeypatch.setattr(worker.saga, "abort", lambda db, order_id, reason: aborted.append(order_id))
+    monkeypatch.setattr(worker.settings, "CONSUMER_RETRY_BACKOFF_SECONDS", 0)
+    monkeypatch.setattr(worker.settings, "CHECKOUT_MAX_ATTEMPTS", 3)
+    return Session, catalog, events, dlq, aborted
+
+def pending(Session) -> int:
+    with Session() as db:
+        oid = create_order(db, "a@example.com", ITEMS, 200, status="PENDING").id
+        db.commit()
+    return oid
+
+def command(oid, **extra) -> dict:
+    return dict({"type": "order.checkout_requested", "order_id": oid, "user_email": "a@example.com",
+                 "amount_cents": 200, "items": ITEMS, "shipping_address": {}}, **extra)
+
+def status(Session, oid) -> str:
+    with Session() as db:
+        return db.get(Order, oid).status
+
+def test_command_creates_the_order_once(env):
+    Session, catalog, events, _, _ = env
+    oid = pending(Session)
+    assert worker.process_command(command(oid)) == "created"
+    assert status(Session, oid) == "CREATED"
+    with Session() as db:
+        assert db.get(OrderSaga, oid).shipment_id == 100 + oid
+    assert worker.process_command(command(oid)) == "duplicate"
+    assert worker.process_command({"type": "something.else"}) == "ignored"
+    assert events == [("created", oid)] and catalog.reserved == [oid]
+
+def test_replay_after_crash_does_not_reserve_twice(env, monkeypatch):
+    Session, catalog, events, _, _ = env
+    oid = pending(Session)
+    monkeypatch.setattr(worker, "create_shipment", lambda *a: (_ for _ in ()).throw(RuntimeError("crash")))
+    with pytest.raises(RuntimeError):
+        worker.process_command(command(oid))
+    monkeypatch.setattr(worker, "create_shipment", lambda order_id, email, address: 7)
+    # saga row and reservation already exist: both steps are no-ops on the replay
+    assert worker.process_command(command(oid)) == "created"
+    assert catalog.reserved == [oid] and events == [("created", oid)]
+
+def test_stock_refusal_rejects(env):
+    Session, catalog, events, _, _ = env
+    oid = pending(Session)
+    catalog.fail = HTTPException(status_code=409, detail="Insufficient stock")
+    assert worker.process_command(command(oid)) == "rejected"
+    assert status(Session, oid) == "REJECTED" and events == [("rejected", oid)]
+
+def test_catalog_down_raises_for_retry(env):
+    Session, catalog, _, _, _ = env
+    oid = pending(Session)
+    catalog.fail = HTTPException(status_code=503, detail="Catalog unavailable")
+    with pytest.raises(HTTPException):
+        worker.process_command(command(oid))
+    assert status(Session, oid) == "PENDING"
+
+def test_shipment_failure_aborts_the_saga(env, monkeypatch):
+    Session, _, _, _, aborted = env
+    oid = pending(Session)
+    monkeypatch.setattr(worker, "create_shipment",
+                        lambda *a: (_ for _ in ()).throw(HTTPException(status_code=502, detail="down")))
+    assert worker.process_command(command(oid)) == "failed"
+    assert aborted == [oid]
+
+class Record:
+    def __init__(self, offset, value):
+        self.topic, self.partition, self.offset, self.key, self.value = "order.commands", 0, offset, None, value
+
+class FakeConsumer:
+    def __init__(self, batches):
+        self.batches, self.commits, self.seeks = list(batches), 0, []
+    def poll(self, timeout_ms=None):
+        if not self.batches:
+            worker._stop.set()
+            return {}
+        return {"tp": self.batches.pop(0)}
+    def commit(self):
+        self.commits += 1
+    def seek(self, tp, offset):
+        self.seeks.append(offset)
+
+def run(batches):
+    consumer = FakeConsumer(batches)
+    worker._stop.clear()
+    try:
+        # One thread: the SQLite StaticPool connection can't take concurrent sessions
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            worker.consume(consumer, pool)
+    finally:
+        worker._stop.clear()
+    return consumer
+
+def test_batch_is_committed_after_success(env):
+    Session, _, events, dlq, _ = env
+    a, b = pending(Session), pending(Session)
+    consumer = run([[Record(0, command(a)), Record(1, command(b)), Record(2, command(a))]])
+    assert consumer.commits == 1 and consumer.seeks == []
+    assert sorted(events) == [("created", a), ("created", b)] and dlq == []
+
+def test_transient_failure_is_retried_then_given_up(env):
+    Session, catalog, events, dlq, _ = env
+    oid = pending(Session)
+    catalog.fail = HTTPException(status_code=503, detail="Catalog unavailable")
+    consumer = run([[Record(4, command(oid))]] * 3)
+    assert consumer.seeks == [4, 4]  # CHECKOUT_MAX_ATTEMPTS=3: two rewinds, then give up
+    assert consumer.commits == 1
+    assert dlq == [(4, "HTTPException")]
+    assert status(Session, oid) == "FAILED" and events == [("failed", oid)]
+
+def test_poison_command_is_dead_lettered_without_blocking(env):
+    Session, catalog, events, dlq, _ = env
+    good = pending(Session)
+    broken = pending(Session)
+    consumer = run([[Record(0, {"type": "order.checkout_requested", "order_id": broken}),
+                     Record(1, command(good)), Record(2, "not json object")]])
+    assert consumer.commits == 1 and consumer.seeks == []
+    assert sorted(dlq) == [(0, "KeyError"), (2, "AttributeError")]
+    assert status(Session, broken) == "FAILED"
+    assert sorted(events) == [("created", good), ("failed", broken)]
+
+def test_given_up_order_with_a_reservation_is_released(env, monkeypatch):
+    Session, catalog, _, dlq, _ = env
+    oid = pending(Session)
+    # reserved, then the saga insert keeps failing
+    monkeypatch.setattr(worker.saga, "begin", lambda db, order_id: (_ for _ in ()).throw(ValueError("bad row")))
+    consumer = run([[Record(0, command(oid))]])
+    assert catalog.reserved == [oid] and catalog.released == [oid]
+    assert dlq == [(0, "ValueError")] and status(Session, oid) == "FAILED"
+    assert consumer.commits == 1
+
+def test_failed_event_is_sent_again_if_it_was_lost(env, monkeypatch):
+    Session, _, events, _, _ = env
+    oid = pending(Session)
+    rec = Record(0, command(oid))
+    monkeypatch.setattr(worker, "emit_order_failed", lambda *a: (_ for _ in ()).throw(RuntimeError("kafka down")))
+    with pytest.raises(RuntimeError):
+        worker.give_up(rec, ValueError("bad"))
+    assert status(Session, oid) == "FAILED"
+    monkeypatch.setattr(worker, "emit_order_failed", lambda order_id, *a: events.append(("failed", order_id)))
+    worker.give_up(rec, ValueError("bad"))  # the replay
+    assert events == [("failed", oid)]
+
+def test_unpublished_command_fails_the_order_and_restores_the_cart(env, monkeypatch):
+    from app.api import routes
+    from app.api.routes import ShippingAddress
+    Session, _, _, _, _ = env
+    r = fakeredis.FakeRedis(decode_responses=True)
+    r.hset("cart:a@example.com", "1", json.dumps(dict(ITEMS[0], title="p1")))
+    monkeypatch.setattr(routes, "revalidate_cart", lambda items: None)
+    monkeypatch.setattr(routes, "request_checkout", lambda *a: (_ for _ in ()).throw(KafkaTimeoutError("no broker")))
+    address = ShippingAddress.model_validate(ADDRESS)
+    with Session() as db, pytest.raises(KafkaTimeoutError):
+        routes._accept_checkout(address, "a@example.com", r, db)
+    with Session() as db:
+        assert [o.status for o in db.query(Order)] == ["FAILED"]
+    assert r.hkeys("cart:a@example.com") == ["1"] and not r.exists("cart:a@example.com:lock")
@@ -0,0 +1,129 @@
+import httpx
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.db.session import Base
+from app.db.models import Order
+from app.kafka import consumer
+from app.kafka.consumer import process_batch
+from app.services.orders import create_order
+
+class FakeResponse:
+    def raise_for_status(self): pass
+
+class FakeClient:
+    def __init__(self):
+        self.calls = []
+    def post(self, url, json=None, headers=None):
+        self.calls.append(json)
+        return FakeResponse()
+
+def test_process_batch_groups_inventory_and_updates_once():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    a = create_order(db, "a@example.com", [{"product_id": 1, "qty": 2, "unit_price_cents": 100}], 200)
+    b = create_order(db, "b@example.com", [{"product_id": 1, "qty": 1, "unit_price_cents": 100},
+                                           {"product_id": 2, "qty": 3, "unit_price_cents": 50}], 250)
+    db.commit()
+    a_id, b_id = a.id, b.id
+
+    client = FakeClient()
+    events = [
+        {"type": "payment.succeeded", "order_id": a_id},
+        {"type": "payment.succeeded", "order_id": b_id},
+        {"type": "payment.succeeded", "order_id": a_id},  # duplicate delivery
+        {"type": "something.else", "order_id": 999},
+    ]
+    assert sorted(process_batch(events, db, client)) == [a_id, b_id]
+    assert len(client.calls) == 1
+    per_order = {o["order_id"]: sorted((i["product_id"], i["qty"]) for i in o["items"]) for o in client.calls[0]["orders"]}
+    assert per_order == {a_id: [(1, 2)], b_id: [(1, 1), (2, 3)]}
+    assert {o.status for o in db.query(Order)} == {"PAID"}
+
+    # Redelivery after commit is a no-op
+    assert process_batch(events, db, client) == []
+    assert len(client.calls) == 1
+
+class Record:
+    def __init__(self, offset, value):
+        self.topic, self.partition, self.offset, self.key, self.value = "payment.events", 0, offset, None, value
+
+class FakeConsumer:
+    def __init__(self, batches):
+        self.batches, self.commits, self.seeks = list(batches), 0, []
+    def poll(self, timeout_ms=None):
+        if not self.batches:
+            consumer._stop_event.set()
+            return {}
+        return {"tp": self.batches.pop(0)}
+    def commit(self):
+        self.commits += 1
+    def seek(self, tp, offset):
+        self.seeks.append(offset)
+    def assignment(self):
+        return []
+
+def _consume(monkeypatch, batches, client):
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    with Session() as db:
+        ids = [create_order(db, f"{n}@example.com", [{"product_id": 1, "qty": 1, "unit_price_cents": 100}], 100).id
+               for n in range(2)]
+        db.commit()
+    dlq = []
+    monkeypatch.setattr(consumer, "SessionLocal", Session)
+    monkeypatch.setattr(consumer, "dead_letter", lambda topic, rec, exc: dlq.append((rec.offset, type(exc).__name__)))
+    monkeypatch.setattr(consumer.settings, "CONSUMER_RETRY_BACKOFF_SECONDS", 0)
+    monkeypatch.setattr(consumer.settings, "CONSUMER_MAX_ATTEMPTS", 2)
+    kc = FakeConsumer(batches(ids))
+    consumer._stop_event.clear()
+    try:
+        consumer.consume(kc, client)
+    finally:
+        consumer._stop_event.clear()
+    with Session() as db:
+        return ids, kc, dlq, {o.id: o.status for o in db.query(Order)}
+
+def test_malformed_event_is_dead_lettered_and_the_rest_applied(monkeypatch):
+    client = FakeClient()
+    ids, kc, dlq, status = _consume(monkeypatch, lambda ids: [[
+        Record(0, {"type": "payment.succeeded", "order_id": ids[0]}),
+        Record(1, {"type": "payment.succeeded", "order_id": "abc"}),
+        Record(2, {"type": "payment.succeeded"}),
+    ]], client)
+    assert dlq == [(1, "ValueError"), (2, "KeyError")]
+    assert status == {ids[0]: "PAID", ids[1]: "CREATED"}
+    assert kc.commits == 1 and kc.seeks == []
+
+class Rejecting(FakeClient):
+    """Catalog answers 409 for the order in `bad`."""
+    def __init__(self, bad=None, status=409):
+        super().__init__()
+        self.bad, self.status = bad, status
+    def post(self, url, json=None, headers=None):
+        self.calls.append(json)
+        if self.bad is None or any(o["order_id"] == self.bad for o in json["orders"]):
+            request = httpx.Request("POST", url)
+            raise httpx.HTTPStatusError("refused", request=request, response=httpx.Response(self.status, request=request))
+        return FakeResponse()
+
+def test_poison_event_is_isolated_without_blocking_the_partition(monkeypatch):
+    holder = {}
+    def batches(ids):
+        holder["client"].bad = ids[1]
+        return [[Record(0, {"type": "payment.succeeded", "order_id": ids[0]}),
+                 Record(1, {"type": "payment.succeeded", "order_id": ids[1]})]]
+    client = holder["client"] = Rejecting()
+    ids, kc, dlq, status = _consume(monkeypatch, batches, client)
+    assert dlq == [(1, "HTTPStatusError")]
+    assert status == {ids[0]: "PAID", ids[1]: "CREATED"}
+    assert kc.commits == 1 and kc.seeks == []
+
+def test_transient_failure_is_retried_then_dead_lettered(monkeypatch):
+    client = Rejecting(status=503)
+    ids, kc, dlq, status = _consume(monkeypatch, lambda ids: [[Record(5, {"type": "payment.succeeded", "order_id": ids[0]})]] * 2,
+                                    client)
+    assert kc.seeks == [5]  # first attempt rewound, the second (= CONSUMER_MAX_ATTEMPTS) gave up
+    assert dlq == [(5, "HTTPStatusError")]
+    assert kc.commits == 1
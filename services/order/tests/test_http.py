@@ -0,0 +1,72 @@
+import httpx, pytest
+from app.core.config import settings
+from app.core.http import CircuitOpenError, ServiceClient
+
+def make_client(handler) -> ServiceClient:
+    c = ServiceClient("test-target", "http://upstream")
+    c._client = httpx.Client(base_url="http://upstream", transport=httpx.MockTransport(handler))
+    return c
+
+def test_idempotent_get_retries_then_succeeds(monkeypatch):
+    monkeypatch.setattr(settings, "HTTP_BACKOFF_SECONDS", 0.0)
+    calls = []
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(503 if len(calls) < 2 else 200)
+    assert make_client(handler).get("/x").status_code == 200
+    assert len(calls) == 2
+
+def test_post_is_not_retried_on_5xx(monkeypatch):
+    monkeypatch.setattr(settings, "HTTP_BACKOFF_SECONDS", 0.0)
+    calls = []
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(503)
+    assert make_client(handler).post("/x").status_code == 503
+    assert len(calls) == 1
+
+def test_breaker_counts_one_failure_per_call(monkeypatch):
+    monkeypatch.setattr(settings, "HTTP_BACKOFF_SECONDS", 0.0)
+    monkeypatch.setattr(settings, "HTTP_RETRIES", 2)
+    calls = []
+    def handler(request):
+        calls.append(request)
+        raise httpx.ConnectError("refused", request=request)
+    client = make_client(handler)
+    client.breaker.failure_threshold = 2
+    # three attempts, one failure: still closed
+    with pytest.raises(httpx.ConnectError):
+        client.get("/x")
+    assert len(calls) == 3 and client.breaker.state == client.breaker.CLOSED
+    with pytest.raises(httpx.ConnectError):
+        client.get("/x")
+    assert client.breaker.state == client.breaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        client.get("/x")
+    assert len(calls) == 6
+
+def test_only_the_trial_call_clears_the_trial(monkeypatch):
+    breaker = make_client(lambda request: httpx.Response(200)).breaker
+    assert breaker.admit() is False  # closed: an ordinary call
+    breaker._set(breaker.HALF_OPEN)
+    assert breaker.admit() is True
+    breaker.release(False)  # the ordinary call finishes while the trial is still out
+    assert breaker.admit() is None
+    breaker.release(True)
+    assert breaker.admit() is True
+
+def test_unexpected_error_during_trial_does_not_wedge_the_breaker(monkeypatch):
+    monkeypatch.setattr(settings, "HTTP_BACKOFF_SECONDS", 0.0)
+    calls = []
+    def handler(request):
+        calls.append(request)
+        if len(calls) == 1:
+            raise RuntimeError("bug in a transport hook")
+        return httpx.Response(200)
+    client = make_client(handler)
+    client.breaker._set(client.breaker.HALF_OPEN)
+    with pytest.raises(RuntimeError):
+        client.get("/x")
+    # the trial ended without an outcome; the next call is let through as a new trial
+    assert client.get("/x").status_code == 200
+    assert client.breaker.state == client.breaker.CLOSED
@@ -0,0 +1,111 @@
+import threading, time
+import pytest
+from fastapi import HTTPException
+from app.core.config import settings
+from app.core.idempotency import run_idempotent
+
+class FakeRedis:
+    """Just enough of redis-py for the idempotency helper, with PX expiry."""
+    def __init__(self):
+        self.data, self.expires = {}, {}
+        self.lock = threading.Lock()
+
+    def _live(self, k):
+        if k in self.expires and self.expires[k] <= time.monotonic():
+            self.data.pop(k, None)
+            self.expires.pop(k, None)
+        return self.data.get(k)
+
+    def get(self, k):
+        with self.lock:
+            return self._live(k)
+
+    def set(self, k, v, nx=False, px=None, ex=None):
+        with self.lock:
+            if nx and self._live(k) is not None:
+                return None
+            self.data[k] = v
+            if px:
+                self.expires[k] = time.monotonic() + px / 1000
+            return True
+
+    def eval(self, script, numkeys, key, token, *args):
+        with self.lock:
+            if self._live(key) != token:
+                return 0
+            if "PEXPIRE" in script:
+                self.expires[key] = time.monotonic() + args[0] / 1000
+            else:
+                del self.data[key]
+            return 1
+
+def test_concurrent_duplicate_waits_and_replays():
+    r = FakeRedis()
+    calls = []
+
+    def work():
+        calls.append(1)
+        time.sleep(0.2)
+        return {"order_id": 1}
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(run_idempotent(r, "checkout:a", "k1", {"x": 1}, work)))
+        for _ in range(3)
+    ]
+    for t in threads: t.start()
+    for t in threads: t.join()
+
+    assert len(calls) == 1
+    assert sorted(replayed for _, replayed in results) == [False, True, True]
+    assert all(body == {"order_id": 1} for body, _ in results)
+
+def test_failure_is_not_stored():
+    r = FakeRedis()
+
+    def boom():
+        raise RuntimeError("catalog down")
+
+    try:
+        run_idempotent(r, "checkout:a", "k2", {}, boom)
+    except RuntimeError:
+        pass
+    body, replayed = run_idempotent(r, "checkout:a", "k2", {}, lambda: {"ok": True})
+    assert body == {"ok": True} and not replayed
+
+def test_slow_call_keeps_its_lock_and_duplicates_never_rerun(monkeypatch):
+    monkeypatch.setattr(settings, "IDEMPOTENCY_LOCK_SECONDS", 0.15)
+    monkeypatch.setattr(settings, "IDEMPOTENCY_POLL_SECONDS", 0.01)
+    r, calls = FakeRedis(), []
+
+    def work():
+        calls.append(1)
+        time.sleep(0.5)  # several lock TTLs
+        return {"order_id": 2}
+
+    first = threading.Thread(target=lambda: calls.append(run_idempotent(r, "checkout:a", "k3", {}, work)))
+    first.start()
+    time.sleep(0.05)
+    with pytest.raises(HTTPException) as exc:
+        run_idempotent(r, "checkout:a", "k3", {}, work)
+    assert exc.value.status_code == 409
+    first.join()
+    assert calls == [1, ({"order_id": 2}, False)]
+    assert run_idempotent(r, "checkout:a", "k3", {}, work) == ({"order_id": 2}, True)
+
+def test_waiter_gets_409_when_the_first_call_fails(monkeypatch):
+    monkeypatch.setattr(settings, "IDEMPOTENCY_POLL_SECONDS", 0.01)
+    r, calls = FakeRedis(), []
+
+    def boom():
+        calls.append(1)
+        time.sleep(0.1)
+        raise RuntimeError("catalog down")
+
+    first = threading.Thread(target=lambda: pytest.raises(RuntimeError, run_idempotent, r, "checkout:a", "k4", {}, boom))
+    first.start()
+    time.sleep(0.03)
+    with pytest.raises(HTTPException) as exc:
+        run_idempotent(r, "checkout:a", "k4", {}, boom)
+    assert exc.value.status_code == 409 and calls == [1]
+    first.join()
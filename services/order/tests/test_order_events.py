@@ -0,0 +1,84 @@
+import asyncio, json, tracemalloc
+import fakeredis, pytest
+from redis.asyncio import BlockingConnectionPool
+from app.store.order_events import Hub, stream_order_events
+from app.store.order_view import project
+
+def frames(chunks):
+    return [json.loads(c.split("data: ", 1)[1]) for c in chunks if c.startswith("id: ")]
+
+def test_resume_after_last_event_id_then_live_until_terminal():
+    async def main():
+        server = fakeredis.FakeServer()
+        sync = fakeredis.FakeRedis(server=server, decode_responses=True)
+        hub = Hub(fakeredis.aioredis.FakeRedis(server=server, decode_responses=True))
+        project(sync, 7, [("status", "CREATED", 1)])
+        first = sync.xrevrange("order:stream:7", count=1)[0][0]
+        project(sync, 7, [("status", "PAID", 2)])
+        project(sync, 7, [("status", "PAID", 2)])  # duplicate event: no transition
+
+        out = []
+        async def consume():
+            async for chunk in stream_order_events(hub, 7, last_event_id=first):
+                out.append(chunk)
+        task = asyncio.create_task(consume())
+        while len(frames(out)) < 1:
+            await asyncio.sleep(0.01)
+        project(sync, 7, [("shipment_status", "READY_TO_SHIP", 1)])
+        project(sync, 7, [("shipment_status", "CANCELLED", 3)])
+        await asyncio.wait_for(task, 5)
+        await hub.close()
+        return out
+
+    out = asyncio.run(main())
+    assert out[0].startswith("retry: ")
+    assert [(f["status"], f["shipment_status"]) for f in frames(out)] == [
+        ("PAID", ""), ("PAID", "READY_TO_SHIP"), ("PAID", "CANCELLED"),
+    ]
+
+def test_thousands_of_idle_subscribers_stay_small():
+    orders, per_order = 200, 25  # 5,000 open streams
+
+    async def main():
+        server = fakeredis.FakeServer()
+        sync = fakeredis.FakeRedis(server=server, decode_responses=True)
+        # Same bounded pool as get_hub()
+        hub = Hub(fakeredis.aioredis.FakeRedis(
+            server=server, decode_responses=True, max_connections=20,
+            connection_pool_class=BlockingConnectionPool,
+        ))
+        received = {}
+
+        async def consume(order_id, n):
+            got = received.setdefault((order_id, n), [])
+            async for chunk in stream_order_events(hub, order_id):
+                got.append(chunk)
+
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        tasks = [asyncio.create_task(consume(o, n)) for o in range(orders) for n in range(per_order)]
+        while sum(len(s) for s in hub._subs.values()) < orders * per_order:
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.1)
+        used = sum(s.size_diff for s in tracemalloc.take_snapshot().compare_to(before, "filename"))
+        tracemalloc.stop()
+
+        project(sync, 3, [("status", "CANCELLED", 2)])
+        for _ in range(200):
+            if all(frames(received[(3, n)]) for n in range(per_order)):
+                break
+            await asyncio.sleep(0.01)
+        others = sum(len(frames(v)) for (o, _), v in received.items() if o != 3)
+
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        remaining = len(hub._subs)
+        await hub.close()
+        return used, received, others, remaining
+
+    used, received, others, remaining = asyncio.run(main())
+    per_stream = used / (orders * per_order)
+    assert per_stream < 8 * 1024
+    assert all(frames(received[(3, n)])[0]["status"] == "CANCELLED" for n in range(per_order))
+    assert others == 0 and remaining == 0
@@ -0,0 +1,100 @@
+from datetime import datetime, timedelta
+import fakeredis, pytest
+from kafka.structs import TopicPartition
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.db.session import Base
+from app.kafka import projector
+from app.kafka.projector import apply_batch
+from app.services.orders import create_order
+from app.store.order_events import _terminal
+from app.store.order_view import get_view, rebuild
+
+@pytest.fixture
+def r():
+    return fakeredis.FakeRedis(decode_responses=True)
+
+CREATED = {"type": "order.created", "order_id": 7, "user_email": "a@x.com", "amount_cents": 300,
+           "currency": "EUR", "created_at": "2026-10-19T09:00:00",
+           "items": [{"product_id": 1, "qty": 3, "unit_price_cents": 100}]}
+
+def test_events_in_any_order_converge(r):
+    # Payment and shipping land before order.created; nothing regresses once it arrives
+    apply_batch(r, [
+        {"type": "payment.succeeded", "order_id": 7},
+        {"type": "shipping.dispatched", "order_id": 7, "shipment_id": 3, "carrier": "DemoCarrier", "tracking_number": "TRK1"},
+    ])
+    assert get_view(r, 7) is None  # header not projected yet -> caller falls back to DB
+    apply_batch(r, [CREATED, {"type": "shipping.ready", "order_id": 7, "shipment_id": 3}, {"type": "unrelated"}])
+
+    view = get_view(r, 7)
+    assert view["status"] == "PAID" and view["currency"] == "EUR" and view["total_cents"] == 300
+    assert view["shipment"] == {"id": 3, "status": "DISPATCHED", "carrier": "DemoCarrier", "tracking_number": "TRK1"}
+    assert view["items"] == [{"product_id": 1, "qty": 3, "unit_price_cents": 100}]
+    assert r.ttl("order:view:7") > 0
+
+def test_rebuild_from_db_does_not_regress_projected_status(r):
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    ids = [create_order(db, f"u{n}@x.com", [{"product_id": 1, "qty": 1, "unit_price_cents": 100}], 100).id
+           for n in range(5)]
+    db.commit()
+    apply_batch(r, [{"type": "payment.succeeded", "order_id": ids[0]}])
+
+    assert rebuild(db, r, datetime.utcnow() - timedelta(days=1), batch=2) == 5
+    assert [get_view(r, i)["status"] for i in ids] == ["PAID"] + ["CREATED"] * 4
+    assert get_view(r, ids[1])["user_email"] == "u1@x.com"
+
+def test_terminal_status_is_not_overwritten_by_another(r):
+    apply_batch(r, [CREATED, {"type": "payment.succeeded", "order_id": 7}])
+    # A stray cancellation for the same order (e.g. a redelivered compensation) must not flip PAID
+    apply_batch(r, [{"type": "order.cancelled", "order_id": 7, "reason": "payment_timeout"}])
+    assert get_view(r, 7)["status"] == "PAID"
+    assert len(r.xrange("order:stream:7")) == 2  # CREATED, PAID
+
+def test_failed_checkout_settles_the_view_and_ends_sse(r):
+    apply_batch(r, [{"type": "order.failed", "order_id": 9, "reason": "KeyError('items')"}])
+    (_, fields), = r.xrange("order:stream:9")
+    assert r.hget("order:view:9", "status") == "FAILED" and _terminal(fields["data"])
+    apply_batch(r, [{"type": "order.created", "order_id": 9, "user_email": "a@x.com", "amount_cents": 1}])
+    assert r.hget("order:view:9", "status") == "FAILED"
+
+class Record:
+    def __init__(self, offset, value):
+        self.topic, self.partition, self.offset, self.value, self.key = "order.events", 0, offset, value, None
+        self.timestamp = 0
+
+class FakeConsumer:
+    def __init__(self, batches):
+        self.batches, self.commits, self.seeks = list(batches), 0, []
+    def poll(self, timeout_ms=None):
+        if not self.batches:
+            projector._stop.set()
+            return {}
+        return {TopicPartition("order.events", 0): self.batches.pop(0)}
+    def commit(self):
+        self.commits += 1
+    def seek(self, tp, offset):
+        self.seeks.append(offset)
+    def assignment(self):
+        return []
+
+def test_bad_records_are_dead_lettered_and_the_rest_projected(r, monkeypatch):
+    dlq = []
+    monkeypatch.setattr(projector, "dead_letter", lambda topic, rec, exc: dlq.append((rec.offset, type(exc).__name__)))
+    kc = FakeConsumer([[
+        Record(0, CREATED),
+        Record(1, "not an object"),
+        Record(2, {"type": "payment.succeeded", "order_id": "abc"}),
+        Record(3, {"type": "shipping.dispatched", "order_id": 7, "carrier": {"nested": True}}),  # Redis can't store it
+        Record(4, {"type": "payment.succeeded", "order_id": 7}),
+    ]])
+    projector._stop.clear()
+    try:
+        projector.consume(kc, r)
+    finally:
+        projector._stop.clear()
+    assert sorted(dlq) == [(1, "ValueError"), (2, "ValueError"), (3, "DataError")]
+    assert kc.commits == 1 and kc.seeks == []
+    assert get_view(r, 7)["status"] == "PAID"
@@ -0,0 +1,89 @@
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from app.db.session import Base
+from app.services.orders import create_order, list_orders
+
+def test_create_order_statement_count():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda conn, cur, stmt, *a: statements.append(stmt))
+
+    db = sessionmaker(bind=engine)()
+    items = [
+        {"product_id": 1, "qty": 2, "unit_price_cents": 1299, "title": "Shoe"},
+        {"product_id": 2, "qty": 1, "unit_price_cents": 499, "title": "Sock"},
+        {"product_id": 3, "qty": 4, "unit_price_cents": 199, "title": "Lace"},
+    ]
+    order = create_order(db, "cust@example.com", items, 4593)
+    assert [it.product_id for it in order.items] == [1, 2, 3]
+    db.commit()
+
+    # one INSERT for the order, one bulk INSERT for all items; no refresh/lazy SELECT
+    assert len(statements) == 2
+    assert all(s.lstrip().upper().startswith("INSERT") for s in statements)
+
+def test_list_orders_keyset_pages():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    for n in range(5):
+        create_order(db, "cust@example.com", [{"product_id": n, "qty": 1, "unit_price_cents": 100, "title": "x"}], 100)
+    create_order(db, "other@example.com", [], 0)
+    db.commit()
+
+    seen, cursor = [], None
+    while True:
+        rows, cursor = list_orders(db, "cust@example.com", limit=2, cursor=cursor)
+        seen += [(o.id, [it.product_id for it in o.items]) for o in rows]
+        if not cursor:
+            break
+    assert [oid for oid, _ in seen] == [5, 4, 3, 2, 1]
+    assert seen[0][1] == [4]
+
+def test_list_orders_loads_items_by_partition_key():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    for n in range(3):
+        create_order(db, "cust@example.com", [{"product_id": n, "qty": 1, "unit_price_cents": 100, "title": "x"}], 100)
+    db.commit()
+    db.expunge_all()
+
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda conn, cur, stmt, *a: statements.append(stmt))
+    rows, _ = list_orders(db, "cust@example.com", limit=10)
+    assert [[it.product_id for it in o.items] for o in rows] == [[2], [1], [0]]
+    # page query + one item query that carries order_created_at (partition pruning); no lazy loads
+    assert len(statements) == 2
+    assert "order_created_at IN" in statements[1]
+
+def test_partition_month_helpers():
+    from datetime import date
+    from app.db.partitions import add_months, partition_name
+    assert add_months(date(2026, 11, 1), 2) == date(2027, 1, 1)
+    assert add_months(date(2026, 1, 1), -1) == date(2025, 12, 1)
+    assert partition_name("order_items", date(2026, 3, 1)) == "order_items_2026_03"
+
+def test_email_lookup_is_internal_and_bulk():
+    from fastapi.testclient import TestClient
+    from sqlalchemy.pool import StaticPool
+    from app.api import routes
+    from app.core.config import settings
+    from app.main import app
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    db = Session()
+    ids = [create_order(db, f"u{n}@example.com", [], 100).id for n in range(3)]
+    db.commit()
+    app.dependency_overrides[routes.get_db] = lambda: Session()
+    try:
+        client = TestClient(app)
+        body = {"order_ids": [ids[0], ids[2], 999]}
+        assert client.post("/order/v1/orders/emails", json=body).status_code == 403
+        r = client.post("/order/v1/orders/emails", json=body, headers={"X-Internal-Key": settings.SVC_INTERNAL_KEY})
+        assert r.json() == {"emails": {str(ids[0]): "u0@example.com", str(ids[2]): "u2@example.com"}}
+    finally:
+        app.dependency_overrides.clear()
@@ -0,0 +1,111 @@
+import gzip, json
+from contextlib import contextmanager
+from datetime import date, datetime
+from types import SimpleNamespace
+import pytest
+from app.db import partitions
+
+class Result:
+    def __init__(self, rows=(), scalar=None):
+        self.rows, self._scalar = list(rows), scalar
+    def scalars(self):
+        return iter(self.rows)
+    def scalar(self):
+        return self._scalar
+    def __iter__(self):
+        return iter(self.rows)
+
+class FakeConn:
+    """Just enough of a Postgres connection: a partition catalog, min ids and one month of orders."""
+    def __init__(self, tables, min_ids=None, orders=()):
+        self.tables, self.min_ids, self.orders = tables, min_ids or {}, list(orders)
+        self.dialect = SimpleNamespace(name="postgresql")
+        self.ddl = []
+    def execution_options(self, **kw):
+        return self
+    def execute(self, stmt, params=None):
+        sql = str(stmt)
+        if "pg_inherits" in sql:
+            return Result(self.tables.get(params["parent"], []))
+        if sql.startswith("SELECT min(id)"):
+            return Result(scalar=self.min_ids.get(sql.split()[-1]))
+        if sql.startswith("SELECT conname"):
+            return Result(["order_items_fk"])
+        if sql.startswith("SELECT o.id"):
+            return Result(SimpleNamespace(_mapping=o) for o in self.orders
+                          if params["lo"] <= o["created_at"].date() < params["hi"])
+        self.ddl.append(sql)
+        if sql.startswith("CREATE TABLE"):
+            name = sql.split()[5]
+            self.tables.setdefault(name.rsplit("_", 2)[0], []).append(name)
+        return Result()
+
+class FakeEngine:
+    def __init__(self, conn):
+        self.conn = conn
+    @contextmanager
+    def connect(self):
+        yield self.conn
+    begin = connect
+
+def test_ensure_partitions_creates_missing_months_once():
+    conn = FakeConn({"orders": ["orders_2026_10", "orders_default"], "order_items": ["order_items_2026_10"]})
+    created = partitions.ensure_partitions(conn, 2, today=date(2026, 10, 19))
+    assert created == ["orders_2026_11", "orders_2026_12"]
+    assert "CREATE TABLE IF NOT EXISTS order_items_2026_12 PARTITION OF order_items " \
+           "FOR VALUES FROM ('2026-12-01') TO ('2027-01-01')" in conn.ddl
+    assert len(conn.ddl) == 4  # both parents, two months
+    assert partitions.ensure_partitions(conn, 2, today=date(2026, 10, 19)) == []
+
+def order(oid, created):
+    return {"id": oid, "user_email": "a@x.com", "status": "PAID", "total_cents": 100, "currency": "USD",
+            "created_at": created, "updated_at": created, "items": [{"id": 1, "product_id": 1, "qty": 1}]}
+
+def test_archive_exports_then_drops_only_months_before_the_cutoff(tmp_path):
+    conn = FakeConn(
+        {"orders": ["orders_2024_01", "orders_2024_02", "orders_2026_10"]},
+        orders=[order(1, datetime(2024, 1, 5)), order(2, datetime(2024, 1, 9)), order(3, datetime(2026, 10, 1))],
+    )
+    done = partitions.archive(FakeEngine(conn), date(2024, 3, 1), str(tmp_path))
+    assert [(p.rsplit("/", 1)[-1], n) for p, n in done] == [("orders_2024_01.ndjson.gz", 2), ("orders_2024_02.ndjson.gz", 0)]
+    with gzip.open(done[0][0]) as f:
+        docs = [json.loads(line) for line in f]
+    assert [d["id"] for d in docs] == [1, 2] and docs[0]["created_at"] == "2024-01-05T00:00:00"
+    assert "DROP TABLE orders_2024_01" in conn.ddl and "DROP TABLE order_items_2024_02" in conn.ddl
+    assert not any("2026_10" in sql for sql in conn.ddl)
+    assert not list(tmp_path.glob("*.part"))
+
+def test_archive_keep_tables_detaches_instead_of_dropping(tmp_path):
+    conn = FakeConn({"orders": ["orders_2024_01"]})
+    partitions.archive(FakeEngine(conn), date(2024, 2, 1), str(tmp_path), keep_tables=True)
+    assert conn.ddl[1:] == [
+        "ALTER TABLE order_items DETACH PARTITION order_items_2024_01",
+        'ALTER TABLE order_items_2024_01 DROP CONSTRAINT "order_items_fk"',
+        "ALTER TABLE orders DETACH PARTITION orders_2024_01",
+    ]
+    assert not any(sql.startswith("DROP TABLE") for sql in conn.ddl)
+
+@pytest.fixture
+def id_months(monkeypatch):
+    monkeypatch.setattr(partitions, "_id_months", (0.0, []))
+    return FakeConn({"orders": ["orders_2026_08", "orders_2026_09", "orders_2026_10", "orders_2026_11"]},
+                    min_ids={"orders_2026_08": 1, "orders_2026_09": 500, "orders_2026_10": 900})
+
+def test_created_window_maps_ids_to_their_months(id_months):
+    skew = partitions.ID_SKEW
+    assert partitions.created_window(id_months, [600]) == (datetime(2026, 9, 1) - skew, datetime(2026, 10, 1) + skew)
+    assert partitions.created_window(id_months, [2, 600]) == (datetime(2026, 8, 1) - skew, datetime(2026, 10, 1) + skew)
+    # newest month (and the empty one after it): no upper bound
+    assert partitions.created_window(id_months, [950]) == (datetime(2026, 10, 1) - skew, None)
+
+def test_created_window_gives_up_when_it_cannot_bound(id_months):
+    assert partitions.created_window(id_months, []) is None
+    assert partitions.created_window(id_months, [0]) is None  # older than every partition
+    id_months.dialect.name = "sqlite"
+    assert partitions.created_window(id_months, [600]) is None
+
+def test_created_window_caches_the_month_map(id_months):
+    partitions.created_window(id_months, [600])
+    id_months.min_ids["orders_2026_11"] = 1200
+    # map not reloaded within the TTL: still bounded by October, which stays correct (open-ended)
+    assert partitions.created_window(id_months, [1300]) == (datetime(2026, 10, 1) - partitions.ID_SKEW, None)
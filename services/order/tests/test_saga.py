@@ -0,0 +1,120 @@
+from datetime import datetime, timedelta
+import httpx, pytest
+from sqlalchemy import create_engine, update
+from sqlalchemy.orm import sessionmaker
+from app.db.session import Base
+from app.db.models import Order, OrderSaga
+from app.kafka.consumer import process_batch
+from app.services import saga
+from app.services.orders import create_order
+
+class FakeClient:
+    def __init__(self):
+        self.calls, self.found = [], {}
+    def post(self, url, json=None, headers=None, idempotent=None):
+        self.calls.append((url, json))
+        return httpx.Response(200, request=httpx.Request("POST", url))
+    def get(self, url):
+        if url not in self.found:
+            return httpx.Response(404, request=httpx.Request("GET", url))
+        if isinstance(self.found[url], Exception):
+            raise self.found[url]
+        return httpx.Response(200, json=self.found[url], request=httpx.Request("GET", url))
+
+@pytest.fixture
+def env(monkeypatch):
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    released, sent, shipping = [], [], FakeClient()
+    monkeypatch.setattr(saga, "release_inventory", lambda items, order_id=None: released.append((order_id, items)))
+    monkeypatch.setattr(saga, "send", lambda topic, key, value: sent.append(value))
+    monkeypatch.setattr(saga, "get_client", lambda name, base: shipping)
+    return sessionmaker(bind=engine)(), released, sent, shipping
+
+def place(db, email, items, shipment_id=None):
+    order = create_order(db, email, items, sum(it["qty"] * it["unit_price_cents"] for it in items))
+    saga.begin(db, order.id)
+    db.commit()
+    if shipment_id:
+        saga.shipment_drafted(db, order.id, shipment_id)
+        db.commit()
+    return order.id
+
+def test_expired_orders_are_compensated_in_one_batch(env):
+    db, released, sent, shipping = env
+    a = place(db, "a@example.com", [{"product_id": 1, "qty": 2, "unit_price_cents": 100}], shipment_id=11)
+    b = place(db, "b@example.com", [{"product_id": 1, "qty": 1, "unit_price_cents": 100}])
+    fresh = place(db, "c@example.com", [{"product_id": 2, "qty": 1, "unit_price_cents": 100}])
+    db.execute(update(OrderSaga).where(OrderSaga.order_id.in_([a, b]))
+               .values(expires_at=datetime.utcnow() - timedelta(seconds=1)))
+    db.commit()
+
+    assert sorted(saga.expire_due(db, 100)) == [a, b]
+    assert sorted(released) == [(a, [{"product_id": 1, "qty": 2}]), (b, [{"product_id": 1, "qty": 1}])]
+    assert shipping.calls == [("/shipping/v1/shipments/11/cancel", None)]
+    assert {e["order_id"] for e in sent} == {a, b} and sent[0]["type"] == "order.cancelled"
+    assert db.get(Order, a).status == "CANCELLED" and db.get(OrderSaga, a).state == saga.COMPENSATED
+    assert db.get(Order, fresh).status == "CREATED" and db.get(OrderSaga, fresh).state == saga.RESERVED
+
+    # Nothing left to do on the next sweep
+    assert saga.expire_due(db, 100) == []
+    assert len(released) == 2
+
+def test_paid_order_is_not_compensated(env):
+    db, released, sent, _ = env
+    oid = place(db, "a@example.com", [{"product_id": 1, "qty": 1, "unit_price_cents": 100}], shipment_id=5)
+    assert process_batch([{"type": "payment.succeeded", "order_id": oid}], db, FakeClient()) == [oid]
+    row = db.get(OrderSaga, oid)
+    assert row.state == saga.COMMITTED and row.paid_at and row.committed_at
+
+    assert saga.compensate(db, [oid], "payment_timeout") == []
+    assert db.get(Order, oid).status == "PAID"
+    assert released == [] and sent == []
+
+def test_expiry_is_deferred_for_paid_or_shipped_orders(env):
+    db, released, sent, client = env
+    paid = place(db, "a@example.com", [{"product_id": 1, "qty": 1, "unit_price_cents": 100}])
+    shipped = place(db, "b@example.com", [{"product_id": 1, "qty": 1, "unit_price_cents": 100}], shipment_id=8)
+    unknown = place(db, "c@example.com", [{"product_id": 1, "qty": 1, "unit_price_cents": 100}])
+    unpaid = place(db, "d@example.com", [{"product_id": 2, "qty": 1, "unit_price_cents": 100}], shipment_id=9)
+    db.execute(update(OrderSaga).values(expires_at=datetime.utcnow() - timedelta(seconds=1)))
+    db.commit()
+    client.found = {
+        f"/payment/v1/payments/pay_{paid}": {"status": "succeeded"},  # payment.succeeded not consumed yet
+        "/shipping/v1/shipments/8": {"status": "READY_TO_SHIP"},
+        f"/payment/v1/payments/pay_{unknown}": httpx.ConnectError("payment down"),
+        "/shipping/v1/shipments/9": {"status": "PENDING_PAYMENT"},
+    }
+
+    assert saga.expire_due(db, 100) == [unpaid]
+    assert released == [(unpaid, [{"product_id": 2, "qty": 1}])]
+    for oid in (paid, shipped, unknown):
+        row = db.get(OrderSaga, oid)
+        assert db.get(Order, oid).status == "CREATED" and row.state in saga.OPEN_STATES
+        assert row.expires_at > datetime.utcnow() and row.last_error.startswith("expiry deferred")
+    assert saga.expire_due(db, 100) == []
+
+def test_retried_compensation_releases_each_order_once(env, monkeypatch):
+    db, _, sent, _ = env
+    a = place(db, "a@example.com", [{"product_id": 1, "qty": 2, "unit_price_cents": 100}])
+    b = place(db, "b@example.com", [{"product_id": 1, "qty": 1, "unit_price_cents": 100}])
+    ledger, stock, fail = set(), {1: 0}, [b]
+
+    def release(items, order_id=None):
+        # catalog's per-order ledger: a repeated release of the same order is a no-op
+        if order_id in fail:
+            fail.remove(order_id)
+            raise httpx.ConnectError("catalog down")
+        if order_id not in ledger:
+            ledger.add(order_id)
+            for it in items:
+                stock[it["product_id"]] += it["qty"]
+    monkeypatch.setattr(saga, "release_inventory", release)
+
+    with pytest.raises(httpx.ConnectError):
+        saga.compensate(db, [a, b], "payment_timeout")
+    db.rollback()
+    assert db.get(Order, a).status == "CREATED" and stock == {1: 2}  # a was released before b failed
+    assert sorted(saga.compensate(db, [a, b], "payment_timeout")) == [a, b]
+    assert stock == {1: 3} and ledger == {a, b}
+    assert db.get(OrderSaga, b).state == saga.COMPENSATED and len(sent) == 2
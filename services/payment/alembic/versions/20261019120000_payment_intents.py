@@ -0,0 +1,25 @@
+from alembic import op
+import sqlalchemy as sa
+
+revision = "20261019120000"
+down_revision = None
+
+def upgrade():
+    op.create_table(
+        'payment_intents',
+        sa.Column('payment_id', sa.String(length=64), primary_key=True),
+        sa.Column('order_id', sa.Integer(), nullable=False, unique=True),
+        sa.Column('status', sa.String(length=16), nullable=False, server_default='created'),
+        sa.Column('amount_cents', sa.BigInteger(), nullable=False),
+        sa.Column('currency', sa.String(length=3), nullable=False, server_default='USD'),
+        sa.Column('client_secret', sa.String(length=64), nullable=False),
+        sa.Column('user_email', sa.String(length=255), nullable=True),
+        sa.Column('psp_payment_id', sa.String(length=128), nullable=True),
+        sa.Column('failure_reason', sa.String(length=255), nullable=True),
+        sa.Column('version', sa.Integer(), nullable=False, server_default='1'),
+        sa.Column('created_at', sa.DateTime(), nullable=False, server_default=sa.text("(now() at time zone 'utc')")),
+        sa.Column('updated_at', sa.DateTime(), nullable=False, server_default=sa.text("(now() at time zone 'utc')")),
+    )
+
+def downgrade():
+    op.drop_table('payment_intents')
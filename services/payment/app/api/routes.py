@@ -1,37 +1,244 @@
+import logging
+from fastapi import APIRouter, Depends, Header, HTTPException, Response
+from pydantic import BaseModel, EmailStr, Field, ValidationError
+from redis import Redis, RedisError
+from sqlalchemy.orm import Session
+from typing import Any, Dict, List, Literal
+from app.core.config import settings
+from app.core.idempotency import run_idempotent
+from app.db.models import PaymentIntent
+from app.db.session import SessionLocal
+from app.kafka.producer import send, send_many
+from app.store.intents import (
+    FAILED, REFUNDED, SUCCEEDED, INTENT_READS, cache_get, cache_key, cache_put, ensure_many,
+    get_or_create, intent_id, statuses, to_dict, transition,
+)
 
-from fastapi import APIRouter
-from pydantic import BaseModel
-from app.kafka.producer import send
+log = logging.getLogger(__name__)
 
 router = APIRouter()
 
+_redis: Redis | None = None
+
+def redis_client() -> Redis:
+    # One client (and connection pool) per process; Redis clients are thread-safe
+    global _redis
+    if _redis is None:
+        _redis = Redis.from_url(settings.REDIS_URL, decode_responses=True)
+    return _redis
+
+def get_db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+def payment_event(status: str, intent: dict, user_email: str | None = None,
+                  psp_payment_id: str | None = None, reason: str | None = None) -> dict:
+    ev = {
+        "type": f"payment.{status}",
+        "order_id": intent["order_id"],
+        "payment_id": intent["payment_id"],
+        "amount_cents": intent["amount_cents"],
+        "currency": intent["currency"],
+    }
+    # Carried so consumers (notifications) don't have to look the order up
+    if intent.get("user_email") or user_email:
+        ev["user_email"] = intent.get("user_email") or user_email
+    if psp_payment_id:
+        ev["psp_payment_id"] = psp_payment_id
+    if reason:
+        ev["reason"] = reason
+    return ev
+
+def _cache(r: Redis, moved: List[dict]):
+    # After commit; a failed write drops the entry so a read falls through to Postgres
+    try:
+        cache_put(r, moved)
+    except RedisError:
+        log.warning("payment intent cache write failed", exc_info=True)
+        try:
+            r.delete(*[cache_key(it["payment_id"]) for it in moved])
+        except RedisError:
+            pass
+
 class CreateIntent(BaseModel):
     order_id: int
     amount_cents: int | None = None
     currency: str = "USD"
+    user_email: EmailStr | None = None
 
 class IntentResponse(BaseModel):
     payment_id: str
     client_secret: str
+    status: str
 
 @router.post("/v1/payments/create-intent", response_model=IntentResponse)
-def create_intent(payload: CreateIntent):
-    # Mock: return a fake payment id & secret; real flow would call Stripe/etc.
-    pid = f"pay_{payload.order_id}"
-    return IntentResponse(payment_id=pid, client_secret=f"secret_{payload.order_id}")
+def create_intent(payload: CreateIntent, response: Response, db: Session = Depends(get_db)):
+    """One intent per order: repeating the call returns the stored intent (200 instead of 201)."""
+    existing = db.get(PaymentIntent, intent_id(payload.order_id))
+    if existing is None and payload.amount_cents is None:
+        raise HTTPException(status_code=400, detail="amount_cents is required to create an intent")
+    if existing is not None and payload.amount_cents not in (None, existing.amount_cents):
+        raise HTTPException(status_code=409, detail="An intent with a different amount exists for this order")
+    intent, created = get_or_create(db, payload.order_id, payload.amount_cents, payload.currency, payload.user_email)
+    db.commit()
+    if created:
+        response.status_code = 201
+        _cache(redis_client(), [to_dict(intent)])
+    return IntentResponse(payment_id=intent.payment_id, client_secret=intent.client_secret, status=intent.status)
+
+class IntentOut(BaseModel):
+    payment_id: str
+    order_id: int
+    status: str
+    amount_cents: int
+    currency: str
+    failure_reason: str | None = None
+
+@router.get("/v1/payments/{payment_id}", response_model=IntentOut)
+def get_intent(payment_id: str, db: Session = Depends(get_db)):
+    # Redis first; Postgres only on a miss, which refills the cache
+    r = redis_client()
+    try:
+        cached = cache_get(r, payment_id)
+    except RedisError:
+        r, cached = None, None
+    if cached is not None:
+        INTENT_READS.labels("redis").inc()
+        return cached
+    INTENT_READS.labels("db").inc()
+    intent = db.get(PaymentIntent, payment_id)
+    if intent is None:
+        raise HTTPException(status_code=404, detail="Payment not found")
+    if r is not None:
+        _cache(r, [to_dict(intent)])
+    return to_dict(intent)
 
 class MockSucceed(BaseModel):
     order_id: int
     amount_cents: int
     currency: str = "USD"
+    user_email: EmailStr | None = None
 
 @router.post("/v1/payments/mock-succeed")
-def mock_succeed(payload: MockSucceed):
-    # Emit Kafka event that order service will consume
-    send("payment.events", key=str(payload.order_id), value={
-        "type": "payment.succeeded",
-        "order_id": payload.order_id,
-        "amount_cents": payload.amount_cents,
-        "currency": payload.currency,
-    })
-    return {"status": "ok"}
+def mock_succeed(
+    payload: MockSucceed,
+    response: Response,
+    idempotency_key: str | None = Header(default=None, alias="Idempotency-Key"),
+    db: Session = Depends(get_db),
+):
+    body, replayed = run_idempotent(
+        redis_client(), "mock-succeed", idempotency_key, payload.model_dump(),
+        lambda: _emit_succeeded(payload, db),
+    )
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    return body
+
+def _emit_succeeded(payload: MockSucceed, db: Session) -> dict:
+    intent, _ = get_or_create(db, payload.order_id, payload.amount_cents, payload.currency, payload.user_email)
+    pid = intent.payment_id
+    moved = transition(db, [pid], SUCCEEDED)
+    if not moved:
+        # Already succeeded (or refunded): a duplicate, nothing to publish
+        db.commit()
+        return {"status": "ok", "payment_id": pid, "payment_status": statuses(db, [pid])[pid], "emitted": False}
+    # Queue the event before committing: a crash in between re-delivers rather than loses it
+    send("payment.events", key=str(payload.order_id), value=payment_event("succeeded", moved[0], payload.user_email))
+    db.commit()
+    _cache(redis_client(), moved)
+    return {"status": "ok", "payment_id": pid, "payment_status": SUCCEEDED, "emitted": True}
+
+@router.post("/v1/payments/{payment_id}/refund", response_model=IntentOut)
+def refund(payment_id: str, db: Session = Depends(get_db)):
+    """Mock refund: succeeded -> refunded, emitting payment.refunded once."""
+    moved = transition(db, [payment_id], REFUNDED)
+    if not moved:
+        current = statuses(db, [payment_id]).get(payment_id)
+        if current is None:
+            raise HTTPException(status_code=404, detail="Payment not found")
+        if current != REFUNDED:
+            raise HTTPException(status_code=409, detail=f"Payment cannot be refunded (status={current})")
+        return to_dict(db.get(PaymentIntent, payment_id))
+    send("payment.events", key=str(moved[0]["order_id"]), value=payment_event("refunded", moved[0]))
+    db.commit()
+    _cache(redis_client(), moved)
+    return moved[0]
+
+# --- PSP settlement webhooks (batched) ---
+class PaymentResult(BaseModel):
+    payment_id: str = Field(min_length=1, max_length=128)
+    order_id: int = Field(gt=0)
+    status: Literal["succeeded", "failed"]
+    amount_cents: int = Field(ge=0)
+    currency: str = Field(default="USD", min_length=3, max_length=3)
+    user_email: EmailStr | None = None
+    reason: str | None = Field(default=None, max_length=255)
+
+class WebhookBatch(BaseModel):
+    # Items are validated one by one so a single bad result doesn't bounce the whole delivery
+    results: List[Dict[str, Any]] = Field(min_length=1, max_length=settings.PAYMENT_WEBHOOK_MAX_BATCH)
+
+@router.post("/v1/payments/webhooks/batch")
+def ingest_webhook_batch(payload: WebhookBatch, db: Session = Depends(get_db)):
+    """Accept a PSP batch of payment results; each item is accepted, duplicate or rejected.
+
+    One result per order is applied (a success beats failures; repeats of a payment_id are
+    dropped). Intents are created for unknown orders, then moved with one compare-and-set
+    UPDATE per target state, so redeliveries and stale results change nothing. Only real
+    transitions are published, back to back in the producer's next batch.
+    """
+    out: List[dict] = [{} for _ in payload.results]
+    chosen: Dict[int, tuple] = {}  # order_id -> (index, result)
+    seen_ids: set = set()
+    for i, raw in enumerate(payload.results):
+        try:
+            res = PaymentResult.model_validate(raw)
+        except ValidationError as exc:
+            out[i] = {"index": i, "status": "rejected",
+                      "error": "; ".join(f"{'.'.join(map(str, e['loc']))}: {e['msg']}" for e in exc.errors())}
+            continue
+        out[i] = {"index": i, "payment_id": res.payment_id, "order_id": res.order_id, "status": "duplicate"}
+        if res.payment_id in seen_ids:
+            continue
+        seen_ids.add(res.payment_id)
+        prev = chosen.get(res.order_id)
+        if prev is None or (res.status == SUCCEEDED and prev[1].status == FAILED):
+            chosen[res.order_id] = (i, res)
+
+    ensure_many(db, [res.model_dump() for _, res in chosen.values()])
+    by_intent = {intent_id(oid): (i, res) for oid, (i, res) in chosen.items()}
+    moved: List[dict] = []
+    for to in (SUCCEEDED, FAILED):
+        group = {pid: res for pid, (_, res) in by_intent.items() if res.status == to}
+        moved += transition(
+            db, list(group), to,
+            psp_payment_ids={pid: res.payment_id for pid, res in group.items()},
+            reasons={pid: res.reason for pid, res in group.items() if res.reason} or None,
+        )
+    moved_ids = {it["payment_id"] for it in moved}
+    current = statuses(db, [pid for pid in by_intent if pid not in moved_ids])
+    for pid, (i, res) in by_intent.items():
+        if pid in moved_ids:
+            out[i]["status"] = "accepted"
+        elif current.get(pid) != res.status:
+            out[i].update(status="rejected", error=f"payment is {current.get(pid)}; cannot become {res.status}")
+
+    records = []
+    for it in moved:
+        _, res = by_intent[it["payment_id"]]
+        records.append((str(it["order_id"]), payment_event(it["status"], it, res.user_email, res.payment_id, res.reason)))
+    try:
+        # Queued before the commit: a failure here rolls the transitions back for the PSP's retry
+        send_many("payment.events", records)
+    except Exception:
+        db.rollback()
+        raise HTTPException(status_code=503, detail="Event bus unavailable; retry the batch")
+    db.commit()
+    if moved:
+        _cache(redis_client(), moved)
+
+    counts = {s: sum(1 for o in out if o["status"] == s) for s in ("accepted", "duplicate", "rejected")}
+    return dict(counts, results=out)
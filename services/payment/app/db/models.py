@@ -0,0 +1,19 @@
+from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy import Integer, String, DateTime, BigInteger
+from datetime import datetime
+from app.db.session import Base
+
+class PaymentIntent(Base):
+    __tablename__ = "payment_intents"
+    payment_id: Mapped[str] = mapped_column(String(64), primary_key=True)  # pay_{order_id}
+    order_id: Mapped[int] = mapped_column(Integer, unique=True)
+    status: Mapped[str] = mapped_column(String(16), default="created")
+    amount_cents: Mapped[int] = mapped_column(BigInteger)
+    currency: Mapped[str] = mapped_column(String(3), default="USD")
+    client_secret: Mapped[str] = mapped_column(String(64))
+    user_email: Mapped[str | None] = mapped_column(String(255), nullable=True)
+    psp_payment_id: Mapped[str | None] = mapped_column(String(128), nullable=True)
+    failure_reason: Mapped[str | None] = mapped_column(String(255), nullable=True)
+    version: Mapped[int] = mapped_column(Integer, default=1)  # bumped by every transition
+    created_at: Mapped[datetime] = mapped_column(DateTime(), default=lambda: datetime.utcnow())
+    updated_at: Mapped[datetime] = mapped_column(DateTime(), default=lambda: datetime.utcnow())
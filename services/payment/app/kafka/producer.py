@@ -1,23 +1,117 @@
-
 from kafka import KafkaProducer
-import json
+import json, logging, queue, threading, time
+from typing import List, Tuple
+from prometheus_client import Counter
 from app.core.config import settings
 
+log = logging.getLogger(__name__)
+
+EVENTS = Counter(
+    "payment_events_produced_total", "Events handed to Kafka, by delivery outcome",
+    ["topic", "outcome"],  # delivered | dead_lettered | lost
+)
+
 _producer = None
+_lock = threading.Lock()
+# Retries are left to the client: with one request in flight per connection it re-sends a
+# failed batch before anything behind it, so events for a key stay in order. Re-sending from
+# the app would put a failed event behind newer ones, so a record the client gives up on
+# (after delivery_timeout_ms) is dead-lettered instead. That happens on this thread, never on
+# the producer's I/O thread (a send() there can block on a full buffer only it drains).
+_failures: "queue.Queue[tuple]" = queue.Queue(maxsize=settings.KAFKA_RETRY_QUEUE_SIZE)
+_stop = threading.Event()
+_retry_thread = None
 
-def get_producer():
+def get_producer() -> KafkaProducer:
     global _producer
     if _producer is None:
-        _producer = KafkaProducer(
-            bootstrap_servers=[settings.KAFKA_BOOTSTRAP],
-            value_serializer=lambda v: json.dumps(v).encode("utf-8"),
-            key_serializer=lambda v: (v.encode("utf-8") if isinstance(v, str) else v),
-            linger_ms=5,
-            retries=3,
-        )
+        with _lock:
+            if _producer is None:
+                _producer = KafkaProducer(
+                    bootstrap_servers=[settings.KAFKA_BOOTSTRAP],
+                    value_serializer=lambda v: json.dumps(v).encode("utf-8"),
+                    key_serializer=lambda v: (v.encode("utf-8") if isinstance(v, str) else v),
+                    acks="all",
+                    enable_idempotence=True,  # broker-side dedupe keeps client retries in order
+                    max_in_flight_requests_per_connection=1,
+                    retry_backoff_ms=settings.KAFKA_RETRY_BACKOFF_MS,
+                    compression_type=settings.KAFKA_COMPRESSION or None,
+                    linger_ms=settings.KAFKA_LINGER_MS,
+                    batch_size=settings.KAFKA_BATCH_SIZE,
+                    max_block_ms=settings.KAFKA_MAX_BLOCK_MS,
+                    delivery_timeout_ms=settings.KAFKA_DELIVERY_TIMEOUT_MS,
+                )
+                _start_retry_thread()
     return _producer
 
 def send(topic: str, key: str, value: dict):
-    p = get_producer()
-    p.send(topic, key=key, value=value)
-    p.flush(5)
+    """Queue one event and return at once; delivery is confirmed (or retried) by callbacks."""
+    _send(topic, key, value)
+
+def send_many(topic: str, records: List[Tuple[str, dict]]):
+    """Queue (key, value) records back to back so they share the producer's open batches."""
+    for key, value in records:
+        _send(topic, key, value)
+
+def _send(topic: str, key: str, value: dict):
+    fut = get_producer().send(topic, key=key, value=value)
+    fut.add_callback(_delivered, topic)
+    fut.add_errback(_failed, topic, key, value)
+
+def _delivered(topic: str, _meta):
+    EVENTS.labels(topic, "delivered").inc()
+
+def _lost(topic: str, key: str, value: dict, why: str):
+    # Last resort: the full event goes to the log so it can be replayed by hand
+    EVENTS.labels(topic, "lost").inc()
+    log.error("kafka event lost (%s) topic=%s key=%s value=%s", why, topic, key, json.dumps(value))
+
+def _failed(topic: str, key: str, value: dict, exc: Exception):
+    # The client already retried, in order, until delivery_timeout_ms
+    if _retry_thread is None or not _retry_thread.is_alive():
+        return _lost(topic, key, value, f"shut down: {exc!r}")
+    try:
+        _failures.put_nowait((topic, key, value, repr(exc)))
+    except queue.Full:
+        _lost(topic, key, value, f"dead-letter queue full: {exc!r}")
+
+def _dead_letter(topic: str, key: str, value: dict, error: str):
+    fut = get_producer().send(settings.KAFKA_DLQ_TOPIC, key=key, value={
+        "topic": topic, "key": key, "value": value, "error": error, "failed_at": time.time(),
+    })
+    fut.add_callback(lambda _meta: EVENTS.labels(topic, "dead_lettered").inc())
+    fut.add_errback(lambda exc: _lost(topic, key, value, f"dead-letter failed: {exc!r}"))
+
+def _retry_loop():
+    while not (_stop.is_set() and _failures.empty()):
+        try:
+            topic, key, value, error = _failures.get(timeout=0.5)
+        except queue.Empty:
+            continue
+        try:
+            log.warning("giving up on event topic=%s key=%s: %s", topic, key, error)
+            _dead_letter(topic, key, value, error)
+        except Exception as exc:
+            _lost(topic, key, value, f"dead-letter failed: {exc!r}")
+
+def _start_retry_thread():
+    global _retry_thread
+    _stop.clear()
+    _retry_thread = threading.Thread(target=_retry_loop, name="payment-producer-retry", daemon=True)
+    _retry_thread.start()
+
+def close(timeout: float | None = None):
+    """Graceful shutdown: deliver everything still buffered, then close the producer."""
+    global _producer, _retry_thread
+    if _producer is None:
+        return
+    timeout = settings.KAFKA_FLUSH_TIMEOUT_SECONDS if timeout is None else timeout
+    try:
+        _producer.flush(timeout)
+    except Exception:
+        log.exception("kafka flush on shutdown did not complete")
+    _stop.set()
+    if _retry_thread is not None:
+        _retry_thread.join(timeout)
+    _producer.close(timeout)  # close() flushes anything the retry thread dead-lettered on its way out
+    _producer, _retry_thread = None, None
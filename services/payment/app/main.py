@@ -1,6 +1,7 @@
 from fastapi import FastAPI
 from app.version import VERSION
 from app.api import routes
+from app.kafka import producer
 from prometheus_fastapi_instrumentator import Instrumentator
 
 # Create instrumentator first
@@ -32,4 +33,9 @@ async def startup_event():
         if hasattr(route, "methods") and hasattr(route, "path"):
             print(f"{route.methods} {route.path}")
 
+@app.on_event("shutdown")
+def shutdown_event():
+    # The only flush: deliver whatever is still batched before the process exits
+    producer.close()
+
 app.include_router(routes.router, prefix='/payment', tags=["payments"])
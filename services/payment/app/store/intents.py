@@ -0,0 +1,136 @@
+import secrets
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+from prometheus_client import Counter
+from redis import Redis
+from sqlalchemy import case, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.db.models import PaymentIntent
+
+# Postgres is the system of record; Redis holds a copy of each intent for status reads:
+#   payment:intent:{payment_id}   hash of the public fields + version
+# Every state change is a compare-and-set UPDATE (… WHERE status IN <allowed sources>), so
+# a duplicate or out-of-order PSP result changes nothing and emits nothing. The cache is
+# written after commit and only ever moves to a higher version.
+
+CREATED, SUCCEEDED, FAILED, REFUNDED = "created", "succeeded", "failed", "refunded"
+TRANSITIONS = {  # target -> states it may be reached from
+    SUCCEEDED: (CREATED, FAILED),  # a declined card may be retried on the same intent
+    FAILED: (CREATED,),
+    REFUNDED: (SUCCEEDED,),
+}
+
+_CACHE_LUA = """
+local cur = tonumber(redis.call('HGET', KEYS[1], 'version') or '0')
+if tonumber(ARGV[2]) > cur then
+  redis.call('HSET', KEYS[1], unpack(ARGV, 3))
+end
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+"""
+
+INTENT_READS = Counter("payment_intent_reads_total", "GET /v1/payments/{id} reads by source", ["source"])
+TRANSITIONS_TOTAL = Counter("payment_intent_transitions_total", "Intent state changes", ["to"])
+
+_PUBLIC = ("payment_id", "order_id", "status", "amount_cents", "currency", "user_email", "failure_reason", "version")
+
+def intent_id(order_id: int) -> str:
+    return f"pay_{order_id}"
+
+def cache_key(payment_id: str) -> str:
+    return f"payment:intent:{payment_id}"
+
+def to_dict(intent: PaymentIntent) -> dict:
+    return {f: getattr(intent, f) for f in _PUBLIC}
+
+def get_or_create(db: Session, order_id: int, amount_cents: int, currency: str = "USD",
+                  user_email: str | None = None) -> Tuple[PaymentIntent, bool]:
+    """The order's one intent, created on first use. Returns (intent, created)."""
+    found = db.get(PaymentIntent, intent_id(order_id))
+    if found:
+        return found, False
+    intent = PaymentIntent(
+        payment_id=intent_id(order_id), order_id=order_id, status=CREATED,
+        amount_cents=amount_cents, currency=currency.upper(), user_email=user_email,
+        client_secret=f"{intent_id(order_id)}_secret_{secrets.token_urlsafe(24)}",
+    )
+    try:
+        with db.begin_nested():
+            db.add(intent)
+    except IntegrityError:
+        # Lost a creation race; the winner's row is the intent
+        return db.get(PaymentIntent, intent_id(order_id), populate_existing=True), False
+    return intent, True
+
+def ensure_many(db: Session, results: Iterable[dict]):
+    """Create intents for any of these PSP results' orders that don't have one yet (one SELECT,
+    one bulk INSERT; falls back to one-by-one if a concurrent request created some meanwhile)."""
+    by_order = {res["order_id"]: res for res in results}
+    have = set(db.scalars(select(PaymentIntent.order_id).where(PaymentIntent.order_id.in_(by_order))))
+    missing = [res for oid, res in by_order.items() if oid not in have]
+    if not missing:
+        return
+    rows = [{
+        "payment_id": intent_id(res["order_id"]), "order_id": res["order_id"], "status": CREATED,
+        "amount_cents": res["amount_cents"], "currency": res["currency"].upper(), "user_email": res.get("user_email"),
+        "client_secret": f"{intent_id(res['order_id'])}_secret_{secrets.token_urlsafe(24)}",
+        "version": 1, "created_at": datetime.utcnow(), "updated_at": datetime.utcnow(),
+    } for res in missing]
+    try:
+        with db.begin_nested():
+            db.execute(PaymentIntent.__table__.insert(), rows)
+    except IntegrityError:
+        for res in missing:
+            get_or_create(db, res["order_id"], res["amount_cents"], res["currency"], res.get("user_email"))
+
+def transition(db: Session, payment_ids: List[str], to: str,
+               psp_payment_ids: Dict[str, str] | None = None,
+               reasons: Dict[str, str] | None = None) -> List[dict]:
+    """Compare-and-set `payment_ids` to `to`, in one UPDATE. Returns the intents that actually
+    moved (new state); ids already there, or in a state `to` can't be reached from, are skipped."""
+    if not payment_ids:
+        return []
+    values = {"status": to, "version": PaymentIntent.version + 1, "updated_at": datetime.utcnow()}
+    if psp_payment_ids:
+        values["psp_payment_id"] = case(psp_payment_ids, value=PaymentIntent.payment_id,
+                                        else_=PaymentIntent.psp_payment_id)
+    if reasons:
+        values["failure_reason"] = case(reasons, value=PaymentIntent.payment_id, else_=PaymentIntent.failure_reason)
+    stmt = (
+        update(PaymentIntent)
+        .where(PaymentIntent.payment_id.in_(payment_ids), PaymentIntent.status.in_(TRANSITIONS[to]))
+        .values(**values)
+        .returning(*[getattr(PaymentIntent, f) for f in _PUBLIC])
+        .execution_options(synchronize_session=False)
+    )
+    moved = [dict(row._mapping) for row in db.execute(stmt)]
+    if moved:
+        TRANSITIONS_TOTAL.labels(to).inc(len(moved))
+    return moved
+
+def statuses(db: Session, payment_ids: Iterable[str]) -> Dict[str, str]:
+    return dict(db.execute(
+        select(PaymentIntent.payment_id, PaymentIntent.status).where(PaymentIntent.payment_id.in_(list(payment_ids)))
+    ).all())
+
+def cache_put(r: Redis, intents: Iterable[dict]):
+    """Write committed intents to Redis; an older version never overwrites a newer one."""
+    pipe = r.pipeline(transaction=False)
+    script = r.register_script(_CACHE_LUA)
+    for it in intents:
+        fields = [x for f in _PUBLIC for x in (f, "" if it[f] is None else it[f])]
+        script(keys=[cache_key(it["payment_id"])],
+               args=[settings.PAYMENT_INTENT_CACHE_TTL_SECONDS, it["version"], *fields], client=pipe)
+    pipe.execute()
+
+def cache_get(r: Redis, payment_id: str) -> Optional[dict]:
+    h = r.hgetall(cache_key(payment_id))
+    if not h:
+        return None
+    return {
+        "payment_id": h["payment_id"], "order_id": int(h["order_id"]), "status": h["status"],
+        "amount_cents": int(h["amount_cents"]), "currency": h["currency"],
+        "user_email": h["user_email"] or None, "failure_reason": h["failure_reason"] or None,
+        "version": int(h["version"]),
+    }
@@ -0,0 +1,34 @@
+import fakeredis, pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.api import routes
+from app.db.session import Base
+from app.main import app
+
+@pytest.fixture
+def published(monkeypatch):
+    """Events handed to the producer, as (topic, key, value)."""
+    sent = []
+    monkeypatch.setattr(routes, "send", lambda topic, key, value: sent.append((topic, key, value)))
+    monkeypatch.setattr(routes, "send_many", lambda topic, records: sent.extend((topic, k, v) for k, v in records))
+    return sent
+
+@pytest.fixture
+def client(monkeypatch, published):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine, autoflush=False)
+
+    def get_db():
+        db = Session()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    monkeypatch.setattr(routes, "_redis", fakeredis.FakeRedis(decode_responses=True))
+    app.dependency_overrides[routes.get_db] = get_db
+    yield TestClient(app)
+    app.dependency_overrides.clear()
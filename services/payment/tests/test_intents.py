@@ -0,0 +1,51 @@
+from app.api import routes
+from app.store.intents import cache_key, cache_put
+
+def routes_redis():
+    return routes._redis
+
+def test_create_intent_is_idempotent_per_order(client):
+    first = client.post("/payment/v1/payments/create-intent", json={"order_id": 5, "amount_cents": 2599})
+    again = client.post("/payment/v1/payments/create-intent", json={"order_id": 5})
+    assert first.status_code == 201 and again.status_code == 200
+    assert first.json() == again.json()
+    assert first.json()["payment_id"] == "pay_5" and first.json()["status"] == "created"
+
+    clash = client.post("/payment/v1/payments/create-intent", json={"order_id": 5, "amount_cents": 1})
+    assert clash.status_code == 409
+
+def test_mock_succeed_emits_only_on_transition(client, published):
+    body = {"order_id": 6, "amount_cents": 1000, "user_email": "cust@example.com"}
+    first = client.post("/payment/v1/payments/mock-succeed", json=body).json()
+    second = client.post("/payment/v1/payments/mock-succeed", json=body).json()
+    assert first["emitted"] is True and second["emitted"] is False
+    assert second["payment_status"] == "succeeded"
+    assert [(k, v["type"], v["user_email"]) for _, k, v in published] == [("6", "payment.succeeded", "cust@example.com")]
+
+def test_status_served_from_cache(client):
+    client.post("/payment/v1/payments/mock-succeed", json={"order_id": 8, "amount_cents": 1000})
+    r = routes_redis()
+    assert r.hget(cache_key("pay_8"), "status") == "succeeded"
+    r.hset(cache_key("pay_8"), "currency", "EUR")  # prove the read doesn't touch Postgres
+    assert client.get("/payment/v1/payments/pay_8").json()["currency"] == "EUR"
+
+    r.delete(cache_key("pay_8"))
+    assert client.get("/payment/v1/payments/pay_8").json()["currency"] == "USD"
+    assert r.hget(cache_key("pay_8"), "currency") == "USD"  # refilled
+    assert client.get("/payment/v1/payments/pay_404").status_code == 404
+
+def test_refund_transitions_once(client, published):
+    client.post("/payment/v1/payments/create-intent", json={"order_id": 3, "amount_cents": 500})
+    assert client.post("/payment/v1/payments/pay_3/refund").status_code == 409
+    client.post("/payment/v1/payments/mock-succeed", json={"order_id": 3, "amount_cents": 500})
+    assert client.post("/payment/v1/payments/pay_3/refund").json()["status"] == "refunded"
+    assert client.post("/payment/v1/payments/pay_3/refund").status_code == 200
+    assert [v["type"] for _, _, v in published] == ["payment.succeeded", "payment.refunded"]
+
+def test_cache_never_regresses(client):
+    r = routes_redis()
+    it = {"payment_id": "pay_1", "order_id": 1, "status": "succeeded", "amount_cents": 1, "currency": "USD",
+          "user_email": None, "failure_reason": None, "version": 3}
+    cache_put(r, [it])
+    cache_put(r, [dict(it, status="created", version=1)])
+    assert r.hget(cache_key("pay_1"), "status") == "succeeded"
@@ -0,0 +1,63 @@
+import time
+from kafka.errors import KafkaTimeoutError
+from kafka.future import Future
+from app.core.config import settings
+from app.kafka import producer
+
+class FakeProducer:
+    """Records sends; fails every send to `failing` topics through the errback."""
+
+    def __init__(self, failing=()):
+        self.config = {}
+        self.failing = set(failing)
+        self.sent = []
+        self.pending = []
+        self.flushes = 0
+
+    def send(self, topic, key=None, value=None):
+        self.sent.append((topic, key, value))
+        fut = Future()
+        self.pending.append((topic, fut))
+        return fut
+
+    def flush(self, timeout=None):
+        self.flushes += 1
+        while self.pending:
+            topic, fut = self.pending.pop(0)
+            fut.failure(KafkaTimeoutError("expired")) if topic in self.failing else fut.success(None)
+
+    def close(self, timeout=None):
+        self.flush(timeout)
+
+def _install(monkeypatch, **kw):
+    fake = FakeProducer(**kw)
+    monkeypatch.setattr(producer, "KafkaProducer", lambda **config: fake.config.update(config) or fake)
+    monkeypatch.setattr(settings, "KAFKA_RETRY_BACKOFF_MS", 0)
+    return fake
+
+def test_send_does_not_flush_until_shutdown(monkeypatch):
+    fake = _install(monkeypatch)
+    for n in range(50):
+        producer.send("payment.events", key=str(n), value={"order_id": n})
+    assert len(fake.sent) == 50 and fake.flushes == 0
+    assert fake.config["compression_type"] == settings.KAFKA_COMPRESSION
+    assert fake.config["linger_ms"] == settings.KAFKA_LINGER_MS
+
+    producer.close()
+    assert fake.flushes >= 1 and not fake.pending
+
+def test_failed_delivery_is_dead_lettered_not_resent(monkeypatch):
+    fake = _install(monkeypatch, failing={"payment.events"})
+    producer.send("payment.events", key="7", value={"order_id": 7})
+    # retries belong to the client, one request in flight, so they can't overtake newer events
+    assert fake.config["max_in_flight_requests_per_connection"] == 1
+    deadline = time.monotonic() + 5
+    while fake.sent[-1][0] != settings.KAFKA_DLQ_TOPIC and time.monotonic() < deadline:
+        fake.flush()
+        time.sleep(0.01)
+    producer.close(timeout=2)
+
+    topics = [t for t, _, _ in fake.sent]
+    assert topics == ["payment.events", settings.KAFKA_DLQ_TOPIC]
+    dlq = fake.sent[-1][2]
+    assert dlq["topic"] == "payment.events" and dlq["value"] == {"order_id": 7} and "expired" in dlq["error"]
@@ -0,0 +1,42 @@
+def _result(n, **kw):
+    return dict({"payment_id": f"pm_{n}", "order_id": n, "status": "succeeded", "amount_cents": 1000,
+                 "user_email": f"user{n}@example.com"}, **kw)
+
+def test_batch_dedupes_and_reports_per_item(client, published):
+    batch = [
+        _result(1),
+        _result(2, status="failed", reason="card_declined"),
+        _result(1),                                     # same payment id
+        _result(3, payment_id="pm_other", order_id=1),  # second success for order 1
+        {"payment_id": "pm_4", "order_id": "x", "status": "succeeded", "amount_cents": 5},
+    ]
+    body = client.post("/payment/v1/payments/webhooks/batch", json={"results": batch}).json()
+    assert (body["accepted"], body["duplicate"], body["rejected"]) == (2, 2, 1)
+    assert [r["status"] for r in body["results"]] == ["accepted", "accepted", "duplicate", "duplicate", "rejected"]
+    assert "order_id" in body["results"][4]["error"]
+
+    # only real transitions are published, with the customer's email
+    assert sorted((k, v["type"], v["user_email"]) for _, k, v in published) == [
+        ("1", "payment.succeeded", "user1@example.com"), ("2", "payment.failed", "user2@example.com"),
+    ]
+    failed = next(v for _, _, v in published if v["type"] == "payment.failed")
+    assert failed["reason"] == "card_declined" and failed["psp_payment_id"] == "pm_2"
+
+    # a PSP redelivery of the same batch publishes nothing new
+    again = client.post("/payment/v1/payments/webhooks/batch", json={"results": batch[:2]}).json()
+    assert again["accepted"] == 0 and again["duplicate"] == 2
+    assert len(published) == 2
+
+def test_stale_failure_after_success_is_rejected(client, published):
+    client.post("/payment/v1/payments/webhooks/batch", json={"results": [_result(7)]})
+    late = client.post("/payment/v1/payments/webhooks/batch",
+                       json={"results": [_result(7, payment_id="pm_late", status="failed")]}).json()
+    assert late["results"][0]["status"] == "rejected"
+    assert "succeeded" in late["results"][0]["error"]
+    assert [v["type"] for _, _, v in published] == ["payment.succeeded"]
+
+def test_retry_after_decline_succeeds_in_same_batch(client, published):
+    batch = [_result(9, payment_id="pm_a", status="failed"), _result(9, payment_id="pm_b")]
+    body = client.post("/payment/v1/payments/webhooks/batch", json={"results": batch}).json()
+    assert [r["status"] for r in body["results"]] == ["duplicate", "accepted"]
+    assert client.get("/payment/v1/payments/pay_9").json()["status"] == "succeeded"
@@ -0,0 +1,12 @@
+from alembic import op
+
+revision = "20261019130000_status_created"
+down_revision = "20250825153000_init_shipping"
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    op.create_index("ix_shipments_status_created", "shipments", ["status", "created_at", "id"])
+
+def downgrade() -> None:
+    op.drop_index("ix_shipments_status_created", table_name="shipments")
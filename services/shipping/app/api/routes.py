@@ -1,12 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from pydantic import BaseModel, EmailStr, Field
+from sqlalchemy import select, tuple_
 from sqlalchemy.orm import Session
-from typing import Optional, List
-import secrets
+from datetime import datetime
+from typing import Literal, Optional, List, Tuple
+import base64, secrets
 
 from app.db.session import SessionLocal
 from app.db.models import Shipment, ShipmentStatus
-from app.kafka.producer import emit as emit_shipping_event
+from app.core.config import settings
+from app.kafka.producer import emit as emit_shipping_event, emit_many
+from app.services import labels, rates, storage
+from app.services.transitions import current_statuses, event_for, transition
 
 router = APIRouter()
 
@@ -61,13 +66,79 @@ def get_shipment(shipment_id: int, db: Session = Depends(get_db)):
         raise HTTPException(404, "Not found")
     return ShipmentOut(**shp.__dict__)
 
-@router.get("/shipping/v1/shipments", response_model=List[ShipmentOut])
-def list_shipments(order_id: Optional[int] = None, db: Session = Depends(get_db)):
-    q = db.query(Shipment)
+# Columns a listing may project; id and created_at are always read (they form the cursor)
+LIST_FIELDS = (
+    "id", "order_id", "user_email", "address_line1", "address_line2", "city", "country", "postcode",
+    "carrier", "tracking_number", "status", "created_at", "updated_at",
+)
+DEFAULT_LIST_FIELDS = "id,order_id,status,country,carrier,tracking_number,created_at"
+
+def encode_cursor(created_at: datetime, shipment_id: int) -> str:
+    raw = f"{created_at.isoformat()}|{shipment_id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    created_at, shipment_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|", 1)
+    return datetime.fromisoformat(created_at), int(shipment_id)
+
+def _json_value(v):
+    if isinstance(v, datetime):
+        return v.isoformat()
+    if isinstance(v, ShipmentStatus):
+        return v.value
+    return v
+
+@router.get("/shipping/v1/shipments")
+def list_shipments(
+    order_id: Optional[int] = None,
+    status: Optional[List[ShipmentStatus]] = Query(default=None),
+    country: Optional[str] = Query(default=None, min_length=2, max_length=2),
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    order: Literal["asc", "desc"] = "desc",
+    fields: str = DEFAULT_LIST_FIELDS,
+    limit: int = Query(default=50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    """Keyset page of shipments on (created_at, id), only the requested columns.
+
+    `status` may be repeated; `order=asc` gives oldest-first pick lists. With a status
+    filter the page is a range scan of ix_shipments_status_created.
+    """
+    wanted = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in wanted if f not in LIST_FIELDS]
+    if unknown or not wanted:
+        raise HTTPException(400, f"Unknown fields: {', '.join(unknown)}; allowed: {', '.join(LIST_FIELDS)}")
+    cols = list(dict.fromkeys(["id", "created_at", *wanted]))
+
+    stmt = select(*[getattr(Shipment, c) for c in cols])
     if order_id is not None:
-        q = q.filter(Shipment.order_id == int(order_id))
-    rows = q.all()
-    return [ShipmentOut(**r.__dict__) for r in rows]
+        stmt = stmt.where(Shipment.order_id == order_id)
+    if status:
+        stmt = stmt.where(Shipment.status.in_(status))
+    if country:
+        stmt = stmt.where(Shipment.country == country.upper())
+    if created_from is not None:
+        stmt = stmt.where(Shipment.created_at >= created_from)
+    if created_to is not None:
+        stmt = stmt.where(Shipment.created_at < created_to)
+    key = tuple_(Shipment.created_at, Shipment.id)
+    if cursor:
+        try:
+            after = decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(400, "Invalid cursor")
+        stmt = stmt.where(key > after if order == "asc" else key < after)
+    if order == "asc":
+        stmt = stmt.order_by(Shipment.created_at.asc(), Shipment.id.asc())
+    else:
+        stmt = stmt.order_by(Shipment.created_at.desc(), Shipment.id.desc())
+    rows = db.execute(stmt.limit(limit + 1)).mappings().all()
+
+    next_cursor = encode_cursor(rows[limit - 1]["created_at"], rows[limit - 1]["id"]) if len(rows) > limit else None
+    items = [{f: _json_value(row[f]) for f in wanted} for row in rows[:limit]]
+    return {"items": items, "next_cursor": next_cursor}
 
 @router.post("/shipping/v1/shipments/{shipment_id}/dispatch", response_model=ShipmentOut)
 def dispatch_shipment(shipment_id: int, db: Session = Depends(get_db)):
@@ -86,7 +157,160 @@ def dispatch_shipment(shipment_id: int, db: Session = Depends(get_db)):
         "order_id": shp.order_id,
         "user_email": shp.user_email,
         "shipment_id": shp.id,
+        "carrier": shp.carrier,
         "tracking_number": shp.tracking_number
     })
 
     return ShipmentOut(**shp.__dict__)
+
+class BulkDispatch(BaseModel):
+    shipment_ids: List[int] = Field(min_length=1, max_length=settings.SHIPPING_BULK_MAX_IDS)
+    carrier: str = Field(default="DemoCarrier", min_length=1, max_length=64)
+
+class BulkStatus(BaseModel):
+    shipment_ids: List[int] = Field(min_length=1, max_length=settings.SHIPPING_BULK_MAX_IDS)
+    status: Literal["DISPATCHED", "DELIVERED", "CANCELLED"]
+    carrier: str = Field(default="DemoCarrier", min_length=1, max_length=64)
+
+def _bulk_transition(db: Session, ids: List[int], to: ShipmentStatus, carrier: str) -> dict:
+    ids = list(dict.fromkeys(ids))
+    moved = {row["id"]: row for row in transition(db, to, ids=ids, carrier=carrier)}
+    try:
+        # Queued before the commit, so an event bus that refuses the events (e.g. a full buffer) rolls the
+        # transitions back and the wave can be retried. Delivery itself is confirmed after the commit; an
+        # event the producer can't deliver is dead-lettered, not rolled back (see app/kafka/producer.py)
+        emit_many([event_for(row, to) for row in moved.values()])
+    except Exception:
+        db.rollback()
+        raise HTTPException(status_code=503, detail="Event bus unavailable; retry the wave")
+    db.commit()
+
+    current = current_statuses(db, [i for i in ids if i not in moved])
+    results = []
+    for i in ids:
+        if i in moved:
+            results.append({"id": i, "result": "ok", "status": to.value,
+                            "carrier": moved[i]["carrier"], "tracking_number": moved[i]["tracking_number"]})
+        elif i in current:
+            results.append({"id": i, "result": "conflict", "status": ShipmentStatus(current[i]).value})
+        else:
+            results.append({"id": i, "result": "not_found"})
+    out = {"updated": len(moved), "results": results}
+    if to == ShipmentStatus.DISPATCHED and moved:
+        # Rendered in the background, labels in request order; null when the label queue is full
+        # (re-request via /labels/waves)
+        out["label_wave"] = labels.enqueue([moved[i] for i in ids if i in moved])
+    return out
+
+@router.post("/shipping/v1/shipments/dispatch")
+def bulk_dispatch(payload: BulkDispatch, db: Session = Depends(get_db)):
+    """Dispatch a wave: every READY_TO_SHIP shipment among the ids moves in one UPDATE with its
+    own tracking number; the rest are reported per id (conflict with their status, or not_found).
+    The moved shipments' labels are queued as one label wave."""
+    return _bulk_transition(db, payload.shipment_ids, ShipmentStatus.DISPATCHED, payload.carrier)
+
+@router.post("/shipping/v1/shipments/status")
+def bulk_status(payload: BulkStatus, db: Session = Depends(get_db)):
+    """Bulk DISPATCHED / DELIVERED / CANCELLED transition with the same per-id results."""
+    return _bulk_transition(db, payload.shipment_ids, ShipmentStatus(payload.status), payload.carrier)
+
+@router.post("/shipping/v1/shipments/{shipment_id}/cancel", response_model=ShipmentOut)
+def cancel_shipment(shipment_id: int, db: Session = Depends(get_db)):
+    shp = db.get(Shipment, shipment_id)
+    if not shp:
+        raise HTTPException(404, "Not found")
+    if shp.status == ShipmentStatus.CANCELLED:
+        return ShipmentOut(**shp.__dict__)
+    if shp.status not in (ShipmentStatus.PENDING_PAYMENT, ShipmentStatus.READY_TO_SHIP):
+        raise HTTPException(409, f"Shipment cannot be cancelled (status={shp.status})")
+    shp.status = ShipmentStatus.CANCELLED
+    db.add(shp); db.commit(); db.refresh(shp)
+
+    emit_shipping_event({
+        "type": "shipping.cancelled",
+        "order_id": shp.order_id,
+        "user_email": shp.user_email,
+        "shipment_id": shp.id,
+    })
+
+    return ShipmentOut(**shp.__dict__)
+
+# --- Rate quotes (in-memory carrier tables, see app/services/rates.py) ---
+class BasketItem(BaseModel):
+    sku: Optional[str] = None
+    weight_g: int = Field(ge=0, le=1_000_000)
+    quantity: int = Field(default=1, ge=1, le=10_000)
+
+class QuoteRequest(BaseModel):
+    ref: Optional[str] = None
+    country: str = Field(min_length=2, max_length=2)
+    postcode: str = ""
+    items: List[BasketItem] = Field(min_length=1)
+    carrier: Optional[str] = None
+
+class QuoteBatch(BaseModel):
+    quotes: List[QuoteRequest] = Field(min_length=1, max_length=settings.RATE_QUOTE_MAX_BATCH)
+
+def _rate_table() -> rates.RateTable:
+    try:
+        return rates.current()
+    except rates.RateTableError:
+        raise HTTPException(status_code=503, detail="Rate tables unavailable")
+
+@router.get("/shipping/v1/rates")
+def rate_table_info():
+    table = _rate_table()
+    return {"version": table.version, "currency": table.currency, "carriers": list(table.carriers),
+            "zones": list(table.zones), "weight_bands_g": list(table.bands)}
+
+@router.post("/shipping/v1/rates/quote")
+def quote_rates(payload: QuoteBatch):
+    """Shipping options for whole baskets: each quote totals its items' weight and prices it
+    for every carrier serving the destination (cheapest first). One table version per batch."""
+    table = _rate_table()
+    results = []
+    for q in payload.quotes:
+        weight = sum(it.weight_g * it.quantity for it in q.items)
+        results.append({"ref": q.ref, "weight_g": weight,
+                        "options": table.quote(q.country, q.postcode, weight, q.carrier)})
+    return {"table_version": table.version, "currency": table.currency, "results": results}
+
+# --- Labels (rendered off the request path, see app/services/labels.py) ---
+class LabelWave(BaseModel):
+    shipment_ids: List[int] = Field(min_length=1, max_length=settings.SHIPPING_BULK_MAX_IDS)
+
+@router.post("/shipping/v1/labels/waves", status_code=202)
+def create_label_wave(payload: LabelWave, db: Session = Depends(get_db)):
+    """(Re)render labels for already dispatched shipments, e.g. after a reprint or a full queue."""
+    ids = list(dict.fromkeys(payload.shipment_ids))
+    rows = db.scalars(select(Shipment).where(
+        Shipment.id.in_(ids), Shipment.status.in_((ShipmentStatus.DISPATCHED, ShipmentStatus.DELIVERED))
+    )).all()
+    if not rows:
+        raise HTTPException(404, "No dispatched shipments among the ids")
+    wave = labels.enqueue(sorted(rows, key=lambda r: ids.index(r.id)))
+    if wave is None:
+        raise HTTPException(503, "Label queue is full; retry shortly")
+    return wave
+
+@router.get("/shipping/v1/labels/waves/{wave_id}")
+def get_label_wave(wave_id: str):
+    wave = labels.wave_status(wave_id)
+    if wave is None:
+        raise HTTPException(404, "Unknown or expired wave")
+    return wave
+
+def _label_object(key: str, fmt: str) -> Response:
+    data = storage.get_bytes(key)
+    if data is None:
+        raise HTTPException(404, "Label not rendered")
+    return Response(content=data, media_type="application/pdf" if fmt == "pdf" else labels.ZPL_TYPE)
+
+@router.get("/shipping/v1/labels/waves/{wave_id}/{fmt}")
+def get_wave_document(wave_id: str, fmt: Literal["pdf", "zpl"]):
+    """The whole wave as one printer job, labels in request order."""
+    return _label_object(labels.wave_key(wave_id, fmt), fmt)
+
+@router.get("/shipping/v1/shipments/{shipment_id}/label")
+def get_shipment_label(shipment_id: int, format: Literal["pdf", "zpl"] = "pdf"):
+    return _label_object(labels.label_key(shipment_id, format), format)
@@ -1,5 +1,5 @@
 from sqlalchemy.orm import Mapped, mapped_column
-from sqlalchemy import Integer, String, DateTime, Enum as SAEnum
+from sqlalchemy import Integer, String, DateTime, Index, Enum as SAEnum
 from datetime import datetime
 from enum import Enum
 from app.db.session import Base
@@ -27,3 +27,8 @@ class Shipment(Base):
     status: Mapped[str] = mapped_column(SAEnum(ShipmentStatus), default=ShipmentStatus.PENDING_PAYMENT)
     created_at: Mapped[datetime] = mapped_column(DateTime(), default=lambda: datetime.utcnow())
     updated_at: Mapped[datetime] = mapped_column(DateTime(), default=lambda: datetime.utcnow())
+
+    __table_args__ = (
+        # Warehouse pick lists: one status, oldest/newest first, keyset on (created_at, id)
+        Index("ix_shipments_status_created", "status", "created_at", "id"),
+    )
@@ -1,31 +1,122 @@
-import json, threading
+import json, logging, threading, time
+from typing import Iterable, List, Tuple
 from kafka import KafkaConsumer
+from prometheus_client import Counter, Gauge, Histogram
+from sqlalchemy.orm import Session
 from app.core.config import settings
 from app.db.session import SessionLocal
-from app.db.models import Shipment, ShipmentStatus
-from app.kafka.producer import emit as emit_shipping_event
+from app.db.models import ShipmentStatus
+from app.kafka.producer import emit_many, send
+from app.services.transitions import event_for, transition
+
+log = logging.getLogger(__name__)
 
 _stop = threading.Event()
 _thread = None
 
-def _handle_payment_event(ev: dict, db):
-    if ev.get("type") != "payment.succeeded":
-        return
-    order_id = ev.get("order_id")
-    if not order_id:
-        return
-    shp = db.query(Shipment).filter(Shipment.order_id == int(order_id)).one_or_none()
-    if not shp:
-        return
-    if shp.status == ShipmentStatus.PENDING_PAYMENT:
-        shp.status = ShipmentStatus.READY_TO_SHIP
-        db.add(shp); db.commit()
-        emit_shipping_event({
-            "type": "shipping.ready",
-            "order_id": shp.order_id,
-            "user_email": shp.user_email,
-            "shipment_id": shp.id
-        })
+CONSUMER_LAG = Gauge("shipping_consumer_lag", "Messages behind the partition high watermark", ["topic", "partition"])
+BATCH_SIZE = Histogram("shipping_consumer_batch_size", "Records per poll() batch", buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000))
+BATCH_FAILURES = Counter("shipping_consumer_batch_failures_total", "Batches rolled back and retried")
+DEAD_LETTERED = Counter("shipping_consumer_dead_lettered_total", "Payment events sent to the DLQ", ["reason"])  # invalid, failed
+
+def process_batch(events: Iterable[dict], db: Session) -> List[dict]:
+    """Apply a batch of payment events in one transaction.
+
+    Every PENDING_PAYMENT shipment of an order named by a `payment.succeeded` event moves to
+    READY_TO_SHIP in one UPDATE ... RETURNING (duplicates and already-moved shipments drop
+    out there). The `shipping.ready` events are queued before the commit, so a crash in
+    between re-delivers them on retry rather than losing them.
+    """
+    order_ids = {int(ev["order_id"]) for ev in events if ev.get("type") == "payment.succeeded" and ev.get("order_id")}
+    if not order_ids:
+        return []
+    moved = transition(db, ShipmentStatus.READY_TO_SHIP, order_ids=order_ids)
+    emit_many([event_for(row, ShipmentStatus.READY_TO_SHIP) for row in moved])
+    db.commit()
+    return moved
+
+def validate(records) -> Tuple[list, List[tuple]]:
+    """Split records into (processable, [(record, error)]); a bad payload never becomes valid on replay."""
+    good, bad = [], []
+    for rec in records:
+        ev = rec.value
+        try:
+            if not isinstance(ev, dict):
+                raise ValueError("event is not an object")
+            if ev.get("type") == "payment.succeeded" and int(ev["order_id"]) <= 0:
+                raise ValueError("order_id must be positive")
+            good.append(rec)
+        except (KeyError, TypeError, ValueError) as exc:
+            bad.append((rec, exc))
+    return good, bad
+
+def dead_letter(rec, exc: BaseException, reason: str):
+    log.error("payment event %s[%d]@%d dead-lettered (%s): %r", rec.topic, rec.partition, rec.offset, reason, exc)
+    key = rec.key.decode("utf-8") if isinstance(rec.key, bytes) else rec.key
+    send(settings.CONSUMER_DLQ_TOPIC, key, {
+        "topic": rec.topic, "partition": rec.partition, "offset": rec.offset, "value": rec.value,
+        "error": repr(exc)[:1000], "failed_at": time.time(),
+    })
+    DEAD_LETTERED.labels(reason).inc()
+
+def _isolate(records):
+    # Give up on the batch as a whole: apply records one by one, dead-lettering those that fail
+    for rec in records:
+        try:
+            with SessionLocal() as db:
+                process_batch([rec.value], db)
+        except Exception as exc:
+            dead_letter(rec, exc, "failed")
+
+def _backoff(failures: int) -> float:
+    return min(settings.CONSUMER_RETRY_MAX_BACKOFF_SECONDS, settings.CONSUMER_RETRY_BACKOFF_SECONDS * 2 ** (failures - 1))
+
+def _record_lag(consumer: KafkaConsumer):
+    for tp in consumer.assignment():
+        hw = consumer.highwater(tp)  # cached from fetch responses, no broker round trip
+        if hw is not None:
+            CONSUMER_LAG.labels(tp.topic, tp.partition).set(max(0, hw - consumer.position(tp)))
+
+def consume(consumer: KafkaConsumer):
+    """Poll/apply/commit until stopped.
+
+    Malformed events are dead-lettered on sight and the rest of the batch applied. A failing
+    batch is rewound and retried with exponential backoff; after CONSUMER_MAX_ATTEMPTS in a
+    row it is applied record by record and the records that still fail are dead-lettered, so
+    the partition always moves on.
+    """
+    failures = 0
+    while not _stop.is_set():
+        batch = consumer.poll(timeout_ms=settings.CONSUMER_POLL_MS)
+        if not batch:
+            _record_lag(consumer)
+            continue
+        records = [rec for recs in batch.values() for rec in recs]
+        BATCH_SIZE.observe(len(records))
+        good, bad = validate(records)
+        try:
+            try:
+                # Fresh session per batch: nothing accumulates in an identity map between polls
+                with SessionLocal() as db:
+                    process_batch((rec.value for rec in good), db)
+            except Exception as exc:
+                failures += 1
+                BATCH_FAILURES.inc()
+                if failures < settings.CONSUMER_MAX_ATTEMPTS:
+                    raise
+                log.error("payment batch failed %d times (%r); applying %d records one by one", failures, exc, len(good))
+                _isolate(good)
+            for rec, exc in bad:
+                dead_letter(rec, exc, "invalid")
+            consumer.commit()
+            failures = 0
+        except Exception:
+            # Nothing was committed: rewind to the batch start and retry after a pause
+            log.exception("payment batch failed; retrying %d records", len(records))
+            for tp, recs in batch.items():
+                consumer.seek(tp, recs[0].offset)
+            _stop.wait(_backoff(max(failures, 1)))
+        _record_lag(consumer)
 
 def _run():
     consumer = KafkaConsumer(
@@ -33,18 +124,13 @@ def _run():
         bootstrap_servers=[settings.KAFKA_BOOTSTRAP],
         group_id="shipping-service",
         value_deserializer=lambda v: json.loads(v.decode("utf-8")),
-        enable_auto_commit=True,
+        enable_auto_commit=False,
         auto_offset_reset="earliest",
+        max_poll_records=settings.CONSUMER_MAX_RECORDS,
     )
-    db = SessionLocal()
     try:
-        for msg in consumer:
-            if _stop.is_set():
-                break
-            ev = msg.value
-            _handle_payment_event(ev, db)
+        consume(consumer)
     finally:
-        db.close()
         consumer.close()
 
 def start():
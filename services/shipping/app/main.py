@@ -2,6 +2,8 @@ from fastapi import FastAPI
 from app.version import VERSION
 from app.api.routes import router as shipping_router
 from app.kafka import consumer as shipping_consumer
+from app.kafka import producer as shipping_producer
+from app.services import labels, rates
 from prometheus_fastapi_instrumentator import Instrumentator
 
 # Create instrumentator first
@@ -34,10 +36,17 @@ app.include_router(shipping_router)
 @app.on_event("startup")
 async def startup_event():
     shipping_consumer.start()
+    try:
+        rates.current()  # load now so the first quote doesn't pay for it
+    except rates.RateTableError:
+        pass  # logged; quotes answer 503 until a valid table appears
 
 @app.on_event("shutdown")
 async def shutdown_event():
     shipping_consumer.stop()
+    labels.stop()
+    # The only flush: deliver whatever is still batched before the process exits
+    shipping_producer.close()
 
 @app.on_event("startup")
 async def startup_event():
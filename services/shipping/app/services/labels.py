@@ -0,0 +1,259 @@
+import logging, multiprocessing, queue, threading, time, uuid, zlib
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from typing import List, Optional
+from prometheus_client import Counter, Gauge, Histogram
+from app.core.config import settings
+from app.services import storage
+
+log = logging.getLogger(__name__)
+
+# Shipping labels, rendered off the request path:
+#   dispatch wave -> enqueue() -> bounded wave queue -> one wave thread -> process pool (render_label)
+#   -> object storage: labels/{shipment_id}.pdf|.zpl, waves/{wave_id}.pdf|.zpl (whole wave, printer order)
+# Workers return each label as a standalone PDF, its ZPL, and its compressed PDF page, so the wave PDF
+# is assembled from the pages without rendering anything twice. Wave progress is kept in memory for the
+# last LABEL_RECENT_WAVES waves; the stored objects are the durable result.
+
+LABELS = Counter("shipping_labels_rendered_total", "Labels rendered and stored")
+WAVES = Counter("shipping_label_waves_total", "Label waves by outcome", ["outcome"])
+WAVE_SECONDS = Histogram("shipping_label_wave_seconds", "Time to render and store a whole wave",
+                         buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120))
+QUEUE_DEPTH = Gauge("shipping_label_queue_depth", "Waves waiting for the renderer")
+PENDING = Gauge("shipping_labels_pending", "Labels queued or being rendered")
+
+PAGE_W, PAGE_H = 288, 432  # 4x6 in, in points
+ZPL_TYPE = "application/x-zpl"
+
+_LABEL_FIELDS = ("id", "order_id", "user_email", "address_line1", "address_line2", "city", "country",
+                 "postcode", "carrier", "tracking_number")
+
+def label_key(shipment_id: int, fmt: str) -> str:
+    return f"labels/{shipment_id}.{fmt}"
+
+def wave_key(wave_id: str, fmt: str) -> str:
+    return f"waves/{wave_id}.{fmt}"
+
+# --- rendering (runs in the worker processes; pure functions of the label dict) ---
+
+# Code 39, one module per digit, wide elements as two; every symbol is followed by a narrow gap
+_CODE39 = {
+    "0": "101001101101", "1": "110100101011", "2": "101100101011", "3": "110110010101",
+    "4": "101001101011", "5": "110100110101", "6": "101100110101", "7": "101001011011",
+    "8": "110100101101", "9": "101100101101", "A": "110101001011", "B": "101101001011",
+    "C": "110110100101", "D": "101011001011", "E": "110101100101", "F": "101101100101",
+    "G": "101010011011", "H": "110101001101", "I": "101101001101", "J": "101011001101",
+    "K": "110101010011", "L": "101101010011", "M": "110110101001", "N": "101011010011",
+    "O": "110101101001", "P": "101101101001", "Q": "101010110011", "R": "110101011001",
+    "S": "101101011001", "T": "101011011001", "U": "110010101011", "V": "100110101011",
+    "W": "110011010101", "X": "100101101011", "Y": "110010110101", "Z": "100110110101",
+    "-": "100101011011", ".": "110010101101", " ": "100110101101", "*": "100101101101",
+}
+
+def code39_modules(text: str) -> str:
+    symbols = "*" + "".join(c for c in text.upper() if c in _CODE39 and c != "*") + "*"
+    return "0".join(_CODE39[c] for c in symbols)
+
+def _pdf_str(s: str) -> bytes:
+    raw = s.encode("cp1252", "replace")
+    return raw.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)")
+
+def _text(ops: list, x: float, y: float, size: int, s: str, bold: bool = False):
+    ops.append(b"BT /F%d %d Tf %.1f %.1f Td (" % (2 if bold else 1, size, x, y) + _pdf_str(s) + b") Tj ET")
+
+def _address(label: dict) -> List[str]:
+    lines = [label["address_line1"], label.get("address_line2") or "",
+             f"{label['city']} {label['postcode']}", label["country"]]
+    return [ln for ln in lines if ln]
+
+def label_page(label: dict) -> bytes:
+    """The label's PDF page content stream (uncompressed)."""
+    ops: List[bytes] = []
+    _text(ops, 18, 412, 8, f"FROM: {settings.LABEL_RETURN_ADDRESS}")
+    ops.append(b"1 w 18 402 m 270 402 l S")
+    _text(ops, 18, 384, 9, "SHIP TO", bold=True)
+    _text(ops, 18, 366, 10, label["user_email"])
+    y = 346
+    for line in _address(label):
+        _text(ops, 18, y, 14, line, bold=True)
+        y -= 18
+    ops.append(b"18 262 m 270 262 l S")
+    _text(ops, 18, 240, 16, label["carrier"], bold=True)
+    _text(ops, 18, 222, 10, f"ORDER {label['order_id']}    SHIPMENT {label['id']}")
+
+    modules = code39_modules(label["tracking_number"])
+    w = min(1.5, 252 / len(modules))
+    x0 = (PAGE_W - w * len(modules)) / 2
+    i = 0
+    while i < len(modules):
+        if modules[i] == "1":
+            j = i
+            while j < len(modules) and modules[j] == "1":
+                j += 1
+            ops.append(b"%.2f 96 %.2f 100 re" % (x0 + i * w, (j - i) * w))
+            i = j
+        else:
+            i += 1
+    ops.append(b"f")
+    _text(ops, x0, 80, 12, label["tracking_number"])
+    return b"\n".join(ops)
+
+def build_pdf(pages: List[bytes]) -> bytes:
+    """A PDF with one 4x6 page per (Flate-compressed) content stream."""
+    n = len(pages)
+    kids = " ".join(f"{5 + 2 * i} 0 R" for i in range(n))
+    objs = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{kids}] /Count {n} >>".encode(),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>",
+    ]
+    for i, content in enumerate(pages):
+        objs.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PAGE_W} {PAGE_H}] "
+                    f"/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> /Contents {6 + 2 * i} 0 R >>".encode())
+        objs.append(b"<< /Length %d /Filter /FlateDecode >>\nstream\n" % len(content) + content + b"\nendstream")
+    out = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = []
+    for num, body in enumerate(objs, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % num + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objs) + 1)
+    out += b"".join(b"%010d 00000 n \n" % off for off in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objs) + 1, xref)
+    return bytes(out)
+
+def _zpl_field(s: str) -> str:
+    return s.replace("^", " ").replace("~", " ")
+
+def render_zpl(label: dict) -> bytes:
+    """ZPL II for a 4x6 label at 203 dpi; the printer draws the Code 128 barcode itself."""
+    f = _zpl_field
+    lines = ["^XA", "^CI28", "^PW812", "^LL1218",
+             f"^FO40,30^A0N,24,24^FDFROM: {f(settings.LABEL_RETURN_ADDRESS)}^FS",
+             "^FO40,70^GB732,2,2^FS",
+             "^FO40,100^A0N,28,28^FDSHIP TO^FS",
+             f"^FO40,140^A0N,30,30^FD{f(label['user_email'])}^FS"]
+    y = 190
+    for line in _address(label):
+        lines.append(f"^FO40,{y}^A0N,44,44^FD{f(line)}^FS")
+        y += 54
+    lines += ["^FO40,500^GB732,2,2^FS",
+              f"^FO40,540^A0N,50,50^FD{f(label['carrier'])}^FS",
+              f"^FO40,610^A0N,30,30^FDORDER {label['order_id']}    SHIPMENT {label['id']}^FS",
+              f"^FO80,700^BY3^BCN,260,Y,N,N^FD{f(label['tracking_number'])}^FS",
+              "^XZ"]
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+def render_label(label: dict) -> dict:
+    """Worker entry point: standalone PDF, ZPL, and the compressed page for the wave PDF."""
+    page = zlib.compress(label_page(label), 6)
+    return {"id": label["id"], "pdf": build_pdf([page]), "zpl": render_zpl(label), "page": page}
+
+# --- wave queue (API process) ---
+
+_stop = threading.Event()
+_thread: Optional[threading.Thread] = None
+_lock = threading.Lock()
+_queue: "queue.Queue" = queue.Queue(maxsize=settings.LABEL_QUEUE_SIZE)
+_recent: "OrderedDict[str, dict]" = OrderedDict()
+_pool: Optional[ProcessPoolExecutor] = None
+_uploads: Optional[ThreadPoolExecutor] = None
+
+def _get_pools():
+    global _pool, _uploads
+    with _lock:
+        if _pool is None:
+            # spawn, not fork: the API process has Kafka and DB threads a forked child must not inherit
+            _pool = ProcessPoolExecutor(max_workers=settings.LABEL_WORKERS,
+                                        mp_context=multiprocessing.get_context("spawn"))
+            _uploads = ThreadPoolExecutor(max_workers=settings.LABEL_UPLOAD_THREADS, thread_name_prefix="label-upload")
+    return _pool, _uploads
+
+def label_fields(row) -> dict:
+    return {f: row[f] if isinstance(row, dict) else getattr(row, f) for f in _LABEL_FIELDS}
+
+def enqueue(rows: List) -> Optional[dict]:
+    """Queue labels for dispatched shipments as one wave. Returns the wave's status, or None if the
+    queue is full (the shipments stay dispatched; labels can be requested again later)."""
+    wave = {"wave_id": uuid.uuid4().hex, "status": "queued", "labels": len(rows), "rendered": 0,
+            "pdf_key": None, "zpl_key": None, "error": None, "queued_at": datetime.utcnow().isoformat()}
+    try:
+        _queue.put_nowait((wave, [label_fields(r) for r in rows]))
+    except queue.Full:
+        WAVES.labels("rejected").inc()
+        log.warning("label queue full; %d labels not queued", len(rows))
+        return None
+    with _lock:
+        _recent[wave["wave_id"]] = wave
+        while len(_recent) > settings.LABEL_RECENT_WAVES:
+            _recent.popitem(last=False)
+    QUEUE_DEPTH.set(_queue.qsize())
+    PENDING.inc(len(rows))
+    start()
+    return dict(wave)
+
+def wave_status(wave_id: str) -> Optional[dict]:
+    with _lock:
+        wave = _recent.get(wave_id)
+        return dict(wave) if wave else None
+
+def render_wave(wave: dict, labels: List[dict]) -> dict:
+    """Render every label in the pool, store each one and the combined wave PDF/ZPL."""
+    started = time.perf_counter()
+    pool, uploads = _get_pools()
+    wave["status"] = "rendering"
+    pages, zpls, puts = [], [], []
+    chunk = max(1, len(labels) // (settings.LABEL_WORKERS * 4))
+    try:
+        for out in pool.map(render_label, labels, chunksize=chunk):
+            puts.append(uploads.submit(storage.put_bytes, label_key(out["id"], "pdf"), out["pdf"], "application/pdf"))
+            puts.append(uploads.submit(storage.put_bytes, label_key(out["id"], "zpl"), out["zpl"], ZPL_TYPE))
+            pages.append(out["page"])
+            zpls.append(out["zpl"])
+            wave["rendered"] += 1
+            LABELS.inc()
+            PENDING.dec()
+        storage.put_bytes(wave_key(wave["wave_id"], "pdf"), build_pdf(pages), "application/pdf")
+        storage.put_bytes(wave_key(wave["wave_id"], "zpl"), b"".join(zpls), ZPL_TYPE)
+        for fut in puts:
+            fut.result()  # surfaces the first failed upload
+        wave.update(status="done", pdf_key=wave_key(wave["wave_id"], "pdf"), zpl_key=wave_key(wave["wave_id"], "zpl"))
+        WAVES.labels("done").inc()
+    except Exception as exc:
+        log.exception("label wave %s failed after %d of %d labels", wave["wave_id"], wave["rendered"], len(labels))
+        wave.update(status="failed", error=str(exc))
+        WAVES.labels("failed").inc()
+        PENDING.dec(len(labels) - wave["rendered"])
+    WAVE_SECONDS.observe(time.perf_counter() - started)
+    return wave
+
+def _run():
+    while not _stop.is_set():
+        try:
+            wave, labels = _queue.get(timeout=1)
+        except queue.Empty:
+            continue
+        QUEUE_DEPTH.set(_queue.qsize())
+        render_wave(wave, labels)
+
+def start():
+    global _thread
+    with _lock:
+        if _thread and _thread.is_alive():
+            return
+        _stop.clear()
+        _thread = threading.Thread(target=_run, daemon=True, name="label-waves")
+        _thread.start()
+
+def stop():
+    global _pool, _uploads
+    _stop.set()
+    if _thread:
+        _thread.join(timeout=settings.LABEL_SHUTDOWN_SECONDS)
+    with _lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _uploads.shutdown(wait=True)
+            _pool, _uploads = None, None
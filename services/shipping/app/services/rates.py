@@ -0,0 +1,162 @@
+import bisect, json, logging, os, threading, time
+from array import array
+from typing import Dict, List, Optional, Tuple
+from prometheus_client import Counter
+from app.core.config import settings
+
+log = logging.getLogger(__name__)
+
+# Carrier rate tables, loaded from RATE_TABLES_PATH (JSON; see app/data/rates.json) into flat arrays:
+#   bands            array('I') of weight-band upper bounds in grams, ascending
+#   prices[carrier]  array('I') of zones x bands, in cents; 0 = no service for that zone/band
+# A destination resolves to a zone via the longest "CC:<postcode prefix>" key, then "CC", then "*",
+# so a quote is a few dict lookups and a bisect with no I/O. The file is re-read when its mtime
+# changes (checked at most every RATE_TABLES_CHECK_SECONDS); a table that fails to load is logged
+# and the previous one keeps serving.
+
+RELOADS = Counter("shipping_rate_table_loads_total", "Rate table (re)loads", ["outcome"])
+
+class RateTableError(ValueError):
+    pass
+
+class RateTable:
+    __slots__ = ("version", "currency", "bands", "zones", "carriers", "_prices", "_days", "_top", "_zone_of",
+                 "_prefix_lens")
+
+    def __init__(self, spec: dict):
+        try:
+            self.version = str(spec["version"])
+            self.currency = spec.get("currency", "USD")
+            self.bands = array("I", spec["weight_bands_g"])
+            if not self.bands or any(a >= b for a, b in zip(self.bands, self.bands[1:])):
+                raise RateTableError("weight_bands_g must be non-empty and strictly ascending")
+            zone_map: Dict[str, str] = spec["zone_map"]
+            self.zones: Tuple[str, ...] = tuple(dict.fromkeys(zone_map.values()))
+            index = {z: i for i, z in enumerate(self.zones)}
+            self._zone_of: Dict[str, int] = {}
+            prefix_lens: Dict[str, set] = {}
+            for key, zone in zone_map.items():
+                cc, _, prefix = key.upper().partition(":")
+                prefix = prefix.replace(" ", "")
+                self._zone_of[f"{cc}:{prefix}" if prefix else cc] = index[zone]
+                if prefix:
+                    prefix_lens.setdefault(cc, set()).add(len(prefix))
+            self._prefix_lens = {cc: tuple(sorted(ns, reverse=True)) for cc, ns in prefix_lens.items()}
+
+            self.carriers: Tuple[str, ...] = tuple(spec["carriers"])
+            self._prices: Dict[str, array] = {}
+            self._days: Dict[str, Tuple[Optional[Tuple[int, int]], ...]] = {}
+            self._top: Dict[str, Tuple[int, ...]] = {}  # heaviest band served per zone, -1 = none
+            for name, by_zone in spec["carriers"].items():
+                unknown = set(by_zone) - set(index)
+                if unknown:
+                    raise RateTableError(f"{name}: zones {sorted(unknown)} are not in zone_map")
+                prices = array("I", bytes(4 * len(self.zones) * len(self.bands)))
+                days: List[Optional[Tuple[int, int]]] = [None] * len(self.zones)
+                for zone, row in by_zone.items():
+                    if len(row["cents"]) != len(self.bands):
+                        raise RateTableError(f"{name}/{zone}: expected {len(self.bands)} prices")
+                    start = index[zone] * len(self.bands)
+                    prices[start:start + len(self.bands)] = array("I", row["cents"])
+                    days[index[zone]] = tuple(row["transit_days"]) if row.get("transit_days") else None
+                self._prices[name] = prices
+                self._days[name] = tuple(days)
+                nb = len(self.bands)
+                self._top[name] = tuple(
+                    max((b for b in range(nb) if prices[z * nb + b]), default=-1) for z in range(len(self.zones))
+                )
+        except (KeyError, TypeError, OverflowError) as exc:
+            raise RateTableError(f"malformed rate table: {exc!r}") from exc
+
+    def zone(self, country: str, postcode: str = "") -> Optional[int]:
+        cc = country.upper()
+        pc = postcode.replace(" ", "").upper()
+        for n in self._prefix_lens.get(cc, ()):
+            if len(pc) >= n:
+                z = self._zone_of.get(f"{cc}:{pc[:n]}")
+                if z is not None:
+                    return z
+        z = self._zone_of.get(cc)
+        return self._zone_of.get("*") if z is None else z
+
+    def parcels(self, weight_g: int, top: int = -1) -> List[int]:
+        """Band index of each parcel; weight over band `top` is split into parcels of that band."""
+        top %= len(self.bands)
+        full, rest = divmod(max(0, weight_g), self.bands[top])
+        out = [top] * full
+        if rest or not out:
+            out.append(bisect.bisect_left(self.bands, rest))
+        return out
+
+    def quote(self, country: str, postcode: str, weight_g: int, carrier: Optional[str] = None) -> List[dict]:
+        """Every carrier option for one destination and total weight, cheapest first."""
+        z = self.zone(country, postcode)
+        if z is None:
+            return []
+        row = z * len(self.bands)
+        out = []
+        for name in ((carrier,) if carrier else self.carriers):
+            prices = self._prices.get(name)
+            if prices is None or self._top[name][z] < 0:
+                continue
+            parcels = self.parcels(weight_g, self._top[name][z])
+            total = 0
+            for band in parcels:
+                cents = prices[row + band]
+                if not cents:
+                    break  # a gap below the zone's heaviest band: no service at this weight
+                total += cents
+            else:
+                days = self._days[name][z]
+                out.append({"carrier": name, "amount_cents": total, "parcels": len(parcels),
+                            "transit_days": list(days) if days else None})
+        out.sort(key=lambda o: o["amount_cents"])
+        return out
+
+def load(path: str) -> RateTable:
+    with open(path, "rb") as f:
+        return RateTable(json.load(f))
+
+_lock = threading.Lock()
+_table: Optional[RateTable] = None
+_mtime_ns = 0
+_checked = float("-inf")
+
+def current() -> RateTable:
+    """The live table, reloaded first if the file changed. Raises RateTableError if none ever loaded."""
+    if time.monotonic() - _checked >= settings.RATE_TABLES_CHECK_SECONDS:
+        with _lock:
+            if time.monotonic() - _checked >= settings.RATE_TABLES_CHECK_SECONDS:
+                _refresh()
+    table = _table
+    if table is None:
+        raise RateTableError(f"no rate table loaded from {settings.RATE_TABLES_PATH}")
+    return table
+
+def reload() -> RateTable:
+    """Re-check the file now instead of waiting for the next interval."""
+    global _checked
+    with _lock:
+        _checked = float("-inf")
+    return current()
+
+def _refresh():
+    global _table, _mtime_ns, _checked
+    _checked = time.monotonic()
+    path = settings.RATE_TABLES_PATH
+    try:
+        mtime_ns = os.stat(path).st_mtime_ns
+        if _table is not None and mtime_ns == _mtime_ns:
+            return
+        _mtime_ns = mtime_ns  # a bad file is reported once, not on every check
+        table = load(path)
+    except (OSError, ValueError) as exc:
+        RELOADS.labels("failed").inc()
+        log.error("rate table %s not loaded: %s (%s)", path, exc,
+                  "keeping version " + _table.version if _table else "quotes unavailable")
+        return
+    # Readers take the reference once per request, so swapping it is the whole reload
+    _table = table
+    RELOADS.labels("loaded").inc()
+    log.info("rate table %s loaded: version %s, %d zones, %d carriers",
+             path, table.version, len(table.zones), len(table.carriers))
@@ -0,0 +1,43 @@
+import io
+from typing import Optional
+from minio import Minio
+from minio.error import S3Error
+from app.core.config import settings
+
+_client_instance: Optional[Minio] = None
+_bucket_ready = False
+
+def _client() -> Minio:
+    # One client per process; it pools its HTTP connections and is safe to share between threads
+    global _client_instance
+    if _client_instance is None:
+        _client_instance = Minio(settings.S3_ENDPOINT.replace('http://', '').replace('https://', ''),
+                                 access_key=settings.S3_ACCESS_KEY, secret_key=settings.S3_SECRET_KEY,
+                                 secure=settings.S3_SECURE)
+    return _client_instance
+
+def ensure_bucket():
+    global _bucket_ready
+    if _bucket_ready:
+        return
+    c = _client()
+    if not c.bucket_exists(settings.LABEL_BUCKET):
+        c.make_bucket(settings.LABEL_BUCKET)
+    _bucket_ready = True
+
+def put_bytes(key: str, data: bytes, content_type: str):
+    ensure_bucket()
+    _client().put_object(settings.LABEL_BUCKET, key, io.BytesIO(data), length=len(data), content_type=content_type)
+
+def get_bytes(key: str) -> Optional[bytes]:
+    try:
+        resp = _client().get_object(settings.LABEL_BUCKET, key)
+    except S3Error as exc:
+        if exc.code in ("NoSuchKey", "NoSuchBucket"):
+            return None
+        raise
+    try:
+        return resp.read()
+    finally:
+        resp.close()
+        resp.release_conn()
@@ -0,0 +1,67 @@
+import secrets
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+from sqlalchemy import case, select, update
+from sqlalchemy.orm import Session
+from app.db.models import Shipment, ShipmentStatus
+
+# Which states each target may be reached from; every move below is a single
+# UPDATE ... WHERE status IN (<sources>) RETURNING, so racing callers can't double-apply it
+ALLOWED_FROM = {
+    ShipmentStatus.READY_TO_SHIP: (ShipmentStatus.PENDING_PAYMENT,),
+    ShipmentStatus.DISPATCHED: (ShipmentStatus.READY_TO_SHIP,),
+    ShipmentStatus.DELIVERED: (ShipmentStatus.DISPATCHED,),
+    ShipmentStatus.CANCELLED: (ShipmentStatus.PENDING_PAYMENT, ShipmentStatus.READY_TO_SHIP),
+}
+
+EVENT_TYPES = {
+    ShipmentStatus.READY_TO_SHIP: "shipping.ready",
+    ShipmentStatus.DISPATCHED: "shipping.dispatched",
+    ShipmentStatus.DELIVERED: "shipping.delivered",
+    ShipmentStatus.CANCELLED: "shipping.cancelled",
+}
+
+# Address columns ride along for the dispatch wave's labels
+_RETURNING = (Shipment.id, Shipment.order_id, Shipment.user_email, Shipment.carrier, Shipment.tracking_number,
+              Shipment.address_line1, Shipment.address_line2, Shipment.city, Shipment.country, Shipment.postcode)
+
+def new_tracking_number() -> str:
+    return secrets.token_hex(6).upper()
+
+def transition(
+    db: Session,
+    to: ShipmentStatus,
+    ids: Optional[Iterable[int]] = None,
+    order_ids: Optional[Iterable[int]] = None,
+    carrier: str = "DemoCarrier",
+) -> List[dict]:
+    """Move every matching shipment that is in an allowed source state to `to`, in one
+    statement. Returns the rows that moved; the caller commits."""
+    values = {"status": to, "updated_at": datetime.utcnow()}
+    stmt = update(Shipment).where(Shipment.status.in_(ALLOWED_FROM[to]))
+    if ids is not None:
+        ids = list(ids)
+        stmt = stmt.where(Shipment.id.in_(ids))
+    if order_ids is not None:
+        stmt = stmt.where(Shipment.order_id.in_(list(order_ids)))
+    if to == ShipmentStatus.DISPATCHED:
+        # Tracking numbers for the whole wave, bound into the same UPDATE
+        values["carrier"] = carrier
+        values["tracking_number"] = case({i: new_tracking_number() for i in ids}, value=Shipment.id)
+    stmt = stmt.values(**values).returning(*_RETURNING).execution_options(synchronize_session=False)
+    return [dict(row._mapping) for row in db.execute(stmt)]
+
+def current_statuses(db: Session, ids: Iterable[int]) -> Dict[int, ShipmentStatus]:
+    return dict(db.execute(select(Shipment.id, Shipment.status).where(Shipment.id.in_(list(ids)))).all())
+
+def event_for(row: dict, to: ShipmentStatus) -> dict:
+    ev = {
+        "type": EVENT_TYPES[to],
+        "order_id": row["order_id"],
+        "user_email": row["user_email"],
+        "shipment_id": row["id"],
+    }
+    if to == ShipmentStatus.DISPATCHED:
+        ev["carrier"] = row["carrier"]
+        ev["tracking_number"] = row["tracking_number"]
+    return ev
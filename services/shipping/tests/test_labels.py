@@ -0,0 +1,67 @@
+import re, time, zlib
+import pytest
+from fastapi.testclient import TestClient
+from app.core.config import settings
+from app.main import app
+from app.services import labels, storage
+
+def make_label(i: int) -> dict:
+    return {"id": i, "order_id": 5000 + i, "user_email": f"u{i}@example.com", "address_line1": f"{i} Main (Rear) St",
+            "address_line2": "", "city": "Dublin", "country": "IE", "postcode": "D01 X2Y3",
+            "carrier": "DemoCarrier", "tracking_number": f"{i:012X}"}
+
+@pytest.fixture
+def objects(monkeypatch):
+    store = {}
+    monkeypatch.setattr(storage, "put_bytes", lambda key, data, content_type: store.__setitem__(key, data))
+    monkeypatch.setattr(storage, "get_bytes", store.get)
+    monkeypatch.setattr(settings, "LABEL_WORKERS", 2)
+    yield store
+    labels.stop()
+
+def test_code39_symbols_are_well_formed():
+    for ch, pattern in labels._CODE39.items():
+        runs = [len(r) for r in pattern.replace("10", "1 0").replace("01", "0 1").split()]
+        assert len(pattern) == 12 and len(runs) == 9 and runs.count(2) == 3, ch
+    assert labels.code39_modules("A1").startswith(labels._CODE39["*"] + "0" + labels._CODE39["A"])
+
+def test_single_label_formats():
+    out = labels.render_label(make_label(7))
+    assert out["pdf"].startswith(b"%PDF-1.4") and out["pdf"].rstrip().endswith(b"%%EOF")
+    assert b"/Count 1" in out["pdf"]
+    zpl = out["zpl"].decode()
+    assert zpl.startswith("^XA") and zpl.rstrip().endswith("^XZ")
+    assert "^FD000000000007^FS" in zpl and "D01 X2Y3" in zpl
+
+def test_wave_of_1000_labels_renders_in_the_pool(objects):
+    rows = [make_label(i) for i in range(1000, 0, -1)]  # request order, not id order
+    wave = labels.enqueue(rows)
+    deadline = time.monotonic() + 120
+    while labels.wave_status(wave["wave_id"])["status"] in ("queued", "rendering") and time.monotonic() < deadline:
+        time.sleep(0.05)
+    done = labels.wave_status(wave["wave_id"])
+    assert done["status"] == "done", done
+    assert done["rendered"] == 1000
+
+    assert all(labels.label_key(i, fmt) in objects for i in range(1, 1001) for fmt in ("pdf", "zpl"))
+    wave_pdf = objects[done["pdf_key"]]
+    assert b"/Count 1000" in wave_pdf
+    assert objects[done["zpl_key"]].count(b"^XA") == 1000
+    # pages come out in request order even though the pool renders them out of order
+    expected = [r["tracking_number"].encode() for r in rows]
+    pages = [zlib.decompress(s) for s in re.findall(rb"stream\n(.*?)\nendstream", wave_pdf, re.S)]
+    assert [re.findall(rb"\(([0-9A-F]{12})\) Tj", p)[-1] for p in pages] == expected
+    assert re.findall(rb"\^FD([0-9A-F]{12})\^FS", objects[done["zpl_key"]]) == expected
+
+    client = TestClient(app)
+    r = client.get(f"/shipping/v1/labels/waves/{wave['wave_id']}/pdf")
+    assert r.status_code == 200 and r.headers["content-type"] == "application/pdf" and r.content == wave_pdf
+    assert client.get("/shipping/v1/shipments/42/label", params={"format": "zpl"}).content == \
+        objects[labels.label_key(42, "zpl")]
+    assert client.get("/shipping/v1/shipments/4242/label").status_code == 404
+
+def test_full_queue_rejects_the_wave(objects, monkeypatch):
+    monkeypatch.setattr(labels, "_queue", labels.queue.Queue(maxsize=1))
+    monkeypatch.setattr(labels, "start", lambda: None)  # nothing drains the queue
+    assert labels.enqueue([make_label(1)]) is not None
+    assert labels.enqueue([make_label(2)]) is None
@@ -0,0 +1,85 @@
+import json, os
+import pytest
+from fastapi.testclient import TestClient
+from app.core.config import settings
+from app.main import app
+from app.services import rates
+
+SPEC = {
+    "version": "v1",
+    "currency": "USD",
+    "weight_bands_g": [500, 1000, 5000],
+    "zone_map": {"US": "domestic", "US:99": "remote", "US:995": "alaska", "*": "world"},
+    "carriers": {
+        "Slow": {"domestic": {"transit_days": [3, 5], "cents": [400, 600, 900]},
+                 "remote": {"cents": [800, 1000, 1500]},
+                 "alaska": {"cents": [1200, 1400, 0]},
+                 "world": {"cents": [1500, 2000, 3000]}},
+        "Fast": {"domestic": {"transit_days": [1, 1], "cents": [900, 1100, 1600]}},
+    },
+}
+
+@pytest.fixture
+def table_file(tmp_path, monkeypatch):
+    path = tmp_path / "rates.json"
+    path.write_text(json.dumps(SPEC))
+    monkeypatch.setattr(settings, "RATE_TABLES_PATH", str(path))
+    monkeypatch.setattr(settings, "RATE_TABLES_CHECK_SECONDS", 0)
+    monkeypatch.setattr(rates, "_table", None)
+    return path
+
+def test_zone_uses_longest_postcode_prefix():
+    t = rates.RateTable(SPEC)
+    assert t.zones[t.zone("us", "10001")] == "domestic"
+    assert t.zones[t.zone("US", "99001")] == "remote"
+    assert t.zones[t.zone("US", "99501")] == "alaska"
+    assert t.zones[t.zone("FR", "75001")] == "world"
+
+def test_quote_bands_and_parcel_split():
+    t = rates.RateTable(SPEC)
+    assert t.quote("US", "10001", 500) == [
+        {"carrier": "Slow", "amount_cents": 400, "parcels": 1, "transit_days": [3, 5]},
+        {"carrier": "Fast", "amount_cents": 900, "parcels": 1, "transit_days": [1, 1]},
+    ]
+    assert [o["amount_cents"] for o in t.quote("US", "10001", 501)] == [600, 1100]
+    # 11kg domestic: two 5kg parcels plus a 1kg one
+    assert t.quote("US", "10001", 11000, carrier="Slow")[0] == \
+        {"carrier": "Slow", "amount_cents": 900 + 900 + 600, "parcels": 3, "transit_days": [3, 5]}
+    # Alaska tops out at 1kg, so 2.5kg ships as three parcels
+    assert t.quote("US", "99501", 2500)[0]["parcels"] == 3
+    assert t.quote("FR", "", 100, carrier="Fast") == []
+
+def test_malformed_table_is_rejected():
+    with pytest.raises(rates.RateTableError):
+        rates.RateTable(dict(SPEC, weight_bands_g=[1000, 500]))
+    with pytest.raises(rates.RateTableError):
+        rates.RateTable(dict(SPEC, carriers={"X": {"mars": {"cents": [1, 2, 3]}}}))
+
+def test_hot_reload_keeps_last_good_table(table_file):
+    assert rates.current().version == "v1"
+    table_file.write_text(json.dumps(dict(SPEC, version="v2")))
+    os.utime(table_file, ns=(1, 1))  # a new mtime, whatever the filesystem's clock resolution
+    assert rates.current().version == "v2"
+
+    table_file.write_text("{not json")
+    os.utime(table_file, ns=(2, 2))
+    assert rates.current().version == "v2"
+
+def test_batch_quote_endpoint(table_file):
+    client = TestClient(app)
+    r = client.post("/shipping/v1/rates/quote", json={"quotes": [
+        {"ref": "a", "country": "US", "postcode": "10001",
+         "items": [{"sku": "mug", "weight_g": 300, "quantity": 2}, {"weight_g": 200}]},
+        {"ref": "b", "country": "US", "postcode": "99501", "items": [{"weight_g": 100}], "carrier": "Fast"},
+    ]})
+    assert r.status_code == 200, r.text
+    body = r.json()
+    assert body["table_version"] == "v1"
+    a, b = body["results"]
+    assert a["weight_g"] == 800 and [o["carrier"] for o in a["options"]] == ["Slow", "Fast"]
+    assert b["options"] == []
+
+    table_file.write_text("[]")
+    os.utime(table_file, ns=(3, 3))
+    rates._table = None
+    assert client.get("/shipping/v1/rates").status_code == 503
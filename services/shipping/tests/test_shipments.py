@@ -0,0 +1,192 @@
+import pytest
+from datetime import datetime, timedelta
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.api import routes
+from app.db.models import Shipment, ShipmentStatus
+from app.db.session import Base
+from app.kafka import consumer
+from app.main import app
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine, autoflush=False)
+
+    def get_db():
+        s = Session()
+        try:
+            yield s
+        finally:
+            s.close()
+
+    app.dependency_overrides[routes.get_db] = get_db
+    yield Session()
+    app.dependency_overrides.clear()
+
+def add_shipments(db, n, status=ShipmentStatus.READY_TO_SHIP, country="IE", start=datetime(2026, 1, 1)):
+    db.add_all([Shipment(
+        order_id=1000 + i, user_email=f"u{i}@example.com", address_line1="1 Road", city="Dublin",
+        country=country, postcode="D01", status=status, created_at=start + timedelta(minutes=i),
+    ) for i in range(n)])
+    db.commit()
+
+def test_list_pages_with_filters_and_projection(db):
+    add_shipments(db, 5)
+    add_shipments(db, 3, status=ShipmentStatus.PENDING_PAYMENT)
+    add_shipments(db, 2, country="US")
+    client = TestClient(app)
+
+    seen, cursor = [], None
+    while True:
+        params = {"status": "READY_TO_SHIP", "country": "ie", "order": "asc", "limit": 2, "fields": "id,order_id"}
+        if cursor:
+            params["cursor"] = cursor
+        body = client.get("/shipping/v1/shipments", params=params).json()
+        seen += body["items"]
+        cursor = body["next_cursor"]
+        if not cursor:
+            break
+    assert [s["order_id"] for s in seen] == [1000, 1001, 1002, 1003, 1004]
+    assert set(seen[0]) == {"id", "order_id"}
+
+def test_list_created_range_and_validation(db):
+    add_shipments(db, 10)
+    client = TestClient(app)
+    body = client.get("/shipping/v1/shipments", params={
+        "created_from": "2026-01-01T00:03:00", "created_to": "2026-01-01T00:06:00",
+    }).json()
+    assert [s["order_id"] for s in body["items"]] == [1005, 1004, 1003]
+    assert body["items"][0]["status"] == "READY_TO_SHIP" and body["next_cursor"] is None
+
+    assert client.get("/shipping/v1/shipments", params={"fields": "id,password"}).status_code == 400
+    assert client.get("/shipping/v1/shipments", params={"cursor": "nope"}).status_code == 400
+
+def test_bulk_dispatch_reports_per_id(db, monkeypatch):
+    sent, waves = [], []
+    monkeypatch.setattr(routes, "emit_many", lambda events: sent.append(events))
+    monkeypatch.setattr(routes.labels, "enqueue", lambda rows: waves.append(rows) or {"wave_id": "w1", "status": "queued"})
+    add_shipments(db, 3)
+    add_shipments(db, 1, status=ShipmentStatus.PENDING_PAYMENT)
+    client = TestClient(app)
+
+    body = client.post("/shipping/v1/shipments/dispatch", json={"shipment_ids": [3, 1, 4, 2, 1, 99]}).json()
+    assert body["updated"] == 3
+    assert [(r["id"], r["result"]) for r in body["results"]] == [
+        (3, "ok"), (1, "ok"), (4, "conflict"), (2, "ok"), (99, "not_found"),
+    ]
+    assert body["results"][2]["status"] == "PENDING_PAYMENT"
+    tracking = {r["tracking_number"] for r in body["results"] if r["result"] == "ok"}
+    assert len(tracking) == 3
+
+    # one producer hand-off for the wave, carrying each parcel's tracking number
+    assert len(sent) == 1
+    assert sorted(ev["shipment_id"] for ev in sent[0]) == [1, 2, 3]
+    assert {ev["tracking_number"] for ev in sent[0]} == tracking
+    # and one label wave, in request order, with everything a label needs
+    assert body["label_wave"] == {"wave_id": "w1", "status": "queued"}
+    assert [r["id"] for r in waves[0]] == [3, 1, 2] and waves[0][0]["city"] == "Dublin"
+
+    again = client.post("/shipping/v1/shipments/dispatch", json={"shipment_ids": [1]}).json()
+    assert again["results"] == [{"id": 1, "result": "conflict", "status": "DISPATCHED"}]
+
+    delivered = client.post("/shipping/v1/shipments/status", json={"shipment_ids": [1, 2], "status": "DELIVERED"}).json()
+    assert delivered["updated"] == 2 and sent[-1][0]["type"] == "shipping.delivered"
+    assert "label_wave" not in delivered and len(waves) == 1
+
+def test_bulk_dispatch_rolls_back_when_events_cannot_be_queued(db, monkeypatch):
+    def down(events):
+        raise RuntimeError("buffer full")
+    monkeypatch.setattr(routes, "emit_many", down)
+    monkeypatch.setattr(routes.labels, "enqueue", lambda rows: {"wave_id": "w1", "status": "queued"})
+    add_shipments(db, 2)
+    client = TestClient(app)
+
+    resp = client.post("/shipping/v1/shipments/dispatch", json={"shipment_ids": [1, 2]})
+    assert resp.status_code == 503
+    # nothing moved, so the same wave can simply be retried
+    body = client.get("/shipping/v1/shipments", params={"fields": "id,status"}).json()
+    assert {s["status"] for s in body["items"]} == {"READY_TO_SHIP"}
+
+def test_payment_batch_moves_pending_shipments_once(db, monkeypatch):
+    emitted = []
+    monkeypatch.setattr(consumer, "emit_many", emitted.extend)
+    add_shipments(db, 3, status=ShipmentStatus.PENDING_PAYMENT)  # orders 1000-1002
+    events = [
+        {"type": "payment.succeeded", "order_id": 1000},
+        {"type": "payment.succeeded", "order_id": 1001},
+        {"type": "payment.succeeded", "order_id": 1001},  # redelivery within the batch
+        {"type": "payment.failed", "order_id": 1002},
+        {"type": "payment.succeeded", "order_id": 4242},  # no shipment
+    ]
+    moved = consumer.process_batch(events, db)
+    assert sorted(r["order_id"] for r in moved) == [1000, 1001]
+    assert sorted(e["order_id"] for e in emitted) == [1000, 1001]
+    assert {e["type"] for e in emitted} == {"shipping.ready"}
+    statuses = dict(db.query(Shipment.order_id, Shipment.status).all())
+    assert statuses[1000] == statuses[1001] == ShipmentStatus.READY_TO_SHIP
+    assert statuses[1002] == ShipmentStatus.PENDING_PAYMENT
+
+    # the same batch redelivered after a crash changes and emits nothing
+    emitted.clear()
+    assert consumer.process_batch(events, db) == [] and emitted == []
+
+class Record:
+    def __init__(self, offset, value):
+        self.topic, self.partition, self.offset, self.key, self.value = "payment.events", 0, offset, None, value
+
+class FakeConsumer:
+    def __init__(self, batches):
+        self.batches, self.commits, self.seeks = list(batches), 0, []
+    def poll(self, timeout_ms=None):
+        if not self.batches:
+            consumer._stop.set()
+            return {}
+        return {"tp": self.batches.pop(0)}
+    def commit(self):
+        self.commits += 1
+    def seek(self, tp, offset):
+        self.seeks.append(offset)
+    def assignment(self):
+        return []
+
+def _consume(db, monkeypatch, batches):
+    dlq = []
+    monkeypatch.setattr(consumer, "SessionLocal", sessionmaker(bind=db.get_bind(), autoflush=False))
+    monkeypatch.setattr(consumer, "send", lambda topic, key, value: dlq.append((topic, value["offset"], value["error"])))
+    monkeypatch.setattr(consumer.settings, "CONSUMER_RETRY_BACKOFF_SECONDS", 0)
+    monkeypatch.setattr(consumer.settings, "CONSUMER_MAX_ATTEMPTS", 2)
+    kc = FakeConsumer(batches)
+    consumer._stop.clear()
+    try:
+        consumer.consume(kc)
+    finally:
+        consumer._stop.clear()
+    return kc, dlq
+
+def test_malformed_payment_event_is_dead_lettered_not_replayed(db, monkeypatch):
+    emitted = []
+    monkeypatch.setattr(consumer, "emit_many", emitted.extend)
+    add_shipments(db, 1, status=ShipmentStatus.PENDING_PAYMENT)  # order 1000
+    kc, dlq = _consume(db, monkeypatch, [[
+        Record(0, {"type": "payment.succeeded", "order_id": "not-a-number"}),
+        Record(1, {"type": "payment.succeeded", "order_id": 1000}),
+        Record(2, ["not", "an", "object"]),
+    ]])
+    assert [(t, o) for t, o, _ in dlq] == [(consumer.settings.CONSUMER_DLQ_TOPIC, 0), (consumer.settings.CONSUMER_DLQ_TOPIC, 2)]
+    assert [e["order_id"] for e in emitted] == [1000]
+    assert kc.commits == 1 and kc.seeks == []
+
+def test_failing_batch_is_retried_then_isolated(db, monkeypatch):
+    def down(events):
+        raise RuntimeError("producer down")
+    monkeypatch.setattr(consumer, "emit_many", down)
+    add_shipments(db, 1, status=ShipmentStatus.PENDING_PAYMENT)
+    kc, dlq = _consume(db, monkeypatch, [[Record(5, {"type": "payment.succeeded", "order_id": 1000})]] * 2)
+    assert kc.seeks == [5]  # rewound once, then CONSUMER_MAX_ATTEMPTS=2 gives up on it
+    assert [o for _, o, _ in dlq] == [5] and "producer down" in dlq[0][2]
+    assert kc.commits == 1
+    assert db.query(Shipment.status).scalar() == ShipmentStatus.PENDING_PAYMENT